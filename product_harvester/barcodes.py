@@ -0,0 +1,130 @@
+import time
+from abc import ABC, abstractmethod
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+from pydantic import BaseModel
+from pyzbar.pyzbar import decode
+
+from product_harvester.image import Image
+
+
+class DecodedBarcode(NamedTuple):
+    value: str
+    center_x: float
+    center_y: float
+
+
+class BarcodeDecoder(ABC):
+    @abstractmethod
+    def decode(self, grayscale: np.ndarray) -> list[DecodedBarcode]: ...
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({vars(self)})"
+
+
+class PyzbarBarcodeDecoder(BarcodeDecoder):
+    def decode(self, grayscale: np.ndarray) -> list[DecodedBarcode]:
+        height, width = grayscale.shape[:2]
+        return [
+            DecodedBarcode(
+                value=str(barcode.data.decode("utf-8")),
+                center_x=(barcode.rect.left + barcode.rect.width / 2) / width,
+                center_y=(barcode.rect.top + barcode.rect.height / 2) / height,
+            )
+            for barcode in decode(grayscale)
+        ]
+
+
+class OpenCVBarcodeDecoder(BarcodeDecoder):
+    def decode(self, grayscale: np.ndarray) -> list[DecodedBarcode]:
+        # The detector is cheap to create and cannot be pickled, so it is not kept for process pools to copy
+        found, values, _, corners = cv2.barcode.BarcodeDetector().detectAndDecodeWithType(grayscale)
+        if not found:
+            return []
+        height, width = grayscale.shape[:2]
+        return [
+            DecodedBarcode(value, float(points[:, 0].mean()) / width, float(points[:, 1].mean()) / height)
+            for value, points in zip(values, corners)
+            if value
+        ]
+
+
+class MultiScaleBarcodeDecoder(BarcodeDecoder):
+    def __init__(self, decoder: BarcodeDecoder, max_long_edge: int = 1024, rotations: tuple[float, ...] = (45, -45)):
+        self._decoder = decoder
+        self._max_long_edge = max_long_edge
+        self._rotations = rotations
+
+    def decode(self, grayscale: np.ndarray) -> list[DecodedBarcode]:
+        # Attempts go from the cheapest to the most expensive one and stop at the first which finds a barcode
+        height, width = grayscale.shape[:2]
+        if max(height, width) > self._max_long_edge:
+            if barcodes := self._decoder.decode(self._downscale(grayscale)):
+                return barcodes
+        if barcodes := self._decoder.decode(grayscale):
+            return barcodes
+        for angle in self._rotations:
+            if barcodes := self._decode_rotated(grayscale, angle):
+                return barcodes
+        return []
+
+    def _downscale(self, grayscale: np.ndarray) -> np.ndarray:
+        height, width = grayscale.shape[:2]
+        scale = self._max_long_edge / max(height, width)
+        size = (max(round(width * scale), 1), max(round(height * scale), 1))
+        return cv2.resize(grayscale, size, interpolation=cv2.INTER_AREA)
+
+    def _decode_rotated(self, grayscale: np.ndarray, angle: float) -> list[DecodedBarcode]:
+        height, width = grayscale.shape[:2]
+        rotation = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        cos, sin = abs(rotation[0, 0]), abs(rotation[0, 1])
+        rotated_width, rotated_height = int(height * sin + width * cos), int(height * cos + width * sin)
+        rotation[0, 2] += rotated_width / 2 - width / 2
+        rotation[1, 2] += rotated_height / 2 - height / 2
+        rotated = cv2.warpAffine(grayscale, rotation, (rotated_width, rotated_height), borderValue=255)
+        inverse = cv2.invertAffineTransform(rotation)
+        barcodes = []
+        for barcode in self._decoder.decode(rotated):
+            x, y = inverse @ np.array([barcode.center_x * rotated_width, barcode.center_y * rotated_height, 1.0])
+            barcodes.append(DecodedBarcode(barcode.value, float(x) / width, float(y) / height))
+        return barcodes
+
+
+class BarcodeBenchmark(BaseModel):
+    images: int = 0
+    decoded_images: int = 0
+    seconds: float = 0.0
+
+    @property
+    def decode_rate(self) -> float:
+        return self.decoded_images / self.images if self.images else 0.0
+
+    @property
+    def ms_per_image(self) -> float:
+        return self.seconds * 1000 / self.images if self.images else 0.0
+
+
+def benchmark_barcode_decoders(decoders: dict[str, BarcodeDecoder], images: list[Image]) -> dict[str, BarcodeBenchmark]:
+    grayscales = [image.load_array(grayscale=True) for image in images]
+    report: dict[str, BarcodeBenchmark] = {}
+    for name, decoder in decoders.items():
+        benchmark = BarcodeBenchmark()
+        for grayscale in grayscales:
+            start = time.perf_counter()
+            barcodes = decoder.decode(grayscale)
+            benchmark.seconds += time.perf_counter() - start
+            benchmark.images += 1
+            benchmark.decoded_images += bool(barcodes)
+        report[name] = benchmark
+    return report
+
+
+def format_barcode_benchmark(report: dict[str, BarcodeBenchmark]) -> str:
+    name_width = max([len("decoder")] + [len(name) for name in report])
+    lines = [f"{'decoder':<{name_width}}  images  decode_rate  ms/image"]
+    for name, benchmark in report.items():
+        decode_rate, ms_per_image = benchmark.decode_rate, benchmark.ms_per_image
+        lines.append(f"{name:<{name_width}}  {benchmark.images:>6}  {decode_rate:>11.1%}  {ms_per_image:>8.1f}")
+    return "\n".join(lines)
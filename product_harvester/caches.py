@@ -0,0 +1,188 @@
+import hashlib
+import json
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import timedelta
+from threading import Lock
+
+from product_harvester.barcodes import DecodedBarcode
+from product_harvester.image import Image
+from product_harvester.product import Product
+
+
+class ExtractionCache(ABC):
+    @abstractmethod
+    def get(self, image: Image, context: str, product_type: type[Product] = Product) -> Product | None: ...
+
+    @abstractmethod
+    def put(self, image: Image, context: str, product: Product): ...
+
+
+class NoExtractionCache(ExtractionCache):
+    def get(self, image: Image, context: str, product_type: type[Product] = Product) -> Product | None:
+        return None
+
+    def put(self, image: Image, context: str, product: Product):
+        pass
+
+
+class SQLiteExtractionCache(ExtractionCache):
+    def __init__(
+        self,
+        db_path: str,
+        max_entries: int = 100_000,
+        max_age: timedelta = timedelta(days=30),
+        eviction_interval: int = 100,
+    ):
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = Lock()
+        self._max_entries = max_entries
+        self._max_age = max_age
+        self._eviction_interval = eviction_interval
+        self._puts_since_eviction = 0
+        self._create_table()
+        self.evict()
+
+    def _create_table(self):
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+CREATE TABLE IF NOT EXISTS extractions (
+    key TEXT PRIMARY KEY,
+    product TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+)
+"""
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS extractions_accessed_at ON extractions (accessed_at)")
+
+    def get(self, image: Image, context: str, product_type: type[Product] = Product) -> Product | None:
+        key = self._make_key(image, context)
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT product FROM extractions WHERE key = ? AND created_at >= ?", (key, self._expiration(now))
+            ).fetchone()
+            if not row:
+                return None
+            self._connection.execute("UPDATE extractions SET accessed_at = ? WHERE key = ?", (now, key))
+        # Fields of the product type (e.g. confidence) are kept, an entry without them fails validation
+        return product_type.model_validate_json(row[0])
+
+    def put(self, image: Image, context: str, product: Product):
+        key = self._make_key(image, context)
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO extractions (key, product, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, product.model_dump_json(), now, now),
+            )
+            self._puts_since_eviction += 1
+            if self._puts_since_eviction >= self._eviction_interval:
+                self._evict(now)
+
+    def evict(self):
+        with self._lock, self._connection:
+            self._evict(time.time())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+
+    def _evict(self, now: float):
+        self._connection.execute("DELETE FROM extractions WHERE created_at < ?", (self._expiration(now),))
+        self._connection.execute(
+            """
+DELETE FROM extractions WHERE key IN (
+    SELECT key FROM extractions ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+)
+""",
+            (self._max_entries,),
+        )
+        self._puts_since_eviction = 0
+
+    def _expiration(self, now: float) -> float:
+        return now - self._max_age.total_seconds()
+
+    @staticmethod
+    def _make_key(image: Image, context: str) -> str:
+        return hashlib.sha256(f"{image.content_hash()}:{context}".encode("utf-8")).hexdigest()
+
+
+class BarcodeCache(ABC):
+    @abstractmethod
+    def get(self, image: Image, context: str) -> list[DecodedBarcode] | None: ...
+
+    @abstractmethod
+    def put(self, image: Image, context: str, barcodes: list[DecodedBarcode]): ...
+
+
+class NoBarcodeCache(BarcodeCache):
+    def get(self, image: Image, context: str) -> list[DecodedBarcode] | None:
+        return None
+
+    def put(self, image: Image, context: str, barcodes: list[DecodedBarcode]):
+        pass
+
+
+class LRUBarcodeCache(BarcodeCache):
+    def __init__(self, max_entries: int = 10_000, spill_path: str | None = None):
+        self._max_entries = max_entries
+        self._entries: OrderedDict[str, list[DecodedBarcode]] = OrderedDict()
+        self._lock = Lock()
+        self._spill = sqlite3.connect(spill_path, check_same_thread=False) if spill_path is not None else None
+        self._create_spill_table()
+
+    def _create_spill_table(self):
+        if self._spill is None:
+            return
+        with self._lock, self._spill:
+            self._spill.execute("CREATE TABLE IF NOT EXISTS barcodes (key TEXT PRIMARY KEY, barcodes TEXT NOT NULL)")
+
+    def get(self, image: Image, context: str) -> list[DecodedBarcode] | None:
+        key = self._make_key(image, context)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return list(self._entries[key])
+            barcodes = self._get_spilled(key)
+            if barcodes is not None:
+                self._add(key, barcodes)
+            return barcodes
+
+    def put(self, image: Image, context: str, barcodes: list[DecodedBarcode]):
+        key = self._make_key(image, context)
+        with self._lock:
+            self._add(key, list(barcodes))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _add(self, key: str, barcodes: list[DecodedBarcode]):
+        self._entries[key] = barcodes
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            evicted_key, evicted_barcodes = self._entries.popitem(last=False)
+            self._put_spilled(evicted_key, evicted_barcodes)
+
+    def _get_spilled(self, key: str) -> list[DecodedBarcode] | None:
+        if self._spill is None:
+            return None
+        row = self._spill.execute("SELECT barcodes FROM barcodes WHERE key = ?", (key,)).fetchone()
+        return [DecodedBarcode(*barcode) for barcode in json.loads(row[0])] if row else None
+
+    def _put_spilled(self, key: str, barcodes: list[DecodedBarcode]):
+        if self._spill is None:
+            return
+        with self._spill:
+            self._spill.execute(
+                "INSERT OR REPLACE INTO barcodes (key, barcodes) VALUES (?, ?)", (key, json.dumps(barcodes))
+            )
+
+    @staticmethod
+    def _make_key(image: Image, context: str) -> str:
+        return hashlib.sha256(f"{image.content_hash()}:{context}".encode("utf-8")).hexdigest()
@@ -0,0 +1,119 @@
+import time
+from threading import Lock
+from typing import Any, Self
+
+from pydantic import BaseModel
+
+from product_harvester.catalog import NoProductCatalog
+from product_harvester.image import Image
+from product_harvester.model_factory import ModelFactory
+from product_harvester.processors import (
+    ImageProcessor,
+    PerImageProcessingResult,
+    ProcessingResult,
+    ScoredPriceTagImageProcessor,
+)
+from product_harvester.product import Product
+
+
+class CascadeTierStats(BaseModel):
+    calls: int = 0
+    images: int = 0
+    accepted_images: int = 0
+    seconds: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.accepted_images / self.images if self.images else 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        return self.seconds / self.calls if self.calls else 0.0
+
+
+class CascadingImageProcessor(ImageProcessor):
+    def __init__(self, tiers: list[ImageProcessor], min_confidence: float = 0.0):
+        if not tiers:
+            raise ValueError("Cascade needs at least one tier")
+        self._tiers = tiers
+        self._min_confidence = min_confidence
+        self._stats = [CascadeTierStats() for _ in tiers]
+        self._stats_lock = Lock()
+
+    @classmethod
+    def from_model_factories(
+        cls, model_factories: list[ModelFactory], min_confidence: float = 0.0, **processor_kwargs: Any
+    ) -> Self:
+        # Packed requests and catalog lookups return products without a confidence, which would always be escalated
+        if processor_kwargs.get("images_per_request", 1) > 1:
+            raise ValueError("Cascade tiers cannot pack several images into one request")
+        if not isinstance(processor_kwargs.get("catalog", NoProductCatalog()), NoProductCatalog):
+            raise ValueError("Cascade tiers cannot read prices of catalog products")
+        tiers = [ScoredPriceTagImageProcessor(model_factory, **processor_kwargs) for model_factory in model_factories]
+        return cls(tiers, min_confidence)
+
+    @property
+    def stats(self) -> list[CascadeTierStats]:
+        with self._stats_lock:
+            return [tier_stats.model_copy() for tier_stats in self._stats]
+
+    def process(self, images: list[Image]) -> ProcessingResult:
+        results: list[PerImageProcessingResult] = []
+        pending = images
+        for tier_index, tier in enumerate(self._tiers):
+            if not pending:
+                break
+            start = time.perf_counter()
+            result = tier.process(pending)
+            pending = self._accept_results(tier_index, pending, result, time.perf_counter() - start, results)
+        return ProcessingResult(results)
+
+    async def aprocess(self, images: list[Image]) -> ProcessingResult:
+        results: list[PerImageProcessingResult] = []
+        pending = images
+        for tier_index, tier in enumerate(self._tiers):
+            if not pending:
+                break
+            start = time.perf_counter()
+            result = await tier.aprocess(pending)
+            pending = self._accept_results(tier_index, pending, result, time.perf_counter() - start, results)
+        return ProcessingResult(results)
+
+    def _accept_results(
+        self,
+        tier_index: int,
+        images: list[Image],
+        result: ProcessingResult,
+        seconds: float,
+        results: list[PerImageProcessingResult],
+    ) -> list[Image]:
+        image_results: dict[str, list[PerImageProcessingResult]] = {image.id: [] for image in images}
+        for image_result in result.results:
+            image_results.setdefault(image_result.input_image.id, []).append(image_result)
+        is_last_tier = tier_index == len(self._tiers) - 1
+        accepted_images = 0
+        escalated = []
+        for image in images:
+            is_accepted = self._is_accepted(image_results[image.id])
+            accepted_images += is_accepted
+            if is_accepted or is_last_tier:
+                results.extend(image_results[image.id])
+            else:
+                escalated.append(image)
+        with self._stats_lock:
+            tier_stats = self._stats[tier_index]
+            tier_stats.calls += 1
+            tier_stats.images += len(images)
+            tier_stats.accepted_images += accepted_images
+            tier_stats.seconds += seconds
+        return escalated
+
+    def _is_accepted(self, image_results: list[PerImageProcessingResult]) -> bool:
+        return bool(image_results) and all(
+            not image_result.is_error and self._is_confident(image_result.output) for image_result in image_results
+        )
+
+    def _is_confident(self, product: Product) -> bool:
+        # Products that do not report confidence pass only a cascade that does not ask for any
+        confidence = getattr(product, "confidence", None)
+        return self._min_confidence <= 0 or (confidence is not None and confidence >= self._min_confidence)
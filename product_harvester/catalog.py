@@ -0,0 +1,61 @@
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from threading import Lock
+
+from product_harvester.product import Product
+
+
+class ProductCatalog(ABC):
+    @abstractmethod
+    def get(self, barcode: str) -> Product | None: ...
+
+    @abstractmethod
+    def put(self, product: Product): ...
+
+
+class NoProductCatalog(ProductCatalog):
+    def get(self, barcode: str) -> Product | None:
+        return None
+
+    def put(self, product: Product):
+        pass
+
+
+class SQLiteProductCatalog(ProductCatalog):
+    def __init__(self, db_path: str):
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = Lock()
+        self._create_table()
+
+    def _create_table(self):
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+CREATE TABLE IF NOT EXISTS products (
+    barcode TEXT PRIMARY KEY,
+    product TEXT NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+            )
+
+    def get(self, barcode: str) -> Product | None:
+        with self._lock:
+            row = self._connection.execute("SELECT product FROM products WHERE barcode = ?", (barcode,)).fetchone()
+        return Product.model_validate_json(row[0]) if row else None
+
+    def put(self, product: Product):
+        if not product.barcode:
+            return
+        # Only the fields of the product itself are kept, not those of its subclasses (e.g. the region on a shelf)
+        product_json = product.model_dump_json(include=set(Product.model_fields))
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO products (barcode, product, updated_at) VALUES (?, ?, ?)",
+                (product.barcode, product_json, time.time()),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM products").fetchone()[0]
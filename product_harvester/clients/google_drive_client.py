@@ -1,4 +1,3 @@
-import base64
 import io
 from typing import Generator, Any
 
@@ -71,7 +70,7 @@ class GoogleDriveClient:
         ]
         return files, result.get("nextPageToken", None)
 
-    def download_file_content(self, file: GoogleDriveFileInfo) -> str:
+    def download_file_content(self, file: GoogleDriveFileInfo) -> bytes:
         self.ensure_credentials()
         request = self._files_service.get_media(fileId=file.id)
         fh = io.BytesIO()
@@ -79,5 +78,4 @@ class GoogleDriveClient:
         done = False
         while not done:
             status, done = downloader.next_chunk()
-        content = base64.b64encode(fh.getvalue()).decode("utf-8")
-        return f"data:{file.mime_type};base64,{content}"
+        return fh.getvalue()
@@ -100,7 +100,7 @@ class TestGoogleDriveClient(TestCase):
         with patch.object(self._client._credentials, "refresh") as mock_refresh:
             content = self._client.download_file_content(mock_file)
             mock_refresh.assert_called_once_with(mock_request())
-        self.assertEqual(content, "data:image/png;base64,dGVzdF9kYXRh")
+        self.assertEqual(content, b"test_data")
         self._mock_files_service.assert_has_calls([call.get_media(fileId="1")])
         mock_media_download.assert_called_once_with(mock_bytes_io.return_value, self._mock_files_service.get_media())
         mock_bytes_io.assert_called_once()
@@ -0,0 +1,206 @@
+import asyncio
+from threading import Lock
+from typing import Generic, NamedTuple, TypeVar
+
+import cv2
+import numpy as np
+
+from product_harvester.image import Image
+from product_harvester.processors import ImageProcessor, PerImageProcessingResult, ProcessingError, ProcessingResult
+
+_T = TypeVar("_T")
+
+
+def difference_hash(image: np.ndarray, hash_size: int = 16, min_difference: int = 0) -> np.ndarray:
+    resized = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA).astype(np.int16)
+    return np.packbits(resized[:, 1:] - resized[:, :-1] > min_difference)
+
+
+def _resize_long_edge(image: np.ndarray, long_edge: int) -> np.ndarray:
+    height, width = image.shape[:2]
+    scale = long_edge / max(height, width)
+    size = (max(round(width * scale), 1), max(round(height * scale), 1))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def content_difference(first: np.ndarray, second: np.ndarray, comparison_long_edge: int = 64) -> float:
+    # Shots of one tag are aligned first, then the largest local difference tells a changed price or name apart
+    if first.shape != second.shape:
+        return float("inf")
+    first = first.astype(np.float32) - first.mean()
+    second = second.astype(np.float32) - second.mean()
+    (shift_x, shift_y), _ = cv2.phaseCorrelate(first, second)
+    height, width = first.shape
+    shift = np.float32([[1, 0, shift_x], [0, 1, shift_y]])
+    aligned = cv2.warpAffine(second, shift, (width, height), flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP)
+    left, right = max(int(np.ceil(-shift_x)), 0), width - max(int(np.ceil(shift_x)), 0)
+    top, bottom = max(int(np.ceil(-shift_y)), 0), height - max(int(np.ceil(shift_y)), 0)
+    if right - left < width / 2 or bottom - top < height / 2:
+        return float("inf")
+    first = _resize_long_edge(first[top:bottom, left:right], comparison_long_edge)
+    aligned = _resize_long_edge(aligned[top:bottom, left:right], comparison_long_edge)
+    return float(cv2.blur(np.abs(first - aligned), (2, 2)).max())
+
+
+class PerceptualHashIndex(Generic[_T]):
+    def __init__(self, max_distance: int, max_size: int = 10_000):
+        self._max_distance = max_distance
+        self._max_size = max_size
+        self._hashes: np.ndarray | None = None
+        self._values: list[_T] = []
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def find(self, image_hash: np.ndarray) -> _T | None:
+        values = self.find_all(image_hash)
+        return values[0] if values else None
+
+    def find_all(self, image_hash: np.ndarray) -> list[_T]:
+        if self._hashes is None:
+            return []
+        distances = np.bitwise_count(self._hashes ^ image_hash).sum(axis=1)
+        nearest = np.argsort(distances, kind="stable")
+        return [self._values[index] for index in nearest if distances[index] <= self._max_distance]
+
+    def add(self, image_hash: np.ndarray, value: _T):
+        hashes = image_hash[np.newaxis, :] if self._hashes is None else np.vstack([self._hashes, image_hash])
+        overflow = max(len(hashes) - self._max_size, 0)
+        self._hashes = hashes[overflow:]
+        self._values = (self._values + [value])[overflow:]
+
+
+class _ImageSignature(NamedTuple):
+    image_hash: np.ndarray
+    thumbnail: np.ndarray
+
+
+class _Cluster:
+    def __init__(self, representative: Image, signature: _ImageSignature | None):
+        self.representative = representative
+        self.signature = signature
+        self.members: list[Image] = []
+
+
+class DeduplicatingImageProcessor(ImageProcessor):
+    _hash_min_difference = 4
+    _thumbnail_long_edge = 256
+
+    def __init__(
+        self,
+        processor: ImageProcessor,
+        max_distance: int = 12,
+        hash_size: int = 16,
+        max_difference: float = 32,
+        cross_batch: bool = False,
+        max_known_images: int = 1_000,
+    ):
+        self._processor = processor
+        self._max_distance = max_distance
+        self._hash_size = hash_size
+        self._max_difference = max_difference
+        # Results are reused in later batches only on request, a tag photographed again later may show a new price
+        self._index: PerceptualHashIndex[tuple[np.ndarray, list[PerImageProcessingResult]]] | None = (
+            PerceptualHashIndex(max_distance, max_known_images) if cross_batch else None
+        )
+        self._index_lock = Lock()
+
+    def process(self, images: list[Image]) -> ProcessingResult:
+        signatures = [self._sign_image(image) for image in images]
+        known_results, clusters = self._cluster(images, signatures)
+        result = self._processor.process([cluster.representative for cluster in clusters]) if clusters else None
+        return self._make_result(known_results, clusters, result)
+
+    async def aprocess(self, images: list[Image]) -> ProcessingResult:
+        signatures = await asyncio.gather(*(asyncio.to_thread(self._sign_image, image) for image in images))
+        known_results, clusters = self._cluster(images, signatures)
+        representatives = [cluster.representative for cluster in clusters]
+        result = await self._processor.aprocess(representatives) if clusters else None
+        return self._make_result(known_results, clusters, result)
+
+    def _sign_image(self, image: Image) -> _ImageSignature | None:
+        try:
+            grayscale = image.load_array(grayscale=True)
+        except Exception:
+            # Images which cannot be hashed are never deduplicated, the wrapped processor reports their errors
+            return None
+        # Small differences are ignored, so that sensor noise on the plain background of a tag does not flip bits
+        image_hash = difference_hash(grayscale, self._hash_size, self._hash_min_difference)
+        return _ImageSignature(image_hash, _resize_long_edge(grayscale, self._thumbnail_long_edge))
+
+    def _cluster(
+        self, images: list[Image], signatures: list[_ImageSignature | None]
+    ) -> tuple[list[PerImageProcessingResult], list[_Cluster]]:
+        known_results: list[PerImageProcessingResult] = []
+        clusters: list[_Cluster] = []
+        batch_index: PerceptualHashIndex[_Cluster] = PerceptualHashIndex(self._max_distance)
+        for image, signature in zip(images, signatures):
+            if signature is None:
+                clusters.append(_Cluster(image, signature))
+            elif (known_image_results := self._find_known_results(signature)) is not None:
+                known_results.extend(self._inherit_result(known_result, image) for known_result in known_image_results)
+            elif (cluster := self._find_cluster(batch_index, signature)) is not None:
+                cluster.members.append(image)
+            else:
+                cluster = _Cluster(image, signature)
+                batch_index.add(signature.image_hash, cluster)
+                clusters.append(cluster)
+        return known_results, clusters
+
+    def _find_cluster(self, batch_index: PerceptualHashIndex[_Cluster], signature: _ImageSignature) -> _Cluster | None:
+        # A close hash only nominates candidates, tags sharing one template differ in a few bits even with other prices
+        for cluster in batch_index.find_all(signature.image_hash):
+            if self._is_same_content(cluster.signature.thumbnail, signature.thumbnail):
+                return cluster
+        return None
+
+    def _find_known_results(self, signature: _ImageSignature) -> list[PerImageProcessingResult] | None:
+        if self._index is None:
+            return None
+        with self._index_lock:
+            candidates = self._index.find_all(signature.image_hash)
+        for thumbnail, known_results in candidates:
+            if self._is_same_content(thumbnail, signature.thumbnail):
+                return known_results
+        return None
+
+    def _is_same_content(self, thumbnail: np.ndarray, other_thumbnail: np.ndarray) -> bool:
+        return content_difference(thumbnail, other_thumbnail) <= self._max_difference
+
+    def _make_result(
+        self, known_results: list[PerImageProcessingResult], clusters: list[_Cluster], result: ProcessingResult | None
+    ) -> ProcessingResult:
+        results = list(known_results)
+        if result is None:
+            return ProcessingResult(results)
+        representative_results: dict[str, list[PerImageProcessingResult]] = {}
+        for representative_result in result.product_results + result.error_results:
+            representative_results.setdefault(representative_result.input_image.id, []).append(representative_result)
+        for cluster in clusters:
+            image_results = representative_results.get(cluster.representative.id, [])
+            if not image_results:
+                continue
+            if not any(image_result.is_error for image_result in image_results):
+                self._remember_results(cluster, image_results)
+            results.extend(image_results)
+            for member in cluster.members:
+                results.extend(self._inherit_result(image_result, member) for image_result in image_results)
+        return ProcessingResult(results)
+
+    def _remember_results(self, cluster: _Cluster, image_results: list[PerImageProcessingResult]):
+        if self._index is None or cluster.signature is None:
+            return
+        # The index outlives the batch, so it must not keep the content of in-memory images alive
+        known_image = Image(id=cluster.representative.id, data=cluster.representative.data)
+        known_results = [self._inherit_result(image_result, known_image) for image_result in image_results]
+        with self._index_lock:
+            self._index.add(cluster.signature.image_hash, (cluster.signature.thumbnail, known_results))
+
+    @staticmethod
+    def _inherit_result(result: PerImageProcessingResult, image: Image) -> PerImageProcessingResult:
+        # Outputs are copied, because the harvester adjusts each product with the meta of its own image
+        if result.is_error:
+            output = ProcessingError(result.output.msg, result.output.detailed_msg)
+        else:
+            output = result.output.model_copy()
+        return PerImageProcessingResult(input_image=image, output=output, is_barcode_checked=result.is_barcode_checked)
@@ -1,9 +1,13 @@
+import asyncio
 import logging
 from abc import ABC, abstractmethod
-from typing import Any, Generator
+from queue import Queue
+from threading import Event, Lock, Thread
+from typing import Any, AsyncGenerator, AsyncIterator, Generator
 
 from product_harvester.image import Image
 from product_harvester.importers import ProductsImporter, ImportedProduct
+from product_harvester.journal import HarvestJournal, NoHarvestJournal
 from product_harvester.processors import ProcessingResult, ImageProcessor, PerImageProcessingResult
 from product_harvester.retrievers import ImagesRetriever
 
@@ -21,6 +25,9 @@ class ErrorTracker(ABC):
     @abstractmethod
     def track_errors(self, errors: list[HarvestError]): ...
 
+    async def atrack_errors(self, errors: list[HarvestError]):
+        await asyncio.to_thread(self.track_errors, errors)
+
 
 class StdOutErrorTracker(ErrorTracker):
     def track_errors(self, errors: list[HarvestError]):
@@ -49,25 +56,53 @@ class ProductsHarvester:
         importer: ProductsImporter,
         error_tracker: ErrorTracker = ErrorLogger(),
         batch_size: int = 8,
+        journal: HarvestJournal = NoHarvestJournal(),
     ):
         self._retriever = retriever
         self._processor = processor
         self._importer = importer
         self._error_tracker = error_tracker
         self._batch_size = batch_size
+        self._journal = journal
 
     def harvest(self):
+        self._import_products(self._journal.pending_imports())
         for images_batch in self._generate_image_batches():
-            result = self._process_images(images_batch)
-            product_results = self._extract_products_and_track_errors(result)
-            self._override_results_with_input_meta(product_results)
-            self._import_products(product_results)
+            self._import_products(self._process_batch(images_batch))
+
+    async def aharvest(self, max_concurrent_batches: int = 4):
+        await self._aimport_products(await asyncio.to_thread(self._journal.pending_imports))
+        semaphore = asyncio.Semaphore(max_concurrent_batches)
+        tasks: list[asyncio.Task] = []
+        try:
+            async for images_batch in self._agenerate_image_batches():
+                await semaphore.acquire()
+                self._raise_first_failure(tasks)
+                tasks.append(asyncio.create_task(self._aharvest_batch(images_batch, semaphore)))
+            await asyncio.gather(*tasks)
+        finally:
+            # Like harvest, the first failing batch stops the whole run instead of letting the other batches finish
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    @staticmethod
+    def _raise_first_failure(tasks: list[asyncio.Task]):
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+    async def _aharvest_batch(self, images: list[Image], semaphore: asyncio.Semaphore):
+        try:
+            await self._aimport_products(await self._aprocess_batch(images))
+        finally:
+            semaphore.release()
 
     def _generate_image_batches(self) -> Generator[list[Image], None, None]:
         try:
             images_generator = self._retriever.retrieve_images()
         except Exception as e:
-            self._track_errors([HarvestError("Failed to retrieve images", {"detailed_info": str(e)})])
+            self._track_errors([self._make_retrieval_error("Failed to retrieve images", e)])
             return
         while True:
             batch = self._make_images_batch(images_generator)
@@ -75,76 +110,365 @@ class ProductsHarvester:
             if len(batch) < self._batch_size:
                 return
 
+    async def _agenerate_image_batches(self) -> AsyncGenerator[list[Image], None]:
+        try:
+            images_iterator = self._retriever.aretrieve_images()
+        except Exception as e:
+            await self._atrack_errors([self._make_retrieval_error("Failed to retrieve images", e)])
+            return
+        while True:
+            batch = await self._amake_images_batch(images_iterator)
+            yield batch
+            if len(batch) < self._batch_size:
+                return
+
     def _make_images_batch(self, generator: Generator[Image, None, None]) -> list[Image]:
         batch: list[Image] = []
-        for i in range(self._batch_size):
+        while len(batch) < self._batch_size:
             try:
-                batch.append(next(generator))
+                image = next(generator)
             except StopIteration:
                 break
             except Exception as e:
-                self._track_errors([HarvestError("Failed to retrieve image", {"detailed_info": str(e)})])
+                self._track_errors([self._make_retrieval_error("Failed to retrieve image", e)])
+                continue
+            if self._accept_retrieved_image(image):
+                batch.append(image)
         return batch
 
+    async def _amake_images_batch(self, iterator: AsyncIterator[Image]) -> list[Image]:
+        batch: list[Image] = []
+        while len(batch) < self._batch_size:
+            try:
+                image = await anext(iterator)
+            except StopAsyncIteration:
+                break
+            except Exception as e:
+                await self._atrack_errors([self._make_retrieval_error("Failed to retrieve image", e)])
+                continue
+            if await self._aaccept_retrieved_image(image):
+                batch.append(image)
+        return batch
+
+    def _accept_retrieved_image(self, image: Image) -> bool:
+        try:
+            return self._journal_retrieved_image(image)
+        except Exception as e:
+            self._track_errors([self._make_retrieval_error("Failed to retrieve image", e)])
+            return False
+
+    async def _aaccept_retrieved_image(self, image: Image) -> bool:
+        try:
+            return await asyncio.to_thread(self._journal_retrieved_image, image)
+        except Exception as e:
+            await self._atrack_errors([self._make_retrieval_error("Failed to retrieve image", e)])
+            return False
+
+    def _journal_retrieved_image(self, image: Image) -> bool:
+        # The journal identifies images by their content, so an image that cannot be loaded fails already here
+        if self._journal.is_done(image):
+            return False
+        self._journal.mark_retrieved(image)
+        return True
+
+    @staticmethod
+    def _make_retrieval_error(msg: str, e: Exception) -> HarvestError:
+        return HarvestError(msg, {"detailed_info": str(e)})
+
+    def _process_batch(self, images: list[Image]) -> list[ImportedProduct]:
+        result = self._process_images(images)
+        self._unload_images(images)
+        product_results = self._extract_products_and_track_errors(result)
+        return self._make_imported_products(product_results)
+
+    async def _aprocess_batch(self, images: list[Image]) -> list[ImportedProduct]:
+        result = await self._aprocess_images(images)
+        self._unload_images(images)
+        product_results = await self._aextract_products_and_track_errors(result)
+        return await asyncio.to_thread(self._make_imported_products, product_results)
+
+    @staticmethod
+    def _unload_images(images: list[Image]):
+        # Decoded pixels are only needed by the processor, importing keeps the images around much longer
+        for image in images:
+            image.unload()
+
     def _process_images(self, images: list[Image]) -> ProcessingResult | None:
         if not images:
             return None
         try:
             result = self._processor.process(images)
         except Exception as e:
-            image_ids = [image.id for image in images]
-            self._track_errors(
-                [HarvestError("Failed to extract data from the images", {"input": image_ids, "detailed_info": str(e)})]
-            )
+            self._mark_failed(images)
+            self._track_errors([self._make_processing_failure_error(images, e)])
+            return None
+        return result
+
+    async def _aprocess_images(self, images: list[Image]) -> ProcessingResult | None:
+        if not images:
+            return None
+        try:
+            result = await self._processor.aprocess(images)
+        except Exception as e:
+            await asyncio.to_thread(self._mark_failed, images)
+            await self._atrack_errors([self._make_processing_failure_error(images, e)])
             return None
         return result
 
+    @staticmethod
+    def _make_processing_failure_error(images: list[Image], e: Exception) -> HarvestError:
+        image_ids = [image.id for image in images]
+        return HarvestError("Failed to extract data from the images", {"input": image_ids, "detailed_info": str(e)})
+
     def _extract_products_and_track_errors(self, result: ProcessingResult | None) -> list[PerImageProcessingResult]:
         if not result:
             return []
-        self._track_processing_errors(result.error_results)
+        self._mark_failed([error_result.input_image for error_result in result.error_results])
+        self._track_errors(self._make_processing_errors(result.error_results))
         return result.product_results
 
-    @staticmethod
-    def _override_results_with_input_meta(product_results: list[PerImageProcessingResult]):
-        for result in product_results:
-            result.input_image.meta.adjust_product(result.output)
-
-    def _import_products(self, product_results: list[PerImageProcessingResult]):
-        for result in product_results:
-            self._import_product(result)
-
-    def _import_product(self, product_result: PerImageProcessingResult):
-        imported_product = ImportedProduct.from_product(
-            product=product_result.output,
-            source_image=product_result.input_image,
-            is_barcode_checked=product_result.is_barcode_checked,
-        )
+    async def _aextract_products_and_track_errors(
+        self, result: ProcessingResult | None
+    ) -> list[PerImageProcessingResult]:
+        if not result:
+            return []
+        await asyncio.to_thread(self._mark_failed, [error_result.input_image for error_result in result.error_results])
+        await self._atrack_errors(self._make_processing_errors(result.error_results))
+        return result.product_results
+
+    def _mark_failed(self, images: list[Image]):
+        for image in images:
+            self._journal.mark_failed(image)
+
+    def _make_imported_products(self, product_results: list[PerImageProcessingResult]) -> list[ImportedProduct]:
+        imported_products = []
+        for product_result in product_results:
+            product_result.input_image.meta.adjust_product(product_result.output)
+            imported_product = ImportedProduct.from_product(
+                product=product_result.output,
+                source_image=product_result.input_image,
+                is_barcode_checked=product_result.is_barcode_checked,
+            )
+            self._journal.mark_extracted(imported_product)
+            imported_products.append(imported_product)
+        return imported_products
+
+    def _import_products(self, products: list[ImportedProduct]):
+        for product in products:
+            self._import_product(product)
+
+    async def _aimport_products(self, products: list[ImportedProduct]):
+        # Products left over from an interrupted run can be many, so only a batch of them is imported at once
+        semaphore = asyncio.Semaphore(self._batch_size)
+        await asyncio.gather(*(self._aimport_product_bounded(product, semaphore) for product in products))
+
+    async def _aimport_product_bounded(self, product: ImportedProduct, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            await self._aimport_product(product)
+
+    def _import_product(self, product: ImportedProduct):
         try:
-            self._importer.import_product(imported_product)
+            self._importer.import_product(product)
         except Exception as e:
-            self._track_errors(
-                [
-                    HarvestError(
-                        "Failed to to import extracted product data",
-                        {
-                            "input": product_result.input_image.id,
-                            "imported_product": imported_product.model_dump(),
-                            "detailed_info": str(e),
-                        },
-                    )
-                ]
-            )
+            self._track_errors([self._make_import_error(product, e)])
+            return
+        self._journal.mark_imported(product)
+
+    async def _aimport_product(self, product: ImportedProduct):
+        try:
+            await self._importer.aimport_product(product)
+        except Exception as e:
+            await self._atrack_errors([self._make_import_error(product, e)])
+            return
+        await asyncio.to_thread(self._journal.mark_imported, product)
+
+    @staticmethod
+    def _make_import_error(product: ImportedProduct, e: Exception) -> HarvestError:
+        return HarvestError(
+            "Failed to to import extracted product data",
+            {
+                "input": product.source_image.id,
+                "imported_product": product.model_dump(),
+                "detailed_info": str(e),
+            },
+        )
 
-    def _track_processing_errors(self, error_results: list[PerImageProcessingResult]):
-        errors = [
+    @staticmethod
+    def _make_processing_errors(error_results: list[PerImageProcessingResult]) -> list[HarvestError]:
+        return [
             HarvestError(
                 result.output.msg, {"input": result.input_image.id, "detailed_info": result.output.detailed_msg}
             )
             for result in error_results
         ]
-        self._track_errors(errors)
 
     def _track_errors(self, errors: list[HarvestError]):
         if errors:
             self._error_tracker.track_errors(errors)
+
+    async def _atrack_errors(self, errors: list[HarvestError]):
+        if errors:
+            await self._error_tracker.atrack_errors(errors)
+
+
+class PipelinedProductsHarvester(ProductsHarvester):
+    _end_of_stage = object()
+
+    def __init__(
+        self,
+        retriever: ImagesRetriever,
+        processor: ImageProcessor,
+        importer: ProductsImporter,
+        error_tracker: ErrorTracker = ErrorLogger(),
+        batch_size: int = 8,
+        journal: HarvestJournal = NoHarvestJournal(),
+        queue_size: int = 2,
+    ):
+        super().__init__(retriever, processor, importer, error_tracker, batch_size, journal)
+        self._queue_size = queue_size
+        self._error_tracker_lock = Lock()
+        self._stage_errors: list[Exception] = []
+        self._stop = Event()
+
+    def harvest(self):
+        self._stage_errors = []
+        self._stop.clear()
+        batches: Queue = Queue(maxsize=self._queue_size)
+        results: Queue = Queue(maxsize=self._queue_size)
+        stages = [
+            Thread(target=self._retrieve_stage, args=(batches,), daemon=True),
+            Thread(target=self._process_stage, args=(batches, results), daemon=True),
+        ]
+        self._import_products(self._journal.pending_imports())
+        for stage in stages:
+            stage.start()
+        try:
+            self._import_stage(results)
+        finally:
+            for stage in stages:
+                stage.join()
+        if self._stage_errors:
+            raise self._stage_errors[0]
+
+    def _retrieve_stage(self, batches: Queue):
+        try:
+            for images_batch in self._generate_image_batches():
+                if self._stop.is_set():
+                    break
+                batches.put(images_batch)
+        except Exception as e:
+            self._stage_errors.append(e)
+            self._stop.set()
+        finally:
+            batches.put(self._end_of_stage)
+
+    def _process_stage(self, batches: Queue, results: Queue):
+        try:
+            for images_batch in self._iterate_until_end_of_stage(batches):
+                # Batches that are already retrieved are dropped once another stage fails, so no model calls are wasted
+                if not self._stop.is_set():
+                    results.put(self._process_batch(images_batch))
+        except Exception as e:
+            self._stage_errors.append(e)
+            self._stop.set()
+            self._drain_until_end_of_stage(batches)
+        finally:
+            results.put(self._end_of_stage)
+
+    def _import_stage(self, results: Queue):
+        try:
+            for products in self._iterate_until_end_of_stage(results):
+                self._import_products(products)
+        except Exception:
+            self._stop.set()
+            self._drain_until_end_of_stage(results)
+            raise
+
+    @classmethod
+    def _iterate_until_end_of_stage(cls, queue: Queue) -> Generator[Any, None, None]:
+        while (item := queue.get()) is not cls._end_of_stage:
+            yield item
+
+    @classmethod
+    def _drain_until_end_of_stage(cls, queue: Queue):
+        for _ in cls._iterate_until_end_of_stage(queue):
+            pass
+
+    def _track_errors(self, errors: list[HarvestError]):
+        with self._error_tracker_lock:
+            super()._track_errors(errors)
+
+
+class StreamingProductsHarvester(ProductsHarvester):
+    def __init__(
+        self,
+        retriever: ImagesRetriever,
+        processor: ImageProcessor,
+        importer: ProductsImporter,
+        error_tracker: ErrorTracker = ErrorLogger(),
+        max_in_flight: int = 8,
+        journal: HarvestJournal = NoHarvestJournal(),
+    ):
+        super().__init__(retriever, processor, importer, error_tracker, max_in_flight, journal)
+        self._max_in_flight = max_in_flight
+
+    def harvest(self):
+        self._import_products(self._journal.pending_imports())
+        # All products of an image are journaled before any is imported, so a crash cannot mark the image done early
+        for result in self._processor.process_iter_by_image(self._generate_images(), self._max_in_flight):
+            self._import_products(self._process_result(result))
+
+    async def aharvest(self):
+        await self._aimport_products(await asyncio.to_thread(self._journal.pending_imports))
+        async for result in self._processor.aprocess_iter_by_image(self._agenerate_images(), self._max_in_flight):
+            await self._aimport_products(await self._aprocess_result(result))
+
+    def _generate_images(self) -> Generator[Image, None, None]:
+        try:
+            images_generator = self._retriever.retrieve_images()
+        except Exception as e:
+            self._track_errors([self._make_retrieval_error("Failed to retrieve images", e)])
+            return
+        while True:
+            try:
+                image = next(images_generator)
+            except StopIteration:
+                return
+            except Exception as e:
+                self._track_errors([self._make_retrieval_error("Failed to retrieve image", e)])
+                continue
+            if self._accept_retrieved_image(image):
+                yield image
+
+    async def _agenerate_images(self) -> AsyncGenerator[Image, None]:
+        try:
+            images_iterator = self._retriever.aretrieve_images()
+        except Exception as e:
+            await self._atrack_errors([self._make_retrieval_error("Failed to retrieve images", e)])
+            return
+        while True:
+            try:
+                image = await anext(images_iterator)
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                await self._atrack_errors([self._make_retrieval_error("Failed to retrieve image", e)])
+                continue
+            if await self._aaccept_retrieved_image(image):
+                yield image
+
+    def _process_result(self, result: ProcessingResult) -> list[ImportedProduct]:
+        self._unload_images(self._input_images(result))
+        product_results = self._extract_products_and_track_errors(result)
+        return self._make_imported_products(product_results)
+
+    async def _aprocess_result(self, result: ProcessingResult) -> list[ImportedProduct]:
+        self._unload_images(self._input_images(result))
+        product_results = await self._aextract_products_and_track_errors(result)
+        return await asyncio.to_thread(self._make_imported_products, product_results)
+
+    @staticmethod
+    def _input_images(result: ProcessingResult) -> list[Image]:
+        return list(
+            {id(image_result.input_image): image_result.input_image for image_result in result.results}.values()
+        )
@@ -1,7 +1,13 @@
+import base64
+import hashlib
+from threading import RLock
 from abc import ABC, abstractmethod
 from typing import Any
 
-from pydantic import BaseModel, Field
+import cv2
+import numpy as np
+import requests
+from pydantic import BaseModel, Field, PrivateAttr
 
 from product_harvester.product import Product
 
@@ -13,6 +19,9 @@ class ImageMeta(ABC):
     def __getitem__(self, item) -> Any | None:
         return self._metadata.get(item)
 
+    def to_dict(self) -> dict[str, Any]:
+        return dict(self._metadata)
+
     @abstractmethod
     def adjust_product(self, product: Product) -> None: ...
 
@@ -31,10 +40,105 @@ class NoImageMeta(ImageMeta):
         return hash("NoImageMeta")
 
 
+_http_session = requests.Session()
+_load_locks = [RLock() for _ in range(64)]
+
+
 class Image(BaseModel):
     id: str
-    data: str
+    data: str = ""
     meta: ImageMeta = Field(default_factory=NoImageMeta, exclude=True)
+    _content: bytes | None = PrivateAttr(default=None)
+    _mime_type: str = PrivateAttr(default="image/jpeg")
+    _arrays: dict[bool, np.ndarray] = PrivateAttr(default_factory=dict)
+    _content_hash: str | None = PrivateAttr(default=None)
 
     class Config:
         arbitrary_types_allowed = True
+
+    @classmethod
+    def from_bytes(cls, id: str, content: bytes, mime_type: str, meta: ImageMeta | None = None) -> "Image":
+        image = cls(id=id, meta=meta if meta is not None else NoImageMeta())
+        image._content = content
+        image._mime_type = mime_type
+        return image
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Image):
+            return NotImplemented
+        return (self.id, self.data, self.meta, self._source_content()) == (
+            other.id,
+            other.data,
+            other.meta,
+            other._source_content(),
+        )
+
+    def _source_content(self) -> bytes | None:
+        return None if self.data else self._content
+
+    @property
+    def is_base64_encoded(self) -> bool:
+        return self.data.startswith("data:image/")
+
+    @property
+    def is_url(self) -> bool:
+        return self.data.startswith("http")
+
+    @property
+    def is_in_memory(self) -> bool:
+        return not self.data
+
+    def to_url(self) -> str:
+        if not self.is_in_memory:
+            return self.data
+        content = base64.b64encode(self.load_bytes()).decode("utf-8")
+        return f"data:{self._mime_type};base64,{content}"
+
+    def load_bytes(self) -> bytes:
+        if self._content is None:
+            with self._load_lock():
+                if self._content is None:
+                    self._content = self._read_bytes()
+        return self._content
+
+    def _load_lock(self) -> RLock:
+        # Striped locks keep concurrent stages from loading the same image twice, while images stay picklable
+        return _load_locks[id(self) % len(_load_locks)]
+
+    def _read_bytes(self) -> bytes:
+        if self.is_base64_encoded:
+            return base64.b64decode(self.data.split(",", 1)[1])
+        elif self.is_url:
+            response = _http_session.get(self.data)
+            response.raise_for_status()
+            return response.content
+        elif self.is_in_memory:
+            raise ValueError(f"Image '{self.id}' has no content")
+        with open(self.data, "rb") as image_file:
+            return image_file.read()
+
+    def load_array(self, grayscale: bool = False) -> np.ndarray:
+        if grayscale not in self._arrays:
+            with self._load_lock():
+                if grayscale not in self._arrays:
+                    self._arrays[grayscale] = self._decode_array(grayscale)
+        return self._arrays[grayscale]
+
+    def _decode_array(self, grayscale: bool) -> np.ndarray:
+        if grayscale and False in self._arrays:
+            return cv2.cvtColor(self._arrays[False], cv2.COLOR_BGR2GRAY)
+        flags = cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+        array = cv2.imdecode(np.frombuffer(self.load_bytes(), np.uint8), flags)
+        if array is None:
+            raise ValueError(f"Image '{self.id}' could not be decoded")
+        return array
+
+    def content_hash(self) -> str:
+        if self._content_hash is None:
+            self._content_hash = hashlib.sha256(self.load_bytes()).hexdigest()
+        return self._content_hash
+
+    def unload(self):
+        self._arrays = {}
+        if not self.is_in_memory:
+            self._content = None
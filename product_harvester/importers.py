@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC, abstractmethod
 from pathlib import Path
 from typing import Literal, Self
@@ -6,12 +7,13 @@ from pydantic import Field
 
 from product_harvester.clients.usetri_api_client import UsetriAPIProduct, UsetriAPIProductDetail, UsetriClient
 from product_harvester.image import Image
-from product_harvester.product import Product
+from product_harvester.product import Product, ProductRegion
 
 
 class ImportedProduct(Product):
     source_image: Image = Field(strict=True, default="")
     is_barcode_checked: bool = Field(strict=True, default=False)
+    region: ProductRegion | None = Field(default=None)
 
     @classmethod
     def from_product(cls, product: Product, source_image: Image, is_barcode_checked: bool) -> Self:
@@ -22,6 +24,9 @@ class ProductsImporter(ABC):
     @abstractmethod
     def import_product(self, product: ImportedProduct): ...
 
+    async def aimport_product(self, product: ImportedProduct):
+        await asyncio.to_thread(self.import_product, product)
+
 
 class StdOutProductsImporter(ProductsImporter):
     def import_product(self, product: ImportedProduct):
@@ -0,0 +1,182 @@
+import json
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from threading import RLock
+from typing import Any, Literal
+
+from product_harvester.image import Image, ImageMeta, NoImageMeta
+from product_harvester.importers import ImportedProduct
+from product_harvester.product import Product
+
+ImageStage = Literal["retrieved", "extracted", "imported", "failed"]
+
+
+class HarvestJournal(ABC):
+    @abstractmethod
+    def is_done(self, image: Image) -> bool: ...
+
+    @abstractmethod
+    def mark_retrieved(self, image: Image): ...
+
+    @abstractmethod
+    def mark_extracted(self, product: ImportedProduct): ...
+
+    @abstractmethod
+    def mark_imported(self, product: ImportedProduct): ...
+
+    @abstractmethod
+    def mark_failed(self, image: Image): ...
+
+    @abstractmethod
+    def pending_imports(self) -> list[ImportedProduct]: ...
+
+
+class NoHarvestJournal(HarvestJournal):
+    def is_done(self, image: Image) -> bool:
+        return False
+
+    def mark_retrieved(self, image: Image):
+        pass
+
+    def mark_extracted(self, product: ImportedProduct):
+        pass
+
+    def mark_imported(self, product: ImportedProduct):
+        pass
+
+    def mark_failed(self, image: Image):
+        pass
+
+    def pending_imports(self) -> list[ImportedProduct]:
+        return []
+
+
+class _JournaledImageMeta(ImageMeta):
+    def adjust_product(self, product: Product) -> None:
+        # Products are journaled after being adjusted with the original meta
+        pass
+
+
+class SQLiteHarvestJournal(HarvestJournal):
+    _done_stages: tuple[ImageStage, ...] = ("extracted", "imported")
+
+    def __init__(self, db_path: str):
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = RLock()
+        self._content_hashes: dict[str, str] = {}
+        self._create_table()
+
+    def _create_table(self):
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+CREATE TABLE IF NOT EXISTS images (
+    image_id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    product TEXT,
+    image_meta TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (image_id, content_hash)
+)
+"""
+            )
+
+    def is_done(self, image: Image) -> bool:
+        return self.get_stage(image) in self._done_stages
+
+    def get_stage(self, image: Image) -> ImageStage | None:
+        return self._get_row(image)[0]
+
+    def mark_retrieved(self, image: Image):
+        self._set_stage(image, "retrieved")
+
+    def mark_extracted(self, product: ImportedProduct):
+        serialized_product, serialized_meta = self._serialize_product(product)
+        with self._lock:
+            stage, serialized_products = self._get_row(product.source_image)
+            # An image can contain several products, which are journaled together until all of them are imported
+            products = self._load_products(serialized_products) if stage == "extracted" else []
+            products.append(serialized_product)
+            self._set_stage(product.source_image, "extracted", (json.dumps(products), serialized_meta))
+
+    def mark_imported(self, product: ImportedProduct):
+        serialized_product, _ = self._serialize_product(product)
+        with self._lock:
+            stage, serialized_products = self._get_row(product.source_image)
+            products = self._load_products(serialized_products) if stage == "extracted" else []
+            if serialized_product in products:
+                products.remove(serialized_product)
+            if products:
+                self._set_stage(product.source_image, "extracted", (json.dumps(products), None))
+                return
+            self._set_stage(product.source_image, "imported")
+            self._content_hashes.pop(product.source_image.id, None)
+
+    def mark_failed(self, image: Image):
+        self._set_stage(image, "failed")
+        self._content_hashes.pop(image.id, None)
+
+    def pending_imports(self) -> list[ImportedProduct]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT image_id, content_hash, product, image_meta FROM images WHERE stage = 'extracted'"
+            ).fetchall()
+        products = []
+        for image_id, content_hash, serialized_products, serialized_meta in rows:
+            self._content_hashes[image_id] = content_hash
+            for serialized_product in self._load_products(serialized_products):
+                products.append(self._deserialize_product(serialized_product, serialized_meta))
+        return products
+
+    def _get_row(self, image: Image) -> tuple[ImageStage | None, str | None]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT stage, product FROM images WHERE image_id = ? AND content_hash = ?",
+                (image.id, self._content_hash(image)),
+            ).fetchone()
+        return row if row else (None, None)
+
+    def _set_stage(self, image: Image, stage: ImageStage, product: tuple[str, str | None] | None = None):
+        serialized_product, serialized_meta = product or (None, None)
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+INSERT INTO images (image_id, content_hash, stage, product, image_meta, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (image_id, content_hash) DO UPDATE SET
+    stage = excluded.stage,
+    product = COALESCE(excluded.product, product),
+    image_meta = COALESCE(excluded.image_meta, image_meta),
+    updated_at = excluded.updated_at
+""",
+                (image.id, self._content_hash(image), stage, serialized_product, serialized_meta, time.time()),
+            )
+
+    def _content_hash(self, image: Image) -> str:
+        if image.id not in self._content_hashes:
+            self._content_hashes[image.id] = image.content_hash()
+        return self._content_hashes[image.id]
+
+    @staticmethod
+    def _serialize_product(product: ImportedProduct) -> tuple[dict[str, Any], str]:
+        data = product.model_dump(mode="json")
+        if product.source_image.is_base64_encoded:
+            # Base64 encoded images would bloat the journal, the image id is enough to identify the source
+            data["source_image"]["data"] = ""
+        return data, json.dumps(product.source_image.meta.to_dict())
+
+    @staticmethod
+    def _load_products(serialized_products: str | None) -> list[dict[str, Any]]:
+        if serialized_products is None:
+            return []
+        products = json.loads(serialized_products)
+        # Journals written before multi-product images stored a single product per image
+        return products if isinstance(products, list) else [products]
+
+    @staticmethod
+    def _deserialize_product(serialized_product: dict[str, Any], serialized_meta: str) -> ImportedProduct:
+        product = ImportedProduct.model_validate(serialized_product)
+        metadata: dict[str, Any] = json.loads(serialized_meta)
+        product.source_image.meta = _JournaledImageMeta(metadata) if metadata else NoImageMeta()
+        return product
@@ -1,8 +1,22 @@
+import json
+import sqlite3
+import time
 from abc import ABC, abstractmethod
-from typing import Generator
+from collections import deque
+from datetime import datetime
+from threading import Lock
+from zoneinfo import ZoneInfo
+from typing import Any, Callable, Literal, Sequence
 
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
 from langchain_core.language_models import BaseChatModel
-from langchain_core.rate_limiters import InMemoryRateLimiter
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.rate_limiters import BaseRateLimiter, InMemoryRateLimiter
+from langchain_core.runnables import Runnable
+from pydantic import BaseModel
+
+from product_harvester.rate_limiters import SQLiteRateLimiter
 
 
 class ModelFactory(ABC):
@@ -19,32 +33,530 @@ class SingleModelFactory(ModelFactory):
         return self._model
 
 
+class QuotaExhaustedError(Exception):
+    pass
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+CircuitState = Literal["closed", "open", "half_open"]
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, recovery_seconds: float = 60):
+        self._failure_threshold = failure_threshold
+        self._recovery_seconds = recovery_seconds
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probe_started_at: float | None = None
+
+    def state(self, now: float) -> CircuitState:
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at < self._recovery_seconds:
+            return "open"
+        # A probe that never answered (e.g. a hung request) gives way to a new one after the recovery time
+        if self._probe_started_at is not None and now - self._probe_started_at < self._recovery_seconds:
+            return "open"
+        return "half_open"
+
+    def allows_request(self, now: float) -> bool:
+        return self.state(now) != "open"
+
+    def on_request(self, now: float):
+        # Only a single probe request goes to a half-open model, the others wait until it answers
+        if self.state(now) == "half_open":
+            self._probe_started_at = now
+
+    def on_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._probe_started_at = None
+
+    def on_failure(self, now: float):
+        self._failures += 1
+        if self._probe_started_at is not None or self._failures >= self._failure_threshold:
+            self._opened_at = now
+        self._probe_started_at = None
+
+    def on_cancel(self):
+        # A cancelled request tells nothing about the model, so the next request may probe it right away
+        self._probe_started_at = None
+
+
 class ModelWithLimits:
-    def __init__(self, model: BaseChatModel, rpm: int, rpd: int):
+    def __init__(self, model: BaseChatModel, rpm: int, rpd: int, name: str | None = None):
         self.model = model
         self.rpm = rpm
         self.rpd = rpd
+        self.name = name
+
+
+class ModelQuota(BaseModel):
+    model_name: str
+    rpm: int
+    requests_last_minute: int
+    remaining_rpd: int
+    requests: int
+    circuit: CircuitState = "closed"
+
+
+class ModelLatency(BaseModel):
+    model_name: str
+    weight: float
+    latency_seconds: float | None
+    error_rate: float
+    expected_seconds: float
+
+
+class QuotaState(BaseModel):
+    window: str
+    used_rpd: int
+    recent_requests: list[float]
+
+
+class QuotaStore(ABC):
+    @abstractmethod
+    def load(self, key: str) -> QuotaState | None: ...
+
+    @abstractmethod
+    def add_requests(self, key: str, window: str, requests: int, request_time: float) -> QuotaState | None: ...
+
+
+class NoQuotaStore(QuotaStore):
+    def load(self, key: str) -> QuotaState | None:
+        return None
+
+    def add_requests(self, key: str, window: str, requests: int, request_time: float) -> QuotaState | None:
+        return None
+
+
+class SQLiteQuotaStore(QuotaStore):
+    def __init__(self, db_path: str):
+        # Transactions are started explicitly, so that processes sharing the file add to the same counters
+        self._connection = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = Lock()
+        self._create_table()
+
+    def _create_table(self):
+        with self._lock:
+            self._connection.execute("""
+CREATE TABLE IF NOT EXISTS quotas (
+    key TEXT PRIMARY KEY,
+    window TEXT NOT NULL,
+    used_rpd INTEGER NOT NULL,
+    recent_requests TEXT NOT NULL
+)
+""")
+
+    def load(self, key: str) -> QuotaState | None:
+        with self._lock:
+            return self._load(key)
+
+    def add_requests(self, key: str, window: str, requests: int, request_time: float) -> QuotaState:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                state = self._load(key)
+                if state is None or state.window != window:
+                    state = QuotaState(window=window, used_rpd=0, recent_requests=[])
+                state.used_rpd += requests
+                state.recent_requests = [
+                    recent_request for recent_request in state.recent_requests if recent_request > request_time - 60
+                ] + [request_time]
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO quotas (key, window, used_rpd, recent_requests) VALUES (?, ?, ?, ?)",
+                    (key, state.window, state.used_rpd, json.dumps(state.recent_requests)),
+                )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            return state
+
+    def _load(self, key: str) -> QuotaState | None:
+        row = self._connection.execute(
+            "SELECT window, used_rpd, recent_requests FROM quotas WHERE key = ?", (key,)
+        ).fetchone()
+        if not row:
+            return None
+        return QuotaState(window=row[0], used_rpd=row[1], recent_requests=json.loads(row[2]))
+
+
+def _get_model_name(model: BaseChatModel) -> str:
+    for attribute in ("model_name", "model"):
+        name = getattr(model, attribute, None)
+        if isinstance(name, str) and name:
+            return name
+    return type(model).__name__
+
+
+def _is_transient_error(error: BaseException) -> bool:
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # Provider SDKs (e.g. openai, anthropic, google) wrap timeouts and connection errors in their own classes
+    if any(
+        "Timeout" in error_class.__name__ or "Connection" in error_class.__name__ for error_class in type(error).__mro__
+    ):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code is None:
+        status_code = getattr(error, "code", None)
+    return isinstance(status_code, int) and status_code >= 500
+
+
+class _DispatchingChatModel(BaseChatModel):
+    # Picks a model for every single request, so one batch can be spread over several models
+    dispatch: Callable[[], BaseChatModel]
+    model_name: str
+    report: Callable[[BaseChatModel, float, bool], None] | None = None
+    release: Callable[[BaseChatModel], None] | None = None
+    get_rate_limiter: Callable[[BaseChatModel], BaseRateLimiter | None] | None = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "dispatching"
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        model = self.dispatch()
+        rate_limiter = self._get_rate_limiter(model)
+        if rate_limiter is not None:
+            rate_limiter.acquire(blocking=True)
+        start = time.perf_counter()
+        try:
+            message = self._bind(model, kwargs).invoke(messages, stop=stop)
+        except Exception as e:
+            self._report_error(model, start, e)
+            raise
+        except BaseException:
+            self._release(model)
+            raise
+        self._report(model, start, failed=False)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        model = self.dispatch()
+        rate_limiter = self._get_rate_limiter(model)
+        if rate_limiter is not None:
+            await rate_limiter.aacquire(blocking=True)
+        start = time.perf_counter()
+        try:
+            message = await self._bind(model, kwargs).ainvoke(messages, stop=stop)
+        except Exception as e:
+            self._report_error(model, start, e)
+            raise
+        except BaseException:
+            self._release(model)
+            raise
+        self._report(model, start, failed=False)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _report(self, model: BaseChatModel, start: float, failed: bool):
+        if self.report is not None:
+            self.report(model, time.perf_counter() - start, failed)
+
+    def _report_error(self, model: BaseChatModel, start: float, error: Exception):
+        # Errors caused by the request itself (e.g. an unreadable image, a safety block or a 429) say nothing about the
+        # health of the model, so only outages count as its failures
+        if _is_transient_error(error):
+            self._report(model, start, failed=True)
+        else:
+            self._release(model)
+
+    def _release(self, model: BaseChatModel):
+        if self.release is not None:
+            self.release(model)
+
+    def _get_rate_limiter(self, model: BaseChatModel) -> BaseRateLimiter | None:
+        # The wait for the rate limit is taken before the request is timed, so it does not count as model latency
+        return self.get_rate_limiter(model) if self.get_rate_limiter is not None else None
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> Runnable:
+        return self.bind(tools=tools, tool_kwargs=kwargs)
+
+    @staticmethod
+    def _bind(model: BaseChatModel, kwargs: dict[str, Any]) -> Runnable:
+        kwargs = dict(kwargs)
+        tools = kwargs.pop("tools", None)
+        tool_kwargs = kwargs.pop("tool_kwargs", {})
+        bound_model = model.bind_tools(tools, **tool_kwargs) if tools is not None else model
+        return bound_model.bind(**kwargs) if kwargs else bound_model
 
 
 class RateLimitedModelFactory(ModelFactory):
-    def __init__(self, models: list[ModelWithLimits], rpd_subtractor: int = 1):
+    def __init__(
+        self,
+        models: list[ModelWithLimits],
+        rpd_subtractor: int = 1,
+        quota_store: QuotaStore = NoQuotaStore(),
+        reset_timezone: str = "America/Los_Angeles",
+        rate_limiter_path: str | None = None,
+        failure_threshold: int = 5,
+        recovery_seconds: float = 60,
+    ):
         self._models = models
         self._rpd_subtractor = rpd_subtractor
-        for model_with_limits in self._models:
-            model_with_limits.model.rate_limiter = InMemoryRateLimiter(requests_per_second=model_with_limits.rpm / 60)
-        self._model_cycle = self._available_model_generator()
+        # The configured limits stay untouched, so that other factories can be built from the same models
+        self._daily_limits = [model_with_limits.rpd for model_with_limits in models]
+        self._remaining_rpd = list(self._daily_limits)
+        self._quota_keys = [
+            model_with_limits.name or f"{index}:{_get_model_name(model_with_limits.model)}"
+            for index, model_with_limits in enumerate(models)
+        ]
+        # The dispatching model applies the limits, the underlying models are called only after their limiter allows it
+        self._rate_limiters = [
+            self._make_rate_limiter(model_with_limits, quota_key, rate_limiter_path)
+            for model_with_limits, quota_key in zip(self._models, self._quota_keys)
+        ]
+        self._recent_requests: list[deque[float]] = [deque() for _ in models]
+        self._requests = [0 for _ in models]
+        self._circuit_breakers = [CircuitBreaker(failure_threshold, recovery_seconds) for _ in models]
+        self._indexes = {id(model_with_limits.model): index for index, model_with_limits in enumerate(models)}
+        self._quota_store = quota_store
+        self._reset_timezone = ZoneInfo(reset_timezone)
+        self._window = self._current_window()
+        self._lock = Lock()
+        self._load_quotas()
+        self._model = _DispatchingChatModel(
+            dispatch=self.acquire_model,
+            model_name="+".join(_get_model_name(model_with_limits.model) for model_with_limits in models),
+            report=self._report,
+            release=self._release,
+            get_rate_limiter=self._get_rate_limiter,
+        )
+
+    def get_model(self) -> BaseChatModel:
+        return self._model
+
+    @staticmethod
+    def _make_rate_limiter(
+        model_with_limits: ModelWithLimits, quota_key: str, rate_limiter_path: str | None
+    ) -> BaseRateLimiter:
+        requests_per_second = model_with_limits.rpm / 60
+        if rate_limiter_path is None:
+            return InMemoryRateLimiter(requests_per_second=requests_per_second)
+        return SQLiteRateLimiter(rate_limiter_path, quota_key, requests_per_second=requests_per_second)
 
-    def get_model(self) -> BaseChatModel | None:
-        return next(self._model_cycle, None)
+    def acquire_model(self) -> BaseChatModel:
+        with self._lock:
+            now = time.time()
+            self._reset_daily_quotas_if_window_passed()
+            index = self._acquire_index(now)
+            self._circuit_breakers[index].on_request(now)
+            self._record_request(index, now)
+            return self._models[index].model
 
-    def _available_model_generator(self) -> Generator[BaseChatModel | None, None, None]:
+    def _record_request(self, index: int, now: float):
+        self._recent_requests[index].append(now)
+        self._requests[index] += 1
+
+    def _acquire_index(self, now: float) -> int:
         while True:
-            found = False
-            for model_with_limits in self._models:
-                new_rpd = model_with_limits.rpd - self._rpd_subtractor
-                if new_rpd >= 0:
-                    model_with_limits.rpd = new_rpd
-                    found = True
-                    yield model_with_limits.model
-            if not found:
-                yield None
+            available = [
+                index
+                for index, remaining_rpd in enumerate(self._remaining_rpd)
+                if remaining_rpd >= self._rpd_subtractor
+            ]
+            if not available:
+                raise QuotaExhaustedError("Daily request quota of all models is exhausted")
+            available = [index for index in available if self._circuit_breakers[index].allows_request(now)]
+            if not available:
+                raise CircuitOpenError("All models with remaining quota are failing")
+            index = self._select_model(available, now)
+            if self._add_quota_requests(index, now):
+                return index
+
+    @property
+    def quotas(self) -> list[ModelQuota]:
+        with self._lock:
+            now = time.time()
+            self._reset_daily_quotas_if_window_passed()
+            return [
+                ModelQuota(
+                    model_name=_get_model_name(model_with_limits.model),
+                    rpm=model_with_limits.rpm,
+                    requests_last_minute=len(self._expire_recent_requests(index, now)),
+                    remaining_rpd=self._remaining_rpd[index],
+                    requests=self._requests[index],
+                    circuit=self._circuit_breakers[index].state(now),
+                )
+                for index, model_with_limits in enumerate(self._models)
+            ]
+
+    def _select_model(self, available: list[int], now: float) -> int:
+        return max(available, key=lambda index: self._headroom(index, now))
+
+    def _report(self, model: BaseChatModel, seconds: float, failed: bool):
+        index = self._indexes.get(id(model))
+        if index is None:
+            return
+        with self._lock:
+            if failed:
+                self._circuit_breakers[index].on_failure(time.time())
+            else:
+                self._circuit_breakers[index].on_success()
+
+    def _get_rate_limiter(self, model: BaseChatModel) -> BaseRateLimiter | None:
+        index = self._indexes.get(id(model))
+        return self._rate_limiters[index] if index is not None else None
+
+    def _release(self, model: BaseChatModel):
+        index = self._indexes.get(id(model))
+        if index is None:
+            return
+        with self._lock:
+            self._circuit_breakers[index].on_cancel()
+
+    def _headroom(self, index: int, now: float) -> tuple[float, int]:
+        # The share of the minute's requests that is still free comes first, the remaining daily requests break ties
+        model_with_limits = self._models[index]
+        recent_requests = self._expire_recent_requests(index, now)
+        return (model_with_limits.rpm - len(recent_requests)) / model_with_limits.rpm, self._remaining_rpd[index]
+
+    def _expire_recent_requests(self, index: int, now: float) -> deque[float]:
+        recent_requests = self._recent_requests[index]
+        while recent_requests and recent_requests[0] <= now - 60:
+            recent_requests.popleft()
+        return recent_requests
+
+    def _current_window(self) -> str:
+        # Daily quotas of the providers reset at midnight of their own time zone (Pacific time for Gemini)
+        return datetime.now(self._reset_timezone).date().isoformat()
+
+    def _reset_daily_quotas_if_window_passed(self):
+        window = self._current_window()
+        if window == self._window:
+            return
+        self._window = window
+        self._remaining_rpd = list(self._daily_limits)
+
+    def _load_quotas(self):
+        for index, quota_key in enumerate(self._quota_keys):
+            state = self._load_quota_state(quota_key)
+            if state is None:
+                continue
+            self._recent_requests[index].extend(state.recent_requests)
+            if state.window == self._window:
+                self._remaining_rpd[index] = max(self._daily_limits[index] - state.used_rpd, 0)
+
+    def _load_quota_state(self, key: str) -> QuotaState | None:
+        try:
+            return self._quota_store.load(key)
+        except Exception:
+            return None
+
+    def _add_quota_requests(self, index: int, now: float) -> bool:
+        self._remaining_rpd[index] -= self._rpd_subtractor
+        try:
+            state = self._quota_store.add_requests(self._quota_keys[index], self._window, self._rpd_subtractor, now)
+        except Exception:
+            return True
+        if state is None or state.window != self._window:
+            return True
+        # The store counts the requests of every process using it, so its total replaces the local one. When other
+        # processes have used up the quota in the meantime, the request is not sent and another model is tried.
+        remaining_rpd = self._daily_limits[index] - state.used_rpd
+        self._remaining_rpd[index] = max(remaining_rpd, 0)
+        return remaining_rpd >= 0
+
+
+class LatencyAwareModelFactory(RateLimitedModelFactory):
+    def __init__(
+        self,
+        models: list[ModelWithLimits],
+        weights: list[float] | None = None,
+        smoothing: float = 0.2,
+        prior_latency_seconds: float = 1.0,
+        **kwargs: Any,
+    ):
+        super().__init__(models, **kwargs)
+        self._weights = weights if weights is not None else [1.0 for _ in models]
+        if len(self._weights) != len(models) or any(weight <= 0 for weight in self._weights):
+            raise ValueError("There must be one positive weight for every model")
+        self._smoothing = smoothing
+        self._prior_latency_seconds = prior_latency_seconds
+        self._latencies: list[float | None] = [None for _ in models]
+        self._error_rates = [0.0 for _ in models]
+        self._next_token_at = [0.0 for _ in models]
+
+    @property
+    def latencies(self) -> list[ModelLatency]:
+        with self._lock:
+            now = time.time()
+            return [
+                ModelLatency(
+                    model_name=_get_model_name(model_with_limits.model),
+                    weight=self._weights[index],
+                    latency_seconds=self._latencies[index],
+                    error_rate=self._error_rates[index],
+                    expected_seconds=self._expected_seconds(index, now),
+                )
+                for index, model_with_limits in enumerate(self._models)
+            ]
+
+    def _select_model(self, available: list[int], now: float) -> int:
+        # Ties go to models without any measurement yet, so that every model gets measured, then to the most free quota
+        return min(
+            available,
+            key=lambda index: (
+                self._expected_seconds(index, now),
+                self._latencies[index] is not None,
+                self._negated_headroom(index, now),
+            ),
+        )
+
+    def _negated_headroom(self, index: int, now: float) -> tuple[float, int]:
+        rpm_headroom, rpd = self._headroom(index, now)
+        return -rpm_headroom, -rpd
+
+    def _expected_seconds(self, index: int, now: float) -> float:
+        latency = self._latencies[index]
+        if latency is None:
+            latency = self._prior_latency()
+        # A failed request has to be retried, so the latency grows with the expected number of attempts
+        attempts = 1 / max(1 - self._error_rates[index], 0.05)
+        return self._rate_limit_wait(index, now) + latency * attempts / self._weights[index]
+
+    def _prior_latency(self) -> float:
+        # Models that have not answered yet are assumed to be as fast as the fastest one, so their errors still count
+        measured_latencies = [latency for latency in self._latencies if latency is not None]
+        return min(measured_latencies, default=self._prior_latency_seconds)
+
+    def _rate_limit_wait(self, index: int, now: float) -> float:
+        return max(self._next_token_at[index] - now, 0.0)
+
+    def _record_request(self, index: int, now: float):
+        super()._record_request(index, now)
+        # The rate limiter is a token bucket holding a single request, so dispatched requests queue one after another
+        self._next_token_at[index] = max(self._next_token_at[index], now) + 60 / self._models[index].rpm
+
+    def _report(self, model: BaseChatModel, seconds: float, failed: bool):
+        super()._report(model, seconds, failed)
+        index = self._indexes.get(id(model))
+        if index is None:
+            return
+        with self._lock:
+            self._error_rates[index] = self._smooth(self._error_rates[index], float(failed))
+            if not failed:
+                self._latencies[index] = self._smooth(self._latencies[index], seconds)
+
+    def _smooth(self, average: float | None, value: float) -> float:
+        if average is None:
+            return value
+        return self._smoothing * value + (1 - self._smoothing) * average
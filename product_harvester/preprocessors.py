@@ -0,0 +1,185 @@
+import base64
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Literal
+
+import cv2
+import numpy as np
+
+from product_harvester.barcodes import BarcodeDecoder, DecodedBarcode, PyzbarBarcodeDecoder
+from product_harvester.image import Image
+
+_Region = tuple[int, int, int, int]
+
+
+class ImagePreprocessor(ABC):
+    uses_barcodes = False
+
+    @abstractmethod
+    def preprocess(self, image: np.ndarray) -> np.ndarray: ...
+
+    def preprocess_with_barcodes(self, image: np.ndarray, barcodes: list[DecodedBarcode]) -> np.ndarray:
+        return self.preprocess(image)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({vars(self)})"
+
+
+class ImageDownscaler(ImagePreprocessor):
+    def __init__(self, max_long_edge: int = 1024):
+        self._max_long_edge = max_long_edge
+
+    def preprocess(self, image: np.ndarray) -> np.ndarray:
+        height, width = image.shape[:2]
+        long_edge = max(height, width)
+        if long_edge <= self._max_long_edge:
+            return image
+        scale = self._max_long_edge / long_edge
+        size = (max(round(width * scale), 1), max(round(height * scale), 1))
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+class PriceTagCropper(ImagePreprocessor):
+    uses_barcodes = True
+
+    def __init__(
+        self,
+        min_area_ratio: float = 0.005,
+        max_area_ratio: float = 0.8,
+        min_rectangularity: float = 0.85,
+        margin: float = 0.05,
+        barcode_decoder: BarcodeDecoder = PyzbarBarcodeDecoder(),
+    ):
+        self._min_area_ratio = min_area_ratio
+        self._max_area_ratio = max_area_ratio
+        self._min_rectangularity = min_rectangularity
+        self._margin = margin
+        self._barcode_decoder = barcode_decoder
+
+    def preprocess(self, image: np.ndarray) -> np.ndarray:
+        grayscale = self._to_grayscale(image)
+        return self._crop_to_tag(image, grayscale, self._barcode_decoder.decode(grayscale))
+
+    def preprocess_with_barcodes(self, image: np.ndarray, barcodes: list[DecodedBarcode]) -> np.ndarray:
+        # Barcodes read for the product are reused, their positions are relative to the image size
+        return self._crop_to_tag(image, self._to_grayscale(image), barcodes)
+
+    @staticmethod
+    def _to_grayscale(image: np.ndarray) -> np.ndarray:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+    def _crop_to_tag(self, image: np.ndarray, grayscale: np.ndarray, barcodes: list[DecodedBarcode]) -> np.ndarray:
+        candidates = self._find_tag_candidates(grayscale)
+        if barcodes:
+            height, width = grayscale.shape[:2]
+            center = barcodes[0].center_x * width, barcodes[0].center_y * height
+            candidates = [candidate for candidate in candidates if self._contains(candidate, center)]
+            region = min(candidates, key=self._area, default=None)
+        else:
+            # Without a barcode only a single tag is a confident detection, several tags or boxes could be any of them
+            outermost = self._outermost(candidates)
+            region = outermost[0] if len(outermost) == 1 else None
+        return self._crop(image, region) if region is not None else image
+
+    def _find_tag_candidates(self, grayscale: np.ndarray) -> list[_Region]:
+        blurred = cv2.GaussianBlur(grayscale, (5, 5), 0)
+        edges = cv2.dilate(cv2.Canny(blurred, 50, 150), np.ones((3, 3), np.uint8))
+        contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        image_area = grayscale.shape[0] * grayscale.shape[1]
+        candidates = []
+        for contour in contours:
+            region = cv2.boundingRect(contour)
+            area_ratio = self._area(region) / image_area
+            if not self._min_area_ratio <= area_ratio <= self._max_area_ratio:
+                continue
+            polygon = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+            rectangularity = cv2.contourArea(contour) / self._area(region)
+            if len(polygon) == 4 and rectangularity >= self._min_rectangularity:
+                candidates.append(region)
+        return candidates
+
+    @staticmethod
+    def _area(region: _Region) -> int:
+        return region[2] * region[3]
+
+    @classmethod
+    def _outermost(cls, candidates: list[_Region]) -> list[_Region]:
+        # The inner and outer edge of a tag border, or a frame printed on the tag, are found as nested candidates
+        return [
+            candidate
+            for candidate in candidates
+            if not any(other != candidate and cls._encloses(other, candidate) for other in candidates)
+        ]
+
+    @staticmethod
+    def _encloses(outer: _Region, inner: _Region) -> bool:
+        return (
+            outer[0] <= inner[0]
+            and outer[1] <= inner[1]
+            and inner[0] + inner[2] <= outer[0] + outer[2]
+            and inner[1] + inner[3] <= outer[1] + outer[3]
+        )
+
+    @staticmethod
+    def _contains(region: _Region, point: tuple[float, float]) -> bool:
+        x, y = point
+        return region[0] <= x <= region[0] + region[2] and region[1] <= y <= region[1] + region[3]
+
+    def _crop(self, image: np.ndarray, region: _Region) -> np.ndarray:
+        left, top, width, height = region
+        margin_x, margin_y = round(width * self._margin), round(height * self._margin)
+        image_height, image_width = image.shape[:2]
+        top, bottom = max(top - margin_y, 0), min(top + height + margin_y, image_height)
+        left, right = max(left - margin_x, 0), min(left + width + margin_x, image_width)
+        return image[top:bottom, left:right]
+
+
+class ImagePreprocessing:
+    _encoding_params = {
+        "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+        "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+    }
+
+    def __init__(
+        self,
+        preprocessors: list[ImagePreprocessor] | None = None,
+        image_format: Literal["jpeg", "webp"] = "jpeg",
+        quality: int = 85,
+        max_workers: int = 4,
+    ):
+        self._preprocessors = preprocessors if preprocessors is not None else []
+        self._image_format = image_format
+        self._quality = quality
+        self._max_workers = max_workers
+
+    def __repr__(self) -> str:
+        return f"ImagePreprocessing({self._preprocessors}, {self._image_format}, {self._quality})"
+
+    def prepare(
+        self, images: list[Image], read_barcodes: Callable[[Image], list[DecodedBarcode]] | None = None
+    ) -> list[str]:
+        if not self._preprocessors or not images:
+            return [image.to_url() for image in images]
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            return list(executor.map(lambda image: self._prepare_image(image, read_barcodes), images))
+
+    def _prepare_image(self, image: Image, read_barcodes: Callable[[Image], list[DecodedBarcode]] | None) -> str:
+        try:
+            array = image.load_array()
+            for preprocessor in self._preprocessors:
+                if preprocessor.uses_barcodes and read_barcodes is not None:
+                    array = preprocessor.preprocess_with_barcodes(array, read_barcodes(image))
+                else:
+                    array = preprocessor.preprocess(array)
+            return self._encode(array)
+        except Exception:
+            # The original image is still a valid model input, so a failed preprocessing must not fail the image
+            return image.to_url()
+
+    def _encode(self, array: np.ndarray) -> str:
+        extension, quality_flag = self._encoding_params[self._image_format]
+        is_encoded, encoded = cv2.imencode(extension, array, [quality_flag, self._quality])
+        if not is_encoded:
+            raise ValueError(f"Failed to encode image as {self._image_format}")
+        content = base64.b64encode(encoded.tobytes()).decode("utf-8")
+        return f"data:image/{self._image_format};base64,{content}"
@@ -1,20 +1,28 @@
-import base64
+import asyncio
+import hashlib
 from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ThreadPoolExecutor, wait
+from threading import Lock
+from typing import Any, AsyncGenerator, Callable, AsyncIterable, AsyncIterator, Generator, Iterable, Iterator
 
 import cv2
-import numpy as np
-import requests
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
 from langchain_core.output_parsers import PydanticOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnableConfig
+from langchain_core.messages import HumanMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import Runnable, RunnableConfig
 from langchain_core.runnables.utils import Output
 from langsmith import RunTree
-from pydantic import BaseModel, ConfigDict
-from pyzbar.pyzbar import decode
+from pydantic import BaseModel, ConfigDict, Field
 
+from product_harvester.barcodes import BarcodeDecoder, DecodedBarcode, PyzbarBarcodeDecoder
+from product_harvester.caches import BarcodeCache, ExtractionCache, NoBarcodeCache, NoExtractionCache
+from product_harvester.catalog import NoProductCatalog, ProductCatalog
 from product_harvester.image import Image
 from product_harvester.model_factory import ModelFactory
-from product_harvester.product import Product
+from product_harvester.preprocessors import ImagePreprocessing
+from product_harvester.product import Product, ScoredProduct, ShelfProduct
 
 
 class ProcessingError(Exception):
@@ -39,6 +47,10 @@ class ProcessingResult:
     def __init__(self, results: list[PerImageProcessingResult]):
         self._results = results
 
+    @property
+    def results(self) -> list[PerImageProcessingResult]:
+        return list(self._results)
+
     @property
     def product_results(self) -> list[PerImageProcessingResult]:
         return [result for result in self._results if not result.is_error]
@@ -52,33 +64,112 @@ class ImageProcessor(ABC):
     @abstractmethod
     def process(self, images: list[Image]) -> ProcessingResult: ...
 
+    async def aprocess(self, images: list[Image]) -> ProcessingResult:
+        return await asyncio.to_thread(self.process, images)
+
+    def process_iter(
+        self, images: Iterable[Image], max_in_flight: int = 8
+    ) -> Generator[PerImageProcessingResult, None, None]:
+        for result in self.process_iter_by_image(images, max_in_flight):
+            yield from result.results
+
+    async def aprocess_iter(
+        self, images: AsyncIterable[Image], max_in_flight: int = 8
+    ) -> AsyncGenerator[PerImageProcessingResult, None]:
+        async for result in self.aprocess_iter_by_image(images, max_in_flight):
+            for image_result in result.results:
+                yield image_result
+
+    def process_iter_by_image(
+        self, images: Iterable[Image], max_in_flight: int = 8
+    ) -> Generator[ProcessingResult, None, None]:
+        # All results of one image (e.g. every product on a shelf) come together, so they can be handled as a unit
+        images_iterator = iter(images)
+        in_flight: dict[Future[ProcessingResult], Image] = {}
+        with ThreadPoolExecutor(max_in_flight) as executor:
+            self._submit_images(executor, images_iterator, in_flight, max_in_flight)
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                finished = [(future, in_flight.pop(future)) for future in done]
+                self._submit_images(executor, images_iterator, in_flight, max_in_flight)
+                for future, image in finished:
+                    yield self._make_result(image, future.exception() or future.result())
+
+    async def aprocess_iter_by_image(
+        self, images: AsyncIterable[Image], max_in_flight: int = 8
+    ) -> AsyncGenerator[ProcessingResult, None]:
+        images_iterator = aiter(images)
+        in_flight: dict[asyncio.Task[ProcessingResult], Image] = {}
+        try:
+            await self._asubmit_images(images_iterator, in_flight, max_in_flight)
+            while in_flight:
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                finished = [(task, in_flight.pop(task)) for task in done]
+                await self._asubmit_images(images_iterator, in_flight, max_in_flight)
+                for task, image in finished:
+                    yield self._make_result(image, task.exception() or task.result())
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    def _submit_images(
+        self,
+        executor: Executor,
+        images: Iterator[Image],
+        in_flight: dict[Future[ProcessingResult], Image],
+        max_in_flight: int,
+    ):
+        while len(in_flight) < max_in_flight and (image := next(images, None)) is not None:
+            in_flight[executor.submit(self.process, [image])] = image
+
+    async def _asubmit_images(
+        self, images: AsyncIterator[Image], in_flight: dict[asyncio.Task[ProcessingResult], Image], max_in_flight: int
+    ):
+        while len(in_flight) < max_in_flight and (image := await anext(images, None)) is not None:
+            in_flight[asyncio.create_task(self.aprocess([image]))] = image
+
+    @staticmethod
+    def _make_result(image: Image, result: ProcessingResult | BaseException) -> ProcessingResult:
+        if isinstance(result, BaseException):
+            error = ProcessingError("Failed to extract data from the image", str(result))
+            return ProcessingResult([PerImageProcessingResult(input_image=image, output=error)])
+        return result
+
 
 class _PriceTagProcessingResult(ProcessingResult):
     def __init__(self, chain_stage_descriptions: list[str]):
         super().__init__([])
         self._chain_stage_descriptions = chain_stage_descriptions
+        self._inputs: dict[str, Image] = {}
+
+    def set_inputs(self, inputs: list[Image]):
+        self._inputs = {input_image.id: input_image for input_image in inputs}
 
     def set_products_from_outputs(self, inputs: list[Image], outputs: list[Output]):
         if len(inputs) != len(outputs):
             raise ProcessingError(msg="Number of inputs and outputs do not match")
-        self._results.extend(
-            [
-                PerImageProcessingResult(input_image=input_image, output=output)
-                for input_image, output in zip(inputs, outputs)
-                if isinstance(output, Product)
-            ]
-        )
+        for input_image, output in zip(inputs, outputs):
+            if isinstance(output, Product):
+                self.add_product(input_image, output)
+
+    def add_product(self, input_image: Image, product: Product):
+        self._results.append(PerImageProcessingResult(input_image=input_image, output=product))
+
+    def add_error(self, input_image: Image, error: ProcessingError):
+        self._results.append(PerImageProcessingResult(input_image=input_image, output=error))
 
     def add_error_from_run_tree(self, run_tree: RunTree):
         for stage_index, stage in enumerate(run_tree.child_runs):
             if stage.error:
                 msg = self._make_stage_error_msg(stage_index)
                 err = ProcessingError(msg, stage.error)
-                self._results.append(
-                    PerImageProcessingResult(
-                        input_image=Image(id=run_tree.inputs["image_id"], data=run_tree.inputs["image"]), output=err
-                    )
-                )
+                self._results.append(PerImageProcessingResult(input_image=self._find_input(run_tree), output=err))
+
+    def _find_input(self, run_tree: RunTree) -> Image:
+        image_id = run_tree.inputs["image_id"]
+        if image_id in self._inputs:
+            return self._inputs[image_id]
+        return Image(id=image_id, data=run_tree.inputs["image"])
 
     def _make_stage_error_msg(self, stage_index: int) -> str:
         if stage_index >= len(self._chain_stage_descriptions):
@@ -87,59 +178,77 @@ class _PriceTagProcessingResult(ProcessingResult):
 
 
 class _BarcodeReader:
-    def __init__(self, debug: bool = False):
-        self._current_image_data = ""
+    def __init__(
+        self,
+        decoder: BarcodeDecoder = PyzbarBarcodeDecoder(),
+        cache: BarcodeCache = NoBarcodeCache(),
+        debug: bool = False,
+    ):
+        self._decoder = decoder
+        self._cache = cache
+        self._cache_context = repr(decoder)
         self._debug = debug
 
-    def read_barcode(self, image_data: str) -> str | None:
-        self._current_image_data = image_data
-        image = self._load_image()
+    def __getstate__(self) -> dict[str, Any]:
+        # A copy sent to another process could neither share nor fill the cache, so it goes without one
+        return {**vars(self), "_cache": NoBarcodeCache()}
+
+    def read_barcode(self, image: Image) -> str | None:
+        barcodes = self.read_barcodes(image)
+        return barcodes[0].value if barcodes else None
+
+    def read_barcodes(self, image: Image) -> list[DecodedBarcode]:
+        barcodes = self._get_cached_barcodes(image)
+        if barcodes is not None:
+            return barcodes
+        grayscale = image.load_array(grayscale=True)
         if self._debug:
-            cv2.imshow("Image", image)
+            cv2.imshow("Image", grayscale)
             cv2.waitKey(0)
-        barcodes = decode(image)
-        return str(barcodes[0].data.decode("utf-8")) if barcodes else None
-
-    def _load_image(self) -> np.ndarray:
-        if self._is_base64_encoded():
-            image_bytes = self._image_bytes_from_base64()
-        elif self._is_url():
-            image_bytes = self._image_bytes_from_url()
-        else:
-            image_bytes = self._image_bytes_from_path()
-        image = self._load_image_from_bytes(image_bytes)
-        return self._image_to_grayscale(image)
-
-    def _is_base64_encoded(self) -> bool:
-        return self._current_image_data.startswith("data:image/")
-
-    def _image_bytes_from_base64(self) -> bytes:
-        base64_data = self._current_image_data.split(",", 1)[1]
-        return base64.b64decode(base64_data)
-
-    def _is_url(self) -> bool:
-        return self._current_image_data.startswith("http")
-
-    def _image_bytes_from_url(self) -> bytes:
-        response = requests.get(self._current_image_data)
-        response.raise_for_status()
-        return response.content
-
-    def _image_bytes_from_path(self) -> bytes:
-        with open(self._current_image_data, "rb") as image_file:
-            return image_file.read()
+        barcodes = self._decoder.decode(grayscale)
+        self._put_cached_barcodes(image, barcodes)
+        return barcodes
 
-    @staticmethod
-    def _load_image_from_bytes(image_bytes) -> np.ndarray:
-        arr = np.frombuffer(image_bytes, np.uint8)
-        return cv2.imdecode(arr, cv2.IMREAD_COLOR)
+    def _get_cached_barcodes(self, image: Image) -> list[DecodedBarcode] | None:
+        try:
+            return self._cache.get(image, self._cache_context)
+        except Exception:
+            return None
 
-    @staticmethod
-    def _image_to_grayscale(image: np.ndarray) -> np.ndarray:
-        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    def _put_cached_barcodes(self, image: Image, barcodes: list[DecodedBarcode]):
+        try:
+            self._cache.put(image, self._cache_context, barcodes)
+        except Exception:
+            return
+
+
+class _PackedProduct(Product):
+    image_index: int = Field(strict=True, ge=1)
+
+
+class _PackedProducts(BaseModel):
+    products: list[_PackedProduct]
+
+    def by_image_index(self) -> dict[int, Product]:
+        products: dict[int, Product] = {}
+        duplicate_indices: set[int] = set()
+        for packed_product in self.products:
+            if packed_product.image_index in products:
+                duplicate_indices.add(packed_product.image_index)
+            products[packed_product.image_index] = Product(**packed_product.model_dump(exclude={"image_index"}))
+        return {index: product for index, product in products.items() if index not in duplicate_indices}
+
+
+class _ShelfProducts(BaseModel):
+    products: list[ShelfProduct]
+
+
+class _Price(BaseModel):
+    price: float = Field(strict=True, gt=0)
 
 
 class PriceTagImageProcessor(ImageProcessor):
+    # Everything but the image is the same for every call, so it forms a prefix which providers can cache
     _prompt = ChatPromptTemplate.from_messages(
         [
             (
@@ -155,59 +264,562 @@ As a category, use only one from the following list:
             (
                 "user",
                 [
+                    {"type": "text", "text": "process_image"},
                     {
                         "type": "image_url",
                         "image_url": {"url": "{image}"},
                     },
-                    {"type": "text", "text": "process_image"},
                 ],
             ),
         ]
     )
     _parser = PydanticOutputParser(pydantic_object=Product)
+    _cached_product_type: type[Product] = Product
+    _packed_prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                """
+Extract product data from each of the numbered images of product price tags.
+Return exactly one product for every image and set its image_index to the number of the image.
+As a category, use only one from the following list:
+  {categories}
 
-    def __init__(self, model_factory: ModelFactory, categories: list[str] | None = None, max_concurrency: int = 4):
+{format_instructions}
+""",
+            ),
+            MessagesPlaceholder("images"),
+        ]
+    )
+    _packed_parser = PydanticOutputParser(pydantic_object=_PackedProducts)
+    _price_prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                """
+Read the price of the named product from the image of its price tag.
+
+{format_instructions}
+""",
+            ),
+            (
+                "user",
+                [
+                    {"type": "text", "text": "{product_name}"},
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": "{image}"},
+                    },
+                ],
+            ),
+        ]
+    )
+    _price_parser = PydanticOutputParser(pydantic_object=_Price)
+
+    def __init__(
+        self,
+        model_factory: ModelFactory,
+        categories: list[str] | None = None,
+        max_concurrency: int = 4,
+        cache: ExtractionCache = NoExtractionCache(),
+        preprocessing: ImagePreprocessing = ImagePreprocessing(),
+        barcode_executor: Executor | None = None,
+        images_per_request: int = 1,
+        structured_output: bool = False,
+        callbacks: list[BaseCallbackHandler] | None = None,
+        catalog: ProductCatalog = NoProductCatalog(),
+        barcode_decoder: BarcodeDecoder = PyzbarBarcodeDecoder(),
+        barcode_cache: BarcodeCache = NoBarcodeCache(),
+    ):
         categories = categories if categories is not None else ["food", "drinks", "other"]
         self._model_factory = model_factory
         self._categories_instructions = ", ".join([f"'{category}'" for category in categories])
         self._max_concurrency = max_concurrency
-        self._parser_format_instructions = self._parser.get_format_instructions()
+        # Native structured output passes the schema to the provider, so it is not repeated in the prompt
+        self._structured_output = structured_output
+        self._parser_format_instructions = "" if structured_output else self._parser.get_format_instructions()
+        self._packed_parser_format_instructions = (
+            "" if structured_output else self._packed_parser.get_format_instructions()
+        )
+        self._price_parser_format_instructions = (
+            "" if structured_output else self._price_parser.get_format_instructions()
+        )
+        self._callbacks = callbacks
+        self._images_per_request = images_per_request
         self._chain_stage_descriptions = [
             "prompt preparation",
             "extracting data from image",
             "parsing of extracted data from image",
         ]
-        self._barcode_reader = _BarcodeReader()
+        self._barcode_reader = _BarcodeReader(barcode_decoder, barcode_cache)
+        self._barcode_executor = (
+            barcode_executor if barcode_executor is not None else ThreadPoolExecutor(max_concurrency)
+        )
+        self._cache = cache
+        self._catalog = catalog
+        self._preprocessing = preprocessing
+        self._prompt_fingerprint = self._make_prompt_fingerprint()
+        self._compiled_chains: dict[int, tuple[BaseChatModel, Runnable]] = {}
+        self._compiled_packed_chains: dict[int, tuple[BaseChatModel, Runnable]] = {}
+        self._compiled_price_chains: dict[int, tuple[BaseChatModel, Runnable]] = {}
+        self._compiled_chains_lock = Lock()
 
     def process(self, images: list[Image]) -> ProcessingResult:
-        input_data = [self._make_input_data(image) for image in images]
+        model = self._model_factory.get_model()
         result = _PriceTagProcessingResult(self._chain_stage_descriptions)
-        chain = self._prompt | self._model_factory.get_model() | self._parser
-        chain = chain.with_listeners(on_error=result.add_error_from_run_tree)
-        outputs = chain.batch(input_data, RunnableConfig(max_concurrency=self._max_concurrency), return_exceptions=True)
-        result.set_products_from_outputs(images, outputs)
-        self._adjust_barcodes(result)
+        barcodes = self._start_reading_barcodes(images)
+        uncached_images, input_data = self._prepare_inputs(images, model, result, barcodes)
+        known_products = self._find_catalog_products(uncached_images, barcodes)
+        known_images, known_input_data, uncached_images, input_data = self._split_known_images(
+            uncached_images, input_data, known_products
+        )
+        if known_images:
+            outputs = self._extract_prices(model, known_images, known_input_data, known_products, result)
+            self._set_products_from_outputs(known_images, outputs, model, result)
+        if uncached_images:
+            outputs = self._extract(model, input_data, result)
+            self._set_products_from_outputs(uncached_images, outputs, model, result)
+        self._adjust_barcodes(result, barcodes)
+        self._update_catalog(result)
+        return result
+
+    async def aprocess(self, images: list[Image]) -> ProcessingResult:
+        model = self._model_factory.get_model()
+        result = _PriceTagProcessingResult(self._chain_stage_descriptions)
+        barcodes = self._start_reading_barcodes(images)
+        uncached_images, input_data = await asyncio.to_thread(self._prepare_inputs, images, model, result, barcodes)
+        known_products = await self._afind_catalog_products(uncached_images, barcodes)
+        known_images, known_input_data, uncached_images, input_data = self._split_known_images(
+            uncached_images, input_data, known_products
+        )
+        if known_images:
+            outputs = await self._aextract_prices(model, known_images, known_input_data, known_products, result)
+            await asyncio.to_thread(self._set_products_from_outputs, known_images, outputs, model, result)
+        if uncached_images:
+            outputs = await self._aextract(model, input_data, result)
+            await asyncio.to_thread(self._set_products_from_outputs, uncached_images, outputs, model, result)
+        await self._aadjust_barcodes(result, barcodes)
+        await asyncio.to_thread(self._update_catalog, result)
         return result
 
-    def _make_input_data(self, image: Image) -> dict[str, str]:
-        return {
-            "image": image.data,
-            "image_id": image.id,
-            "format_instructions": self._parser_format_instructions,
-            "categories": self._categories_instructions,
+    def _find_catalog_products(
+        self, images: list[Image], barcodes: dict[str, Future[list[DecodedBarcode]]]
+    ) -> dict[str, Product]:
+        # Waiting for the barcodes before the model call only pays off when there is a catalog to look them up in
+        if isinstance(self._catalog, NoProductCatalog) or not images:
+            return {}
+        image_barcodes = {
+            image.id: self._first_barcode(self._wait_for_barcodes(barcodes.get(image.id))) for image in images
         }
+        return self._lookup_catalog(image_barcodes)
+
+    async def _afind_catalog_products(
+        self, images: list[Image], barcodes: dict[str, Future[list[DecodedBarcode]]]
+    ) -> dict[str, Product]:
+        if isinstance(self._catalog, NoProductCatalog) or not images:
+            return {}
+        image_barcodes = await asyncio.gather(*(self._await_barcodes(barcodes.get(image.id)) for image in images))
+        return await asyncio.to_thread(
+            self._lookup_catalog,
+            {image.id: self._first_barcode(barcodes) for image, barcodes in zip(images, image_barcodes)},
+        )
+
+    @staticmethod
+    def _wait_for_barcodes(barcodes: Future[list[DecodedBarcode]] | None) -> list[DecodedBarcode]:
+        try:
+            return barcodes.result() if barcodes is not None else []
+        except Exception:
+            return []
+
+    @staticmethod
+    async def _await_barcodes(barcodes: Future[list[DecodedBarcode]] | None) -> list[DecodedBarcode]:
+        try:
+            return await asyncio.wrap_future(barcodes) if barcodes is not None else []
+        except Exception:
+            return []
+
+    @staticmethod
+    def _first_barcode(barcodes: list[DecodedBarcode]) -> str | None:
+        return barcodes[0].value if barcodes else None
+
+    def _lookup_catalog(self, image_barcodes: dict[str, str | None]) -> dict[str, Product]:
+        known_products = {}
+        for image_id, barcode in image_barcodes.items():
+            if barcode and (product := self._get_catalog_product(barcode)) is not None:
+                known_products[image_id] = product
+        return known_products
+
+    def _get_catalog_product(self, barcode: str) -> Product | None:
+        try:
+            return self._catalog.get(barcode)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _split_known_images(
+        images: list[Image], input_data: list[dict[str, str]], known_products: dict[str, Product]
+    ) -> tuple[list[Image], list[dict[str, str]], list[Image], list[dict[str, str]]]:
+        known_images, known_input_data, unknown_images, unknown_input_data = [], [], [], []
+        for image, image_input_data in zip(images, input_data):
+            if image.id in known_products:
+                known_images.append(image)
+                known_input_data.append({**image_input_data, "product_name": known_products[image.id].name})
+            else:
+                unknown_images.append(image)
+                unknown_input_data.append(image_input_data)
+        return known_images, known_input_data, unknown_images, unknown_input_data
+
+    def _extract_prices(
+        self,
+        model: BaseChatModel,
+        images: list[Image],
+        input_data: list[dict[str, str]],
+        known_products: dict[str, Product],
+        result: _PriceTagProcessingResult,
+    ) -> list[Output]:
+        chain = self._make_price_chain(model, result)
+        outputs = chain.batch(input_data, self._make_batch_config(), return_exceptions=True)
+        return self._make_products_from_prices(images, outputs, known_products)
+
+    async def _aextract_prices(
+        self,
+        model: BaseChatModel,
+        images: list[Image],
+        input_data: list[dict[str, str]],
+        known_products: dict[str, Product],
+        result: _PriceTagProcessingResult,
+    ) -> list[Output]:
+        chain = self._make_price_chain(model, result)
+        outputs = await chain.abatch(input_data, self._make_batch_config(), return_exceptions=True)
+        return self._make_products_from_prices(images, outputs, known_products)
+
+    @staticmethod
+    def _make_products_from_prices(
+        images: list[Image], outputs: list[Output], known_products: dict[str, Product]
+    ) -> list[Output]:
+        return [
+            (
+                known_products[image.id].model_copy(update={"price": output.price})
+                if isinstance(output, _Price)
+                else output
+            )
+            for image, output in zip(images, outputs)
+        ]
 
-    def _adjust_barcodes(self, result: _PriceTagProcessingResult):
+    def _update_catalog(self, result: _PriceTagProcessingResult):
         for product_result in result.product_results:
-            self._adjust_barcode(product_result)
+            if product_result.is_barcode_checked:
+                self._put_catalog_product(product_result.output)
 
-    def _adjust_barcode(self, result: PerImageProcessingResult):
-        image_data = result.input_image.data
-        product = result.output
+    def _put_catalog_product(self, product: Product):
+        try:
+            self._catalog.put(product)
+        except Exception:
+            return
+
+    def _extract(
+        self, model: BaseChatModel, input_data: list[dict[str, str]], result: _PriceTagProcessingResult
+    ) -> list[Output]:
+        if self._images_per_request <= 1:
+            return self._make_chain(model, result).batch(input_data, self._make_batch_config(), return_exceptions=True)
+        packs = self._make_packs(input_data)
+        packed_outputs = self._make_packed_chain(model).batch(
+            [self._make_packed_input_data(pack) for pack in packs], self._make_batch_config(), return_exceptions=True
+        )
+        outputs = self._unpack_outputs(packs, packed_outputs)
+        unpacked_indices = [index for index, output in enumerate(outputs) if output is None]
+        if unpacked_indices:
+            retried_outputs = self._make_chain(model, result).batch(
+                [input_data[index] for index in unpacked_indices], self._make_batch_config(), return_exceptions=True
+            )
+            for index, output in zip(unpacked_indices, retried_outputs):
+                outputs[index] = output
+        return outputs
+
+    async def _aextract(
+        self, model: BaseChatModel, input_data: list[dict[str, str]], result: _PriceTagProcessingResult
+    ) -> list[Output]:
+        if self._images_per_request <= 1:
+            chain = self._make_chain(model, result)
+            return await chain.abatch(input_data, self._make_batch_config(), return_exceptions=True)
+        packs = self._make_packs(input_data)
+        packed_outputs = await self._make_packed_chain(model).abatch(
+            [self._make_packed_input_data(pack) for pack in packs], self._make_batch_config(), return_exceptions=True
+        )
+        outputs = self._unpack_outputs(packs, packed_outputs)
+        unpacked_indices = [index for index, output in enumerate(outputs) if output is None]
+        if unpacked_indices:
+            retried_outputs = await self._make_chain(model, result).abatch(
+                [input_data[index] for index in unpacked_indices], self._make_batch_config(), return_exceptions=True
+            )
+            for index, output in zip(unpacked_indices, retried_outputs):
+                outputs[index] = output
+        return outputs
+
+    def _make_batch_config(self) -> RunnableConfig:
+        return RunnableConfig(max_concurrency=self._max_concurrency, callbacks=self._callbacks)
+
+    def _make_packs(self, input_data: list[dict[str, str]]) -> list[list[dict[str, str]]]:
+        packs: list[list[dict[str, str]]] = []
+        for image_input_data in input_data:
+            if not packs or len(packs[-1]) == self._images_per_request:
+                packs.append([])
+            packs[-1].append(image_input_data)
+        return packs
+
+    def _make_packed_chain(self, model: BaseChatModel) -> Runnable:
+        return self._get_compiled_chain(model, self._compiled_packed_chains, self._compile_packed_chain)
+
+    def _compile_packed_chain(self, model: BaseChatModel) -> Runnable:
+        prompt = self._packed_prompt.partial(
+            format_instructions=self._packed_parser_format_instructions, categories=self._categories_instructions
+        )
+        return prompt | self._make_parsing_model(model, self._packed_parser)
+
+    def _make_packed_input_data(self, pack: list[dict[str, str]]) -> dict[str, Any]:
+        content: list[dict[str, Any]] = []
+        for image_index, image_input_data in enumerate(pack, start=1):
+            content.append({"type": "text", "text": f"Image {image_index}:"})
+            content.append({"type": "image_url", "image_url": {"url": image_input_data["image"]}})
+        return {"images": [HumanMessage(content=content)]}
+
+    @staticmethod
+    def _unpack_outputs(packs: list[list[dict[str, str]]], packed_outputs: list[Output]) -> list[Output | None]:
+        # Images missing from a malformed or incomplete packed response are left as None to be re-run on their own
+        outputs: list[Output | None] = []
+        for pack, packed_output in zip(packs, packed_outputs):
+            products = packed_output.by_image_index() if isinstance(packed_output, _PackedProducts) else {}
+            outputs.extend(products.get(image_index) for image_index in range(1, len(pack) + 1))
+        return outputs
+
+    def _make_chain(self, model: BaseChatModel, result: _PriceTagProcessingResult) -> Runnable:
+        chain = self._get_compiled_chain(model, self._compiled_chains, self._compile_chain)
+        return chain.with_listeners(on_error=result.add_error_from_run_tree)
+
+    def _make_price_chain(self, model: BaseChatModel, result: _PriceTagProcessingResult) -> Runnable:
+        chain = self._get_compiled_chain(model, self._compiled_price_chains, self._compile_price_chain)
+        return chain.with_listeners(on_error=result.add_error_from_run_tree)
+
+    def _compile_price_chain(self, model: BaseChatModel) -> Runnable:
+        prompt = self._price_prompt.partial(format_instructions=self._price_parser_format_instructions)
+        return prompt | self._make_parsing_model(model, self._price_parser)
+
+    def _compile_chain(self, model: BaseChatModel) -> Runnable:
+        prompt = self._prompt.partial(
+            format_instructions=self._parser_format_instructions, categories=self._categories_instructions
+        )
+        return prompt | self._make_parsing_model(model, self._parser)
+
+    def _make_parsing_model(self, model: BaseChatModel, parser: PydanticOutputParser) -> Runnable:
+        if self._structured_output:
+            return model.with_structured_output(parser.pydantic_object)
+        return model | parser
+
+    def _get_compiled_chain(
+        self,
+        model: BaseChatModel,
+        compiled_chains: dict[int, tuple[BaseChatModel, Runnable]],
+        compile_chain: Callable[[BaseChatModel], Runnable],
+    ) -> Runnable:
+        # Models are not hashable, so chains are keyed by the model id and the model is kept to detect a reused id
+        with self._compiled_chains_lock:
+            compiled = compiled_chains.get(id(model))
+            if compiled is None or compiled[0] is not model:
+                compiled = (model, compile_chain(model))
+                compiled_chains[id(model)] = compiled
+            return compiled[1]
+
+    def _prepare_inputs(
+        self,
+        images: list[Image],
+        model: BaseChatModel,
+        result: _PriceTagProcessingResult,
+        barcodes: dict[str, Future[list[DecodedBarcode]]],
+    ) -> tuple[list[Image], list[dict[str, str]]]:
+        uncached_images = self._add_cached_products(images, model, result)
+        result.set_inputs(uncached_images)
+        # Preprocessors that need barcodes (e.g. the price tag cropper) reuse the ones read for the products
+        image_urls = self._preprocessing.prepare(
+            uncached_images, lambda image: self._wait_for_barcodes(barcodes.get(image.id))
+        )
+        input_data = [self._make_input_data(image, image_url) for image, image_url in zip(uncached_images, image_urls)]
+        return uncached_images, input_data
+
+    def _add_cached_products(
+        self, images: list[Image], model: BaseChatModel, result: _PriceTagProcessingResult
+    ) -> list[Image]:
+        cache_context = self._make_cache_context(model)
+        uncached_images = []
+        for image in images:
+            product = self._get_cached_product(image, cache_context)
+            if product is None:
+                uncached_images.append(image)
+            else:
+                result.add_product(image, product)
+        return uncached_images
+
+    def _get_cached_product(self, image: Image, cache_context: str) -> Product | None:
+        try:
+            return self._cache.get(image, cache_context, self._cached_product_type)
+        except Exception:
+            return None
+
+    def _set_products_from_outputs(
+        self, images: list[Image], outputs: list[Output], model: BaseChatModel, result: _PriceTagProcessingResult
+    ):
+        result.set_products_from_outputs(images, outputs)
+        cache_context = self._make_cache_context(model)
+        for image, output in zip(images, outputs):
+            if isinstance(output, self._cached_product_type):
+                self._put_cached_product(image, cache_context, output)
+
+    def _put_cached_product(self, image: Image, cache_context: str, product: Product):
+        try:
+            self._cache.put(image, cache_context, product)
+        except Exception:
+            return
+
+    def _make_cache_context(self, model: BaseChatModel) -> str:
+        model_name = getattr(model, "model_name", None) or getattr(model, "model", None) or type(model).__name__
+        return f"{model_name}:{self._prompt_fingerprint}"
+
+    def _make_prompt_fingerprint(self) -> str:
+        prompt_parts = [
+            repr(self._prompt.messages),
+            self._parser_format_instructions,
+            self._categories_instructions,
+            repr(self._preprocessing),
+        ]
+        if self._images_per_request > 1:
+            prompt_parts += [repr(self._packed_prompt.messages), self._packed_parser_format_instructions]
+        prompt = "\n".join(prompt_parts)
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    def _make_input_data(self, image: Image, image_url: str) -> dict[str, str]:
+        return {"image": image_url, "image_id": image.id}
+
+    def _start_reading_barcodes(self, images: list[Image]) -> dict[str, Future[list[DecodedBarcode]]]:
+        return {image.id: self._barcode_executor.submit(self._barcode_reader.read_barcodes, image) for image in images}
+
+    def _adjust_barcodes(self, result: _PriceTagProcessingResult, barcodes: dict[str, Future[list[DecodedBarcode]]]):
+        for product_result in result.product_results:
+            self._adjust_barcode(product_result, barcodes.get(product_result.input_image.id))
+        self._cancel_reading_barcodes(barcodes)
+
+    async def _aadjust_barcodes(
+        self, result: _PriceTagProcessingResult, barcodes: dict[str, Future[list[DecodedBarcode]]]
+    ):
+        await asyncio.gather(
+            *(
+                self._aadjust_barcode(product_result, barcodes.get(product_result.input_image.id))
+                for product_result in result.product_results
+            )
+        )
+        self._cancel_reading_barcodes(barcodes)
+
+    def _adjust_barcode(self, result: PerImageProcessingResult, barcodes: Future[list[DecodedBarcode]] | None):
+        if barcodes is None:
+            return
         try:
-            barcode = self._barcode_reader.read_barcode(image_data)
-            if barcode:
-                product.barcode = barcode
-                result.is_barcode_checked = True
+            self._set_barcode(result, barcodes.result())
         except Exception:
             return
+
+    async def _aadjust_barcode(self, result: PerImageProcessingResult, barcodes: Future[list[DecodedBarcode]] | None):
+        if barcodes is None:
+            return
+        try:
+            self._set_barcode(result, await asyncio.wrap_future(barcodes))
+        except Exception:
+            return
+
+    def _set_barcode(self, result: PerImageProcessingResult, barcodes: list[DecodedBarcode]):
+        self._set_barcode_value(result, self._first_barcode(barcodes))
+
+    @staticmethod
+    def _set_barcode_value(result: PerImageProcessingResult, barcode: str | None):
+        if barcode:
+            result.output.barcode = barcode
+            result.is_barcode_checked = True
+
+    @staticmethod
+    def _cancel_reading_barcodes(barcodes: dict[str, Future[Any]]):
+        # Failed images need no barcode, so their reading is dropped if it has not started yet
+        for barcode in barcodes.values():
+            barcode.cancel()
+
+
+class ScoredPriceTagImageProcessor(PriceTagImageProcessor):
+    _parser = PydanticOutputParser(pydantic_object=ScoredProduct)
+    _cached_product_type = ScoredProduct
+
+
+class ShelfImageProcessor(PriceTagImageProcessor):
+    _prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                """
+Extract product data from every product price tag in the image of a store shelf.
+For every product, also return the region of its price tag as fractions of the image width and height.
+As a category, use only one from the following list:
+  {categories}
+
+{format_instructions}
+""",
+            ),
+            (
+                "user",
+                [
+                    {"type": "text", "text": "process_image"},
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": "{image}"},
+                    },
+                ],
+            ),
+        ]
+    )
+    _parser = PydanticOutputParser(pydantic_object=_ShelfProducts)
+
+    def __init__(
+        self,
+        model_factory: ModelFactory,
+        categories: list[str] | None = None,
+        max_concurrency: int = 4,
+        preprocessing: ImagePreprocessing = ImagePreprocessing(),
+        barcode_executor: Executor | None = None,
+        structured_output: bool = False,
+        callbacks: list[BaseCallbackHandler] | None = None,
+        barcode_decoder: BarcodeDecoder = PyzbarBarcodeDecoder(),
+        barcode_cache: BarcodeCache = NoBarcodeCache(),
+    ):
+        super().__init__(
+            model_factory,
+            categories,
+            max_concurrency,
+            preprocessing=preprocessing,
+            barcode_executor=barcode_executor,
+            structured_output=structured_output,
+            callbacks=callbacks,
+            barcode_decoder=barcode_decoder,
+            barcode_cache=barcode_cache,
+        )
+
+    def _set_products_from_outputs(
+        self, images: list[Image], outputs: list[Output], model: BaseChatModel, result: _PriceTagProcessingResult
+    ):
+        for image, output in zip(images, outputs):
+            if not isinstance(output, _ShelfProducts):
+                continue
+            if not output.products:
+                result.add_error(image, ProcessingError("No price tags found in the image"))
+            for product in output.products:
+                result.add_product(image, product)
+
+    def _set_barcode(self, result: PerImageProcessingResult, barcodes: list[DecodedBarcode]):
+        region = result.output.region
+        barcode = next(
+            (barcode.value for barcode in barcodes if region.contains(barcode.center_x, barcode.center_y)), None
+        )
+        self._set_barcode_value(result, barcode)
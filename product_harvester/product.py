@@ -11,3 +11,23 @@ class Product(BaseModel):
     barcode: Optional[str] = Field(default="")
     brand: Optional[str] = Field(strict=True, default="")
     category: str = Field(strict=True, min_length=1)
+
+
+class ProductRegion(BaseModel):
+    x_min: float = Field(ge=0, le=1)
+    y_min: float = Field(ge=0, le=1)
+    x_max: float = Field(ge=0, le=1)
+    y_max: float = Field(ge=0, le=1)
+
+    def contains(self, x: float, y: float) -> bool:
+        return self.x_min <= x <= self.x_max and self.y_min <= y <= self.y_max
+
+
+class ShelfProduct(Product):
+    region: ProductRegion = Field(description="Region of the price tag as fractions of the image width and height")
+
+
+class ScoredProduct(Product):
+    confidence: float = Field(
+        ge=0, le=1, description="Confidence from 0 to 1 that all the extracted data matches the price tag"
+    )
@@ -0,0 +1,103 @@
+import asyncio
+from abc import ABC, abstractmethod
+
+import cv2
+import numpy as np
+
+from product_harvester.image import Image
+from product_harvester.processors import ImageProcessor, PerImageProcessingResult, ProcessingError, ProcessingResult
+
+
+class ImageQualityCheck(ABC):
+    @abstractmethod
+    def check(self, grayscale: np.ndarray) -> ProcessingError | None: ...
+
+
+class ResolutionCheck(ImageQualityCheck):
+    def __init__(self, min_short_edge: int = 200):
+        self._min_short_edge = min_short_edge
+
+    def check(self, grayscale: np.ndarray) -> ProcessingError | None:
+        height, width = grayscale.shape[:2]
+        if min(height, width) < self._min_short_edge:
+            return ProcessingError(
+                "Image resolution is too low", f"{width}x{height} is below {self._min_short_edge} px on the short edge"
+            )
+        return None
+
+
+class ExposureCheck(ImageQualityCheck):
+    def __init__(self, min_brightness: float = 25, max_brightness: float = 235, min_contrast: float = 10):
+        self._min_brightness = min_brightness
+        self._max_brightness = max_brightness
+        self._min_contrast = min_contrast
+
+    def check(self, grayscale: np.ndarray) -> ProcessingError | None:
+        brightness = float(grayscale.mean())
+        contrast = float(grayscale.std())
+        if brightness < self._min_brightness:
+            return ProcessingError("Image is too dark", f"Mean brightness {brightness:.1f} < {self._min_brightness}")
+        if brightness > self._max_brightness:
+            return ProcessingError("Image is too bright", f"Mean brightness {brightness:.1f} > {self._max_brightness}")
+        if contrast < self._min_contrast:
+            return ProcessingError("Image is blank", f"Brightness deviation {contrast:.1f} < {self._min_contrast}")
+        return None
+
+
+class BlurCheck(ImageQualityCheck):
+    def __init__(self, min_sharpness: float = 50, long_edge: int = 512):
+        self._min_sharpness = min_sharpness
+        self._long_edge = long_edge
+
+    def check(self, grayscale: np.ndarray) -> ProcessingError | None:
+        # Variance of the Laplacian depends on the resolution, so it is measured at a fixed size
+        height, width = grayscale.shape[:2]
+        scale = self._long_edge / max(height, width)
+        size = (max(round(width * scale), 1), max(round(height * scale), 1))
+        resized = cv2.resize(grayscale, size, interpolation=cv2.INTER_AREA)
+        sharpness = float(cv2.Laplacian(resized, cv2.CV_64F).var())
+        if sharpness < self._min_sharpness:
+            return ProcessingError("Image is too blurry", f"Laplacian variance {sharpness:.1f} < {self._min_sharpness}")
+        return None
+
+
+class QualityFilteringImageProcessor(ImageProcessor):
+    def __init__(self, processor: ImageProcessor, checks: list[ImageQualityCheck] | None = None):
+        self._processor = processor
+        self._checks = checks if checks is not None else [ResolutionCheck(), ExposureCheck(), BlurCheck()]
+
+    def process(self, images: list[Image]) -> ProcessingResult:
+        rejections = [self._check_image(image) for image in images]
+        accepted_images = [image for image, rejection in zip(images, rejections) if rejection is None]
+        result = self._processor.process(accepted_images) if accepted_images else None
+        return self._make_result(images, rejections, result)
+
+    async def aprocess(self, images: list[Image]) -> ProcessingResult:
+        rejections = await asyncio.gather(*(asyncio.to_thread(self._check_image, image) for image in images))
+        accepted_images = [image for image, rejection in zip(images, rejections) if rejection is None]
+        result = await self._processor.aprocess(accepted_images) if accepted_images else None
+        return self._make_result(images, rejections, result)
+
+    def _check_image(self, image: Image) -> ProcessingError | None:
+        try:
+            grayscale = image.load_array(grayscale=True)
+        except Exception:
+            # Images which cannot be decoded are not judged here, the wrapped processor reports their errors
+            return None
+        for check in self._checks:
+            if (rejection := check.check(grayscale)) is not None:
+                return rejection
+        return None
+
+    @staticmethod
+    def _make_result(
+        images: list[Image], rejections: list[ProcessingError | None], result: ProcessingResult | None
+    ) -> ProcessingResult:
+        results = [
+            PerImageProcessingResult(input_image=image, output=rejection)
+            for image, rejection in zip(images, rejections)
+            if rejection is not None
+        ]
+        if result is not None:
+            results = result.results + results
+        return ProcessingResult(results)
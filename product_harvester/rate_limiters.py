@@ -0,0 +1,75 @@
+import asyncio
+import sqlite3
+import time
+from threading import Lock
+
+from langchain_core.rate_limiters import BaseRateLimiter
+
+
+class SQLiteRateLimiter(BaseRateLimiter):
+    def __init__(
+        self,
+        db_path: str,
+        key: str,
+        requests_per_second: float = 1,
+        check_every_n_seconds: float = 0.1,
+        max_bucket_size: float = 1,
+    ):
+        self.requests_per_second = requests_per_second
+        self._db_path = db_path
+        self._key = key
+        self._check_every_n_seconds = check_every_n_seconds
+        self._max_bucket_size = max_bucket_size
+        # Transactions are started explicitly, so that other processes wait for the whole read and update of the bucket
+        self._connection = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = Lock()
+        self._create_table()
+
+    def _create_table(self):
+        with self._lock:
+            self._connection.execute("""
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+""")
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        if not blocking:
+            return self._consume()
+        while not self._consume():
+            time.sleep(self._check_every_n_seconds)
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        if not blocking:
+            return await asyncio.to_thread(self._consume)
+        while not await asyncio.to_thread(self._consume):
+            await asyncio.sleep(self._check_every_n_seconds)
+        return True
+
+    def _consume(self) -> bool:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._connection.execute(
+                    "SELECT tokens, updated_at FROM buckets WHERE key = ?", (self._key,)
+                ).fetchone()
+                tokens = self._max_bucket_size if row is None else self._refill(row[0], now - row[1])
+                consumed = tokens >= 1
+                if consumed:
+                    tokens -= 1
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (self._key, tokens, now),
+                )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            return consumed
+
+    def _refill(self, tokens: float, elapsed: float) -> float:
+        return min(tokens + max(elapsed, 0) * self.requests_per_second, self._max_bucket_size)
@@ -1,8 +1,9 @@
+import asyncio
 import os
 from abc import ABC, abstractmethod
 from glob import glob
 from pathlib import Path
-from typing import Generator, Any, Self
+from typing import AsyncGenerator, AsyncIterator, Generator, Any, Iterator, Self, TypeVar
 
 from tqdm import tqdm
 
@@ -10,11 +11,22 @@ from product_harvester.clients.google_drive_client import GoogleDriveClient
 from product_harvester.image import Image, ImageMeta
 from product_harvester.product import Product
 
+_T = TypeVar("_T")
+
+
+async def _iterate_in_thread(iterator: Iterator[_T]) -> AsyncGenerator[_T, None]:
+    end = object()
+    while (item := await asyncio.to_thread(next, iterator, end)) is not end:
+        yield item
+
 
 class ImagesRetriever(ABC):
     @abstractmethod
     def retrieve_images(self) -> Generator[Image, None, None]: ...
 
+    def aretrieve_images(self) -> AsyncIterator[Image]:
+        return _iterate_in_thread(self.retrieve_images())
+
 
 class LocalImagesRetriever(ImagesRetriever):
     _image_extensions = (".jpg", ".jpeg", ".png")
@@ -79,15 +91,15 @@ class GoogleDriveImagesRetriever(ImagesRetriever):
 
     def retrieve_images(self) -> Generator[str, None, None]:
         for file in self._client.get_image_files_info(self._folder_id):
-            data = self._client.download_file_content(file)
-            yield Image(id=file.id, data=data)
+            content = self._client.download_file_content(file)
+            yield Image.from_bytes(file.id, content, file.mime_type)
 
 
 class GoogleDriveImagesRetrieverWithMeta(GoogleDriveImagesRetriever):
     def retrieve_images(self) -> Generator[str, None, None]:
         for file in self._client.get_image_files_info(self._folder_id):
-            data = self._client.download_file_content(file)
-            yield Image(id=file.id, data=data, meta=_ImageMeta(self._stem_file_name(file.name)))
+            content = self._client.download_file_content(file)
+            yield Image.from_bytes(file.id, content, file.mime_type, meta=_ImageMeta(self._stem_file_name(file.name)))
 
     @staticmethod
     def _stem_file_name(path: str) -> str:
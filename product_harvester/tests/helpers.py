@@ -0,0 +1,11 @@
+import base64
+
+import cv2
+import numpy as np
+
+from product_harvester.image import Image
+
+
+def make_image(image_id: str, array: np.ndarray) -> Image:
+    _, encoded = cv2.imencode(".png", array)
+    return Image(id=image_id, data=f"data:image/png;base64,{base64.b64encode(encoded.tobytes()).decode()}")
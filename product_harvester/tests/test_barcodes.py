@@ -0,0 +1,122 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, Mock, patch
+
+import cv2
+import numpy as np
+
+from product_harvester.barcodes import (
+    BarcodeBenchmark,
+    DecodedBarcode,
+    MultiScaleBarcodeDecoder,
+    OpenCVBarcodeDecoder,
+    PyzbarBarcodeDecoder,
+    benchmark_barcode_decoders,
+    format_barcode_benchmark,
+)
+from product_harvester.image import Image
+
+_EAN13_CODES = {
+    "L": ["0001101", "0011001", "0010011", "0111101", "0100011", "0110001", "0101111", "0111011", "0110111", "0001011"],
+    "G": ["0100111", "0110011", "0011011", "0100001", "0011101", "0111001", "0000101", "0010001", "0001001", "0010111"],
+    "R": ["1110010", "1100110", "1101100", "1000010", "1011100", "1001110", "1010000", "1000100", "1001000", "1110100"],
+}
+_EAN13_PARITIES = ["LLLLLL", "LLGLGG", "LLGGLG", "LLGGGL", "LGLLGG", "LGGLLG", "LGGGLL", "LGLGLG", "LGLGGL", "LGGLGL"]
+
+
+def _make_ean13(barcode: str, module: int = 2, height: int = 100, canvas: tuple[int, int] = (480, 640)) -> np.ndarray:
+    digits = [int(digit) for digit in barcode]
+    parity = _EAN13_PARITIES[digits[0]]
+    left = "".join(_EAN13_CODES[parity[index]][digit] for index, digit in enumerate(digits[1:7]))
+    right = "".join(_EAN13_CODES["R"][digit] for digit in digits[7:])
+    bits = "101" + left + "01010" + right + "101"
+    image = np.full(canvas, 255, dtype=np.uint8)
+    top = (canvas[0] - height) // 2
+    start = (canvas[1] - len(bits) * module) // 2
+    for index, bit in enumerate(bits):
+        if bit == "1":
+            image[top : top + height, start + index * module : start + (index + 1) * module] = 0  # noqa: E203
+    return cv2.GaussianBlur(image, (3, 3), 0)
+
+
+class TestPyzbarBarcodeDecoder(TestCase):
+    @patch("product_harvester.barcodes.decode")
+    def test_decode_with_centers(self, mock_decode):
+        mock_barcode = MagicMock()
+        mock_barcode.data.decode.return_value = "654321"
+        mock_barcode.rect = MagicMock(left=10, top=50, width=20, height=10)
+        mock_decode.return_value = [mock_barcode]
+        grayscale = np.zeros((100, 200), dtype=np.uint8)
+        self.assertEqual(PyzbarBarcodeDecoder().decode(grayscale), [DecodedBarcode("654321", 0.1, 0.55)])
+        mock_decode.assert_called_once_with(grayscale)
+
+
+class TestOpenCVBarcodeDecoder(TestCase):
+    def test_decode(self):
+        barcodes = OpenCVBarcodeDecoder().decode(_make_ean13("5901234123457"))
+        self.assertEqual(len(barcodes), 1)
+        self.assertEqual(barcodes[0].value, "5901234123457")
+        self.assertAlmostEqual(barcodes[0].center_x, 0.5, delta=0.05)
+        self.assertAlmostEqual(barcodes[0].center_y, 0.5, delta=0.05)
+
+    def test_decode_nothing(self):
+        self.assertEqual(OpenCVBarcodeDecoder().decode(np.full((300, 400), 255, dtype=np.uint8)), [])
+
+
+class TestMultiScaleBarcodeDecoder(TestCase):
+    def test_downscaled_first(self):
+        decoder = Mock()
+        decoder.decode.return_value = [DecodedBarcode("123", 0.5, 0.5)]
+        grayscale = np.zeros((1000, 2000), dtype=np.uint8)
+        barcodes = MultiScaleBarcodeDecoder(decoder, max_long_edge=500).decode(grayscale)
+        self.assertEqual(barcodes, [DecodedBarcode("123", 0.5, 0.5)])
+        decoder.decode.assert_called_once()
+        self.assertEqual(decoder.decode.call_args.args[0].shape, (250, 500))
+
+    def test_escalates_to_full_resolution(self):
+        decoder = Mock()
+        decoder.decode.side_effect = [[], [DecodedBarcode("123", 0.5, 0.5)]]
+        grayscale = np.zeros((1000, 2000), dtype=np.uint8)
+        MultiScaleBarcodeDecoder(decoder, max_long_edge=500).decode(grayscale)
+        self.assertEqual([call.args[0].shape for call in decoder.decode.call_args_list], [(250, 500), (1000, 2000)])
+
+    def test_small_images_are_not_downscaled(self):
+        decoder = Mock()
+        decoder.decode.return_value = []
+        MultiScaleBarcodeDecoder(decoder, max_long_edge=500, rotations=()).decode(np.zeros((100, 200), dtype=np.uint8))
+        decoder.decode.assert_called_once()
+
+    def test_rotated_barcode_center_is_mapped_back(self):
+        barcode = _make_ean13("5901234123457", canvas=(600, 600))
+        rotation = cv2.getRotationMatrix2D((300, 300), 40, 1.0)
+        rotation[0, 2] += 50
+        rotated = cv2.warpAffine(barcode, rotation, (600, 600), borderValue=255)
+        decoder = Mock()
+        decoder.decode.side_effect = lambda grayscale: (
+            [] if grayscale.shape == (600, 600) else OpenCVBarcodeDecoder().decode(grayscale)
+        )
+
+        barcodes = MultiScaleBarcodeDecoder(decoder, rotations=(45, -45)).decode(rotated)
+
+        self.assertEqual([barcode.value for barcode in barcodes], ["5901234123457"])
+        self.assertAlmostEqual(barcodes[0].center_x, 350 / 600, delta=0.02)
+        self.assertAlmostEqual(barcodes[0].center_y, 0.5, delta=0.02)
+        self.assertEqual(decoder.decode.call_count, 2)
+
+
+class TestBarcodeBenchmark(TestCase):
+    def test_benchmark(self):
+        images = [Image(id="first", data="/first.png"), Image(id="second", data="/second.png")]
+        decoder = Mock()
+        decoder.decode.side_effect = [[DecodedBarcode("123", 0.5, 0.5)], []]
+        with patch.object(Image, "load_array", return_value=np.zeros((10, 10), dtype=np.uint8)) as mock_load_array:
+            report = benchmark_barcode_decoders({"mock": decoder}, images)
+        self.assertEqual(report["mock"].images, 2)
+        self.assertEqual(report["mock"].decode_rate, 0.5)
+        self.assertGreaterEqual(report["mock"].ms_per_image, 0)
+        mock_load_array.assert_called_with(grayscale=True)
+
+    def test_format(self):
+        report = format_barcode_benchmark({"opencv": BarcodeBenchmark(images=4, decoded_images=3, seconds=0.1)})
+        self.assertEqual(
+            report.splitlines(), ["decoder  images  decode_rate  ms/image", "opencv        4        75.0%      25.0"]
+        )
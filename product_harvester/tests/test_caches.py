@@ -0,0 +1,136 @@
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+from pydantic import ValidationError
+
+from product_harvester.barcodes import DecodedBarcode
+from product_harvester.caches import ExtractionCache, LRUBarcodeCache, NoExtractionCache, SQLiteExtractionCache
+from product_harvester.image import Image
+from product_harvester.product import Product, ScoredProduct
+
+
+class TestExtractionCache(TestCase):
+    def test_not_implemented(self):
+        with self.assertRaises(TypeError):
+            ExtractionCache().get(Image(id="image", data="/image.png"), "context")
+
+
+class TestNoExtractionCache(TestCase):
+    def test_always_misses(self):
+        cache = NoExtractionCache()
+        image = Image(id="image", data="/image.png")
+        product = Product(name="Milk", qty=1, qty_unit="l", price=1.2, category="drinks")
+        cache.put(image, "context", product)
+        self.assertIsNone(cache.get(image, "context"))
+
+
+class TestSQLiteExtractionCache(TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._db_path = str(Path(self._temp_dir.name) / "cache.sqlite")
+        self._product = Product(name="Milk", qty=1, qty_unit="l", price=1.2, category="drinks")
+        self._other_product = Product(name="Bread", qty=1, qty_unit="pcs", price=2.1, category="food")
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    @staticmethod
+    def _make_image(image_id: str, content: str) -> Image:
+        return Image(id=image_id, data=f"data:image/png;base64,{content}")
+
+    def test_hit_by_content_and_context(self):
+        cache = SQLiteExtractionCache(self._db_path)
+        cache.put(self._make_image("image1", "aW1hZ2U="), "model:prompt", self._product)
+        self.assertEqual(cache.get(self._make_image("copy_of_image1", "aW1hZ2U="), "model:prompt"), self._product)
+        self.assertIsNone(cache.get(self._make_image("image1", "aW1hZ2U="), "other_model:prompt"))
+        self.assertIsNone(cache.get(self._make_image("image1", "b3RoZXI="), "model:prompt"))
+
+    def test_product_type_fields_are_kept(self):
+        cache = SQLiteExtractionCache(self._db_path)
+        scored_product = ScoredProduct(**self._product.model_dump(), confidence=0.4)
+        cache.put(self._make_image("image1", "aW1hZ2U="), "context", scored_product)
+        cache.put(self._make_image("image2", "b3RoZXI="), "context", self._product)
+        self.assertEqual(cache.get(self._make_image("image1", "aW1hZ2U="), "context", ScoredProduct), scored_product)
+        with self.assertRaises(ValidationError):
+            cache.get(self._make_image("image2", "b3RoZXI="), "context", ScoredProduct)
+
+    def test_persisted_across_instances(self):
+        SQLiteExtractionCache(self._db_path).put(self._make_image("image1", "aW1hZ2U="), "context", self._product)
+        cache = SQLiteExtractionCache(self._db_path)
+        self.assertEqual(cache.get(self._make_image("image1", "aW1hZ2U="), "context"), self._product)
+
+    @patch("product_harvester.caches.time.time")
+    def test_age_eviction(self, mock_time):
+        mock_time.return_value = 1000
+        cache = SQLiteExtractionCache(self._db_path, max_age=timedelta(seconds=60))
+        cache.put(self._make_image("image1", "aW1hZ2U="), "context", self._product)
+        mock_time.return_value = 1060
+        self.assertEqual(cache.get(self._make_image("image1", "aW1hZ2U="), "context"), self._product)
+        mock_time.return_value = 1061
+        self.assertIsNone(cache.get(self._make_image("image1", "aW1hZ2U="), "context"))
+        cache.evict()
+        self.assertEqual(len(cache), 0)
+
+    @patch("product_harvester.caches.time.time")
+    def test_size_eviction_removes_least_recently_used(self, mock_time):
+        mock_time.return_value = 1000
+        cache = SQLiteExtractionCache(self._db_path, max_entries=2, eviction_interval=1)
+        cache.put(self._make_image("image1", "MQ=="), "context", self._product)
+        mock_time.return_value = 1001
+        cache.put(self._make_image("image2", "Mg=="), "context", self._other_product)
+        mock_time.return_value = 1002
+        cache.get(self._make_image("image1", "MQ=="), "context")
+        mock_time.return_value = 1003
+        cache.put(self._make_image("image3", "Mw=="), "context", self._product)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get(self._make_image("image1", "MQ=="), "context"), self._product)
+        self.assertIsNone(cache.get(self._make_image("image2", "Mg=="), "context"))
+        self.assertEqual(cache.get(self._make_image("image3", "Mw=="), "context"), self._product)
+
+
+class TestLRUBarcodeCache(TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._spill_path = str(Path(self._temp_dir.name) / "barcodes.sqlite")
+        self._barcodes = [DecodedBarcode("123", 0.25, 0.5)]
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    @staticmethod
+    def _make_image(image_id: str, content: str) -> Image:
+        return Image(id=image_id, data=f"data:image/png;base64,{content}")
+
+    def test_positive_and_negative_results(self):
+        cache = LRUBarcodeCache()
+        self.assertIsNone(cache.get(self._make_image("image1", "aW1hZ2U="), "decoder"))
+        cache.put(self._make_image("image1", "aW1hZ2U="), "decoder", self._barcodes)
+        cache.put(self._make_image("image2", "b3RoZXI="), "decoder", [])
+        self.assertEqual(cache.get(self._make_image("copy_of_image1", "aW1hZ2U="), "decoder"), self._barcodes)
+        self.assertEqual(cache.get(self._make_image("image2", "b3RoZXI="), "decoder"), [])
+        self.assertIsNone(cache.get(self._make_image("image1", "aW1hZ2U="), "other_decoder"))
+
+    def test_bounded(self):
+        cache = LRUBarcodeCache(max_entries=1)
+        cache.put(self._make_image("image1", "aW1hZ2U="), "decoder", self._barcodes)
+        cache.put(self._make_image("image2", "b3RoZXI="), "decoder", [])
+        self.assertEqual(len(cache), 1)
+        self.assertIsNone(cache.get(self._make_image("image1", "aW1hZ2U="), "decoder"))
+
+    def test_evicted_entries_are_spilled_to_disk(self):
+        cache = LRUBarcodeCache(max_entries=1, spill_path=self._spill_path)
+        cache.put(self._make_image("image1", "aW1hZ2U="), "decoder", self._barcodes)
+        cache.put(self._make_image("image2", "b3RoZXI="), "decoder", [])
+        self.assertEqual(cache.get(self._make_image("image1", "aW1hZ2U="), "decoder"), self._barcodes)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get(self._make_image("image2", "b3RoZXI="), "decoder"), [])
+
+    def test_spill_persisted_across_instances(self):
+        cache = LRUBarcodeCache(max_entries=1, spill_path=self._spill_path)
+        cache.put(self._make_image("image1", "aW1hZ2U="), "decoder", self._barcodes)
+        cache.put(self._make_image("image2", "b3RoZXI="), "decoder", [])
+        restarted_cache = LRUBarcodeCache(spill_path=self._spill_path)
+        self.assertEqual(restarted_cache.get(self._make_image("image1", "aW1hZ2U="), "decoder"), self._barcodes)
@@ -0,0 +1,161 @@
+import json
+import tempfile
+from pathlib import Path
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import AsyncMock, MagicMock, Mock
+
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage
+
+from product_harvester.caches import SQLiteExtractionCache
+from product_harvester.cascade import CascadingImageProcessor
+from product_harvester.image import Image
+from product_harvester.processors import (
+    PerImageProcessingResult,
+    ProcessingError,
+    ProcessingResult,
+    ScoredPriceTagImageProcessor,
+)
+from product_harvester.product import Product, ScoredProduct
+
+
+class TestCascadingImageProcessor(TestCase):
+    def setUp(self):
+        self._images = [Image(id="easy", data="/easy.jpg"), Image(id="hard", data="/hard.jpg")]
+        self._product = Product(name="Milk", qty=1, qty_unit="l", price=1.2, category="drinks")
+
+    def test_only_failed_images_are_escalated(self):
+        cheap, strong = Mock(), Mock()
+        cheap.process.return_value = ProcessingResult(
+            [
+                PerImageProcessingResult(input_image=self._images[0], output=self._product),
+                PerImageProcessingResult(input_image=self._images[1], output=ProcessingError("Failed")),
+            ]
+        )
+        strong.process.return_value = ProcessingResult(
+            [PerImageProcessingResult(input_image=self._images[1], output=self._product)]
+        )
+        processor = CascadingImageProcessor([cheap, strong])
+
+        result = processor.process(self._images)
+
+        strong.process.assert_called_once_with([self._images[1]])
+        self.assertEqual([product.input_image.id for product in result.product_results], ["easy", "hard"])
+        self.assertEqual(result.error_results, [])
+        self.assertEqual([tier_stats.hit_rate for tier_stats in processor.stats], [0.5, 1.0])
+        self.assertEqual([tier_stats.images for tier_stats in processor.stats], [2, 1])
+
+    def test_low_confidence_is_escalated(self):
+        cheap, strong = Mock(), Mock()
+        unsure = ScoredProduct(**self._product.model_dump(), confidence=0.4)
+        sure = ScoredProduct(**self._product.model_dump(), confidence=0.9)
+        cheap.process.return_value = ProcessingResult(
+            [
+                PerImageProcessingResult(input_image=self._images[0], output=sure),
+                PerImageProcessingResult(input_image=self._images[1], output=unsure),
+            ]
+        )
+        strong.process.return_value = ProcessingResult(
+            [PerImageProcessingResult(input_image=self._images[1], output=unsure)]
+        )
+
+        result = CascadingImageProcessor([cheap, strong], min_confidence=0.7).process(self._images)
+
+        strong.process.assert_called_once_with([self._images[1]])
+        self.assertEqual([product.output for product in result.product_results], [sure, unsure])
+
+    def test_last_tier_errors_are_kept(self):
+        cheap = Mock()
+        cheap.process.return_value = ProcessingResult(
+            [PerImageProcessingResult(input_image=self._images[0], output=ProcessingError("Failed"))]
+        )
+        processor = CascadingImageProcessor([cheap])
+        result = processor.process(self._images[:1])
+        self.assertEqual(len(result.error_results), 1)
+        self.assertEqual(processor.stats[0].accepted_images, 0)
+        self.assertEqual(processor.stats[0].calls, 1)
+
+    def test_missing_results_are_escalated(self):
+        cheap, strong = Mock(), Mock()
+        cheap.process.return_value = ProcessingResult([])
+        strong.process.return_value = ProcessingResult([])
+        CascadingImageProcessor([cheap, strong]).process(self._images)
+        strong.process.assert_called_once_with(self._images)
+
+    def test_products_without_confidence_are_escalated(self):
+        cheap, strong = Mock(), Mock()
+        cheap.process.return_value = ProcessingResult(
+            [PerImageProcessingResult(input_image=self._images[0], output=self._product)]
+        )
+        strong.process.return_value = ProcessingResult([])
+        CascadingImageProcessor([cheap, strong], min_confidence=0.5).process(self._images[:1])
+        strong.process.assert_called_once_with(self._images[:1])
+
+    def test_no_tiers(self):
+        with self.assertRaises(ValueError):
+            CascadingImageProcessor([])
+
+    def test_from_model_factories_asks_for_confidence(self):
+        response = json.dumps({**self._product.model_dump(), "confidence": 0.3})
+        cheap_factory, strong_factory = MagicMock(), MagicMock()
+        cheap_factory.get_model.return_value = FakeMessagesListChatModel(responses=[AIMessage(content=response)])
+        strong_factory.get_model.return_value = FakeMessagesListChatModel(responses=[AIMessage(content=response)])
+        processor = CascadingImageProcessor.from_model_factories(
+            [cheap_factory, strong_factory], min_confidence=0.5, max_concurrency=1
+        )
+
+        result = processor.process(self._images[:1])
+
+        self.assertEqual(result.product_results[0].output.confidence, 0.3)
+        strong_factory.get_model.assert_called_once()
+        self.assertEqual(processor.stats[0].hit_rate, 0.0)
+
+    def test_from_model_factories_rejects_products_without_confidence(self):
+        with self.assertRaises(ValueError):
+            CascadingImageProcessor.from_model_factories([MagicMock()], min_confidence=0.5, images_per_request=4)
+        with self.assertRaises(ValueError):
+            CascadingImageProcessor.from_model_factories([MagicMock()], min_confidence=0.5, catalog=Mock())
+
+    def test_cached_low_confidence_products_are_escalated(self):
+        image = Image(id="image", data="data:image/png;base64,aW1hZ2U=")
+        unsure_response = json.dumps({**self._product.model_dump(), "confidence": 0.3})
+        sure_response = json.dumps({**self._product.model_dump(), "confidence": 0.9})
+        cheap_factory = MagicMock()
+        cheap_factory.get_model.side_effect = [
+            FakeMessagesListChatModel(responses=[AIMessage(content=unsure_response)]),
+            FakeMessagesListChatModel(responses=[AIMessage(content=sure_response)]),
+        ]
+        strong = Mock()
+        strong.process.return_value = ProcessingResult([])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = SQLiteExtractionCache(str(Path(temp_dir) / "cache.sqlite"))
+            cheap = ScoredPriceTagImageProcessor(cheap_factory, max_concurrency=1, cache=cache)
+            processor = CascadingImageProcessor([cheap, strong], min_confidence=0.5)
+            processor.process([image])
+            processor.process([image])
+
+        # The second model would be confident, so only the cached confidence escalates the image again
+        self.assertEqual(strong.process.call_count, 2)
+        self.assertEqual(processor.stats[0].accepted_images, 0)
+
+
+class TestCascadingImageProcessorAsync(IsolatedAsyncioTestCase):
+    async def test_aprocess(self):
+        image = Image(id="image", data="/image.jpg")
+        product = Product(name="Milk", qty=1, qty_unit="l", price=1.2, category="drinks")
+        cheap, strong = Mock(), Mock()
+        cheap.aprocess = AsyncMock(
+            return_value=ProcessingResult([PerImageProcessingResult(input_image=image, output=ProcessingError("x"))])
+        )
+        strong.aprocess = AsyncMock(
+            return_value=ProcessingResult([PerImageProcessingResult(input_image=image, output=product)])
+        )
+        processor = CascadingImageProcessor([cheap, strong])
+
+        result = await processor.aprocess([image])
+
+        self.assertEqual(result.product_results[0].output, product)
+        self.assertEqual(
+            processor.stats[1].model_dump(exclude={"seconds"}), {"calls": 1, "images": 1, "accepted_images": 1}
+        )
+        self.assertGreater(processor.stats[1].mean_latency, 0)
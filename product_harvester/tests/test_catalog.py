@@ -0,0 +1,48 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from product_harvester.catalog import NoProductCatalog, SQLiteProductCatalog
+from product_harvester.product import Product, ProductRegion, ShelfProduct
+
+
+class TestNoProductCatalog(TestCase):
+    def test_nothing_is_stored(self):
+        catalog = NoProductCatalog()
+        catalog.put(Product(name="Milk", qty=1, qty_unit="l", price=1.2, barcode="123", category="drinks"))
+        self.assertIsNone(catalog.get("123"))
+
+
+class TestSQLiteProductCatalog(TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._db_path = str(Path(self._temp_dir.name) / "catalog.sqlite")
+        self._product = Product(name="Milk", qty=1, qty_unit="l", price=1.2, barcode="123", category="drinks")
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def test_put_and_get(self):
+        catalog = SQLiteProductCatalog(self._db_path)
+        self.assertIsNone(catalog.get("123"))
+        catalog.put(self._product)
+        self.assertEqual(catalog.get("123"), self._product)
+        catalog.put(self._product.model_copy(update={"price": 1.5}))
+        self.assertEqual(catalog.get("123").price, 1.5)
+        self.assertEqual(len(catalog), 1)
+
+    def test_persisted_across_instances(self):
+        SQLiteProductCatalog(self._db_path).put(self._product)
+        self.assertEqual(SQLiteProductCatalog(self._db_path).get("123"), self._product)
+
+    def test_products_without_barcode_are_skipped(self):
+        catalog = SQLiteProductCatalog(self._db_path)
+        catalog.put(self._product.model_copy(update={"barcode": ""}))
+        self.assertEqual(len(catalog), 0)
+
+    def test_only_product_fields_are_stored(self):
+        catalog = SQLiteProductCatalog(self._db_path)
+        region = ProductRegion(x_min=0, y_min=0, x_max=1, y_max=1)
+        catalog.put(ShelfProduct(**self._product.model_dump(), region=region))
+        self.assertEqual(type(catalog.get("123")), Product)
+        self.assertEqual(catalog.get("123"), self._product)
@@ -0,0 +1,241 @@
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import AsyncMock, Mock
+
+import cv2
+import numpy as np
+
+from product_harvester.deduplication import (
+    DeduplicatingImageProcessor,
+    PerceptualHashIndex,
+    content_difference,
+    difference_hash,
+)
+from product_harvester.image import Image
+from product_harvester.processors import PerImageProcessingResult, ProcessingError, ProcessingResult
+from product_harvester.product import Product
+from product_harvester.tests.helpers import make_image
+
+
+def _make_pattern(seed: int) -> np.ndarray:
+    noise = (np.random.default_rng(seed).random((120, 160)) * 255).astype(np.uint8)
+    return cv2.GaussianBlur(noise, (15, 15), 0)
+
+
+def _brighten(pattern: np.ndarray) -> np.ndarray:
+    return np.clip(pattern.astype(np.int16) + 4, 0, 255).astype(np.uint8)
+
+
+def _make_tag(name: str, price: str, shift: tuple[int, int] = (0, 0), noise_seed: int | None = None) -> np.ndarray:
+    tag = np.full((480, 640), 235, dtype=np.uint8)
+    cv2.rectangle(tag, (20, 20), (620, 460), 30, 4)
+    cv2.rectangle(tag, (20, 20), (620, 100), 180, -1)
+    cv2.putText(tag, name, (40, 80), cv2.FONT_HERSHEY_SIMPLEX, 1.6, 20, 3)
+    cv2.putText(tag, price, (200, 330), cv2.FONT_HERSHEY_SIMPLEX, 5, 10, 12)
+    cv2.putText(tag, "1 l", (40, 430), cv2.FONT_HERSHEY_SIMPLEX, 0.9, 40, 2)
+    tag = cv2.warpAffine(tag, np.float32([[1, 0, shift[0]], [0, 1, shift[1]]]), (640, 480), borderValue=235)
+    if noise_seed is not None:
+        noise = np.random.default_rng(noise_seed).normal(0, 6, tag.shape)
+        tag = np.clip(tag.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    return tag
+
+
+class TestDifferenceHash(TestCase):
+    def test_hash_size(self):
+        self.assertEqual(difference_hash(_make_pattern(1), hash_size=8).shape, (8,))
+        self.assertEqual(difference_hash(_make_pattern(1), hash_size=16).shape, (32,))
+
+    def test_similar_images_have_close_hashes(self):
+        pattern = _make_pattern(1)
+        near_distance = np.bitwise_count(difference_hash(pattern) ^ difference_hash(_brighten(pattern))).sum()
+        far_distance = np.bitwise_count(difference_hash(pattern) ^ difference_hash(_make_pattern(2))).sum()
+        self.assertLessEqual(near_distance, 12)
+        self.assertGreater(far_distance, 12)
+
+    def test_min_difference_ignores_noise_on_plain_background(self):
+        tag, noisy_tag = _make_tag("Milk", "1.29"), _make_tag("Milk", "1.29", noise_seed=1)
+        noisy_distance = np.bitwise_count(difference_hash(tag) ^ difference_hash(noisy_tag)).sum()
+        distance = np.bitwise_count(
+            difference_hash(tag, min_difference=4) ^ difference_hash(noisy_tag, min_difference=4)
+        )
+        self.assertGreater(noisy_distance, 12)
+        self.assertLessEqual(distance.sum(), 2)
+
+
+class TestContentDifference(TestCase):
+    def test_shifted_shot_of_same_tag(self):
+        tag = _make_tag("Milk", "1.29")
+        self.assertLess(content_difference(tag, _make_tag("Milk", "1.29", shift=(12, -8), noise_seed=1)), 16)
+
+    def test_tags_with_same_template(self):
+        tag = _make_tag("Milk", "1.29")
+        self.assertGreater(content_difference(tag, _make_tag("Milk", "1.99")), 64)
+        self.assertGreater(content_difference(tag, _make_tag("Butter", "1.29")), 64)
+
+    def test_different_shapes(self):
+        self.assertEqual(content_difference(_make_tag("Milk", "1.29"), _make_pattern(1)), float("inf"))
+
+
+class TestPerceptualHashIndex(TestCase):
+    def test_find_nearest_within_distance(self):
+        index = PerceptualHashIndex(max_distance=1)
+        index.add(np.array([0b00000000], dtype=np.uint8), "zeros")
+        index.add(np.array([0b11110000], dtype=np.uint8), "half")
+        self.assertEqual(index.find(np.array([0b00000001], dtype=np.uint8)), "zeros")
+        self.assertEqual(index.find(np.array([0b11110000], dtype=np.uint8)), "half")
+        self.assertIsNone(index.find(np.array([0b00001111], dtype=np.uint8)))
+
+    def test_find_all_nearest_first(self):
+        index = PerceptualHashIndex(max_distance=2)
+        index.add(np.array([0b00000111], dtype=np.uint8), "two")
+        index.add(np.array([0b00000000], dtype=np.uint8), "zeros")
+        index.add(np.array([0b11110000], dtype=np.uint8), "half")
+        self.assertEqual(index.find_all(np.array([0b00000001], dtype=np.uint8)), ["zeros", "two"])
+
+    def test_empty(self):
+        self.assertIsNone(PerceptualHashIndex(max_distance=1).find(np.array([0], dtype=np.uint8)))
+
+    def test_max_size(self):
+        index = PerceptualHashIndex(max_distance=0, max_size=2)
+        for value in range(3):
+            index.add(np.array([value], dtype=np.uint8), value)
+        self.assertEqual(len(index), 2)
+        self.assertIsNone(index.find(np.array([0], dtype=np.uint8)))
+        self.assertEqual(index.find(np.array([2], dtype=np.uint8)), 2)
+
+
+class TestDeduplicatingImageProcessor(TestCase):
+    def setUp(self):
+        self._mock_processor = Mock()
+        self._processor = DeduplicatingImageProcessor(self._mock_processor)
+        self._pattern = _make_pattern(1)
+        self._product = Product(name="Milk", qty=1, qty_unit="l", price=1.2, category="drinks")
+        self._other_product = Product(name="Bread", qty=1, qty_unit="pcs", price=2.1, category="food")
+
+    def test_only_representatives_are_processed(self):
+        images = [
+            make_image("shot1", self._pattern),
+            make_image("other", _make_pattern(2)),
+            make_image("shot2", _brighten(self._pattern)),
+        ]
+        self._mock_processor.process.return_value = ProcessingResult(
+            [
+                PerImageProcessingResult(input_image=images[0], output=self._product, is_barcode_checked=True),
+                PerImageProcessingResult(input_image=images[1], output=self._other_product),
+            ]
+        )
+
+        result = self._processor.process(images)
+
+        self._mock_processor.process.assert_called_once_with(images[:2])
+        results = {product_result.input_image.id: product_result for product_result in result.product_results}
+        self.assertEqual(set(results), {"shot1", "shot2", "other"})
+        self.assertEqual(results["shot2"].output, self._product)
+        self.assertIsNot(results["shot2"].output, results["shot1"].output)
+        self.assertTrue(results["shot2"].is_barcode_checked)
+        self.assertEqual(results["other"].output, self._other_product)
+
+    def test_tags_with_same_template_and_other_price_are_not_merged(self):
+        images = [
+            make_image("old_price", _make_tag("Milk", "1.29")),
+            make_image("new_price", _make_tag("Milk", "1.99")),
+            make_image("old_price_again", _make_tag("Milk", "1.29", shift=(3, 2), noise_seed=1)),
+        ]
+        new_product = self._product.model_copy(update={"price": 1.99})
+        self._mock_processor.process.return_value = ProcessingResult(
+            [
+                PerImageProcessingResult(input_image=images[0], output=self._product),
+                PerImageProcessingResult(input_image=images[1], output=new_product),
+            ]
+        )
+
+        result = self._processor.process(images)
+
+        self._mock_processor.process.assert_called_once_with(images[:2])
+        prices = {
+            product_result.input_image.id: product_result.output.price for product_result in result.product_results
+        }
+        self.assertEqual(prices, {"old_price": 1.2, "new_price": 1.99, "old_price_again": 1.2})
+
+    def test_known_products_are_not_reused_across_batches_by_default(self):
+        first_image = make_image("shot1", self._pattern)
+        self._mock_processor.process.return_value = ProcessingResult(
+            [PerImageProcessingResult(input_image=first_image, output=self._product)]
+        )
+        self._processor.process([first_image])
+        self._processor.process([make_image("shot2", self._pattern)])
+        self.assertEqual(self._mock_processor.process.call_count, 2)
+
+    def test_known_products_are_reused_across_batches(self):
+        self._processor = DeduplicatingImageProcessor(self._mock_processor, cross_batch=True)
+        first_image = make_image("shot1", self._pattern)
+        self._mock_processor.process.return_value = ProcessingResult(
+            [PerImageProcessingResult(input_image=first_image, output=self._product)]
+        )
+        self._processor.process([first_image])
+        self._mock_processor.process.reset_mock()
+
+        result = self._processor.process([make_image("shot2", _brighten(self._pattern))])
+
+        self._mock_processor.process.assert_not_called()
+        self.assertEqual(len(result.product_results), 1)
+        self.assertEqual(result.product_results[0].input_image.id, "shot2")
+        self.assertEqual(result.product_results[0].output, self._product)
+
+    def test_errors_are_inherited_and_not_reused(self):
+        images = [make_image("shot1", self._pattern), make_image("shot2", _brighten(self._pattern))]
+        self._mock_processor.process.return_value = ProcessingResult(
+            [PerImageProcessingResult(input_image=images[0], output=ProcessingError("Failed", "details"))]
+        )
+
+        result = self._processor.process(images)
+
+        self.assertEqual([error.input_image.id for error in result.error_results], ["shot1", "shot2"])
+        self.assertEqual(result.error_results[1].output.msg, "Failed")
+        self._processor.process([make_image("shot3", self._pattern)])
+        self.assertEqual(self._mock_processor.process.call_count, 2)
+
+    def test_multiple_products_of_one_image(self):
+        self._processor = DeduplicatingImageProcessor(self._mock_processor, cross_batch=True)
+        first_image = make_image("shot1", self._pattern)
+        self._mock_processor.process.return_value = ProcessingResult(
+            [
+                PerImageProcessingResult(input_image=first_image, output=self._product),
+                PerImageProcessingResult(input_image=first_image, output=self._other_product),
+            ]
+        )
+
+        result = self._processor.process([first_image, make_image("shot2", _brighten(self._pattern))])
+        later_result = self._processor.process([make_image("shot3", self._pattern)])
+
+        self.assertEqual(
+            [(product.input_image.id, product.output.name) for product in result.product_results],
+            [("shot1", "Milk"), ("shot1", "Bread"), ("shot2", "Milk"), ("shot2", "Bread")],
+        )
+        self.assertEqual([product.output.name for product in later_result.product_results], ["Milk", "Bread"])
+        self._mock_processor.process.assert_called_once()
+
+    def test_undecodable_images_are_processed_individually(self):
+        images = [Image(id="broken1", data="data:image/png;base64,d2F0"), Image(id="broken2", data="/missing.png")]
+        self._mock_processor.process.return_value = ProcessingResult([])
+
+        self._processor.process(images)
+
+        self._mock_processor.process.assert_called_once_with(images)
+
+
+class TestDeduplicatingImageProcessorAsync(IsolatedAsyncioTestCase):
+    async def test_aprocess(self):
+        mock_processor = Mock()
+        mock_processor.aprocess = AsyncMock()
+        processor = DeduplicatingImageProcessor(mock_processor)
+        pattern = _make_pattern(1)
+        images = [make_image("shot1", pattern), make_image("shot2", _brighten(pattern))]
+        product = Product(name="Milk", qty=1, qty_unit="l", price=1.2, category="drinks")
+        mock_processor.aprocess.return_value = ProcessingResult(
+            [PerImageProcessingResult(input_image=images[0], output=product)]
+        )
+
+        result = await processor.aprocess(images)
+
+        mock_processor.aprocess.assert_awaited_once_with(images[:1])
+        self.assertEqual([product_result.output for product_result in result.product_results], [product, product])
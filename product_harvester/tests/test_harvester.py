@@ -1,10 +1,24 @@
-from unittest import TestCase
-from unittest.mock import call, Mock, patch, MagicMock
-
-from product_harvester.harvester import ErrorLogger, ErrorTracker, HarvestError, ProductsHarvester, StdOutErrorTracker
+import asyncio
+import tempfile
+from pathlib import Path
+from threading import Event
+from typing import AsyncGenerator
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import call, AsyncMock, Mock, patch, MagicMock
+
+from product_harvester.harvester import (
+    ErrorLogger,
+    ErrorTracker,
+    HarvestError,
+    PipelinedProductsHarvester,
+    ProductsHarvester,
+    StdOutErrorTracker,
+    StreamingProductsHarvester,
+)
 from product_harvester.image import Image, ImageMeta
 from product_harvester.importers import ImportedProduct
-from product_harvester.processors import ProcessingError, ProcessingResult, PerImageProcessingResult
+from product_harvester.journal import SQLiteHarvestJournal
+from product_harvester.processors import ImageProcessor, ProcessingError, ProcessingResult, PerImageProcessingResult
 from product_harvester.product import Product
 
 
@@ -14,6 +28,14 @@ class TestErrorTracker(TestCase):
             ErrorTracker().track_errors([])
 
 
+class TestErrorTrackerAsync(IsolatedAsyncioTestCase):
+    @patch("builtins.print")
+    async def test_default_atrack_errors(self, print_mock):
+        errs = [HarvestError("example message", {"info": "additional"})]
+        await StdOutErrorTracker().atrack_errors(errs)
+        print_mock.assert_called_once_with(errs[0])
+
+
 class TestStdOutErrorTracker(TestCase):
 
     @patch("builtins.print")
@@ -114,6 +136,14 @@ class TestProductsHarvester(TestCase):
         ]
         self._mock_importer.import_product.assert_has_calls(want_calls)
 
+    def test_harvest_unloads_processed_images(self):
+        mock_images = [Image(id="image1", data="/image1.jpg"), Image(id="image2", data="/image2.png")]
+        self._mock_retriever.retrieve_images.return_value = iter(mock_images)
+        self._mock_processor.process.return_value = ProcessingResult(results=[])
+        with patch.object(Image, "unload", autospec=True) as mock_unload:
+            self._harvester.harvest()
+        mock_unload.assert_has_calls([call(mock_images[0]), call(mock_images[1])])
+
     def test_harvest_imports_products_and_tracks_errors(self):
         mock_images = [
             Image(id="image1", data="/image1.jpg"),
@@ -257,6 +287,7 @@ class TestProductsHarvester(TestCase):
                             "category": "jedlo",
                             "source_image": mock_images[0].model_dump(),
                             "is_barcode_checked": False,
+                            "region": None,
                         },
                         "detailed_info": "Some importing error",
                     },
@@ -268,3 +299,540 @@ class TestProductsHarvester(TestCase):
             for mock_product, mock_image in zip(mock_products, mock_images)
         ]
         self._mock_importer.import_product.assert_has_calls(want_calls)
+
+    def test_harvest_with_journal(self):
+        done_image = Image(id="done", data="/done.jpg")
+        new_image = Image(id="new", data="/new.jpg")
+        failing_image = Image(id="failing", data="/failing.jpg")
+        replayed_product = ImportedProduct(
+            name="Milk", qty=1, qty_unit="l", price=1.2, category="voda", source_image=Image(id="old", data="/old.jpg")
+        )
+        mock_journal = Mock()
+        mock_journal.pending_imports.return_value = [replayed_product]
+        mock_journal.is_done.side_effect = lambda image: image.id == "done"
+        self._mock_retriever.retrieve_images.return_value = iter([done_image, new_image, failing_image])
+        mock_product = Product(name="Bread", qty=3, qty_unit="pcs", price=3.35, barcode="123", category="jedlo")
+        self._mock_processor.process.return_value = ProcessingResult(
+            results=[
+                PerImageProcessingResult(input_image=new_image, output=mock_product),
+                PerImageProcessingResult(input_image=failing_image, output=ProcessingError("invalid image")),
+            ]
+        )
+        harvester = type(self._harvester)(
+            self._mock_retriever, self._mock_processor, self._mock_importer, self._mock_tracker, journal=mock_journal
+        )
+
+        harvester.harvest()
+
+        imported_product = ImportedProduct.from_product(mock_product, source_image=new_image, is_barcode_checked=False)
+        self._mock_processor.process.assert_called_once_with([new_image, failing_image])
+        self._mock_importer.import_product.assert_has_calls([call(replayed_product), call(imported_product)])
+        mock_journal.mark_retrieved.assert_has_calls([call(new_image), call(failing_image)])
+        mock_journal.mark_failed.assert_called_once_with(failing_image)
+        mock_journal.mark_extracted.assert_called_once_with(imported_product)
+        mock_journal.mark_imported.assert_has_calls([call(replayed_product), call(imported_product)])
+
+    def test_harvest_with_journal_skips_unreadable_image(self):
+        missing_image = Image(id="missing", data="/nonexistent/file.jpg")
+        readable_image = Image(id="readable", data="data:image/png;base64,aW1hZ2U=")
+        self._mock_retriever.retrieve_images.return_value = iter([missing_image, readable_image])
+        mock_product = Product(name="Bread", qty=3, qty_unit="pcs", price=3.35, barcode="123", category="jedlo")
+        self._mock_processor.process.return_value = ProcessingResult(
+            results=[PerImageProcessingResult(input_image=readable_image, output=mock_product)]
+        )
+        with tempfile.TemporaryDirectory() as temp_dir:
+            journal = SQLiteHarvestJournal(str(Path(temp_dir) / "journal.sqlite"))
+            harvester = type(self._harvester)(
+                self._mock_retriever, self._mock_processor, self._mock_importer, self._mock_tracker, journal=journal
+            )
+
+            harvester.harvest()
+
+            self.assertEqual(journal.get_stage(readable_image), "imported")
+        self._mock_processor.process.assert_called_once_with([readable_image])
+        self._mock_importer.import_product.assert_called_once()
+        errors = self._mock_tracker.track_errors.call_args.args[0]
+        self.assertEqual([error.msg for error in errors], ["Failed to retrieve image"])
+
+    def test_harvest_with_journal_import_failure_is_not_marked_imported(self):
+        mock_image = Image(id="image1", data="/image1.jpg")
+        mock_journal = Mock()
+        mock_journal.pending_imports.return_value = []
+        mock_journal.is_done.return_value = False
+        self._mock_retriever.retrieve_images.return_value = iter([mock_image])
+        mock_product = Product(name="Bread", qty=3, qty_unit="pcs", price=3.35, barcode="123", category="jedlo")
+        self._mock_processor.process.return_value = ProcessingResult(
+            results=[PerImageProcessingResult(input_image=mock_image, output=mock_product)]
+        )
+        self._mock_importer.import_product.side_effect = ValueError("Some importing error")
+        harvester = type(self._harvester)(
+            self._mock_retriever, self._mock_processor, self._mock_importer, self._mock_tracker, journal=mock_journal
+        )
+
+        harvester.harvest()
+
+        mock_journal.mark_extracted.assert_called_once()
+        mock_journal.mark_imported.assert_not_called()
+
+
+async def _async_iter(items: list) -> AsyncGenerator:
+    for item in items:
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+class TestProductsHarvesterAsync(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self._mock_retriever = Mock()
+        self._mock_processor = Mock()
+        self._mock_processor.aprocess = AsyncMock()
+        self._mock_importer = Mock()
+        self._mock_importer.aimport_product = AsyncMock()
+        self._mock_tracker = Mock()
+        self._mock_tracker.atrack_errors = AsyncMock()
+        self._harvester = ProductsHarvester(
+            self._mock_retriever, self._mock_processor, self._mock_importer, self._mock_tracker, batch_size=2
+        )
+
+    async def test_aharvest_imports_products_and_tracks_errors(self):
+        mock_images = [
+            Image(id="image1", data="/image1.jpg"),
+            Image(id="image2", data="/image2.jpg"),
+            Image(id="image3", data="/image3.jpg"),
+        ]
+        self._mock_retriever.aretrieve_images.return_value = _async_iter(mock_images)
+        mock_products = [
+            Product(name="Banana", qty=1.0, qty_unit="kg", price=1.99, barcode="456", category="jedlo"),
+            Product(name="Milk", qty=500, qty_unit="ml", price=0.99, barcode="66053", category="voda"),
+        ]
+        self._mock_processor.aprocess.side_effect = [
+            ProcessingResult(
+                results=[
+                    PerImageProcessingResult(input_image=mock_images[0], output=mock_products[0]),
+                    PerImageProcessingResult(
+                        input_image=mock_images[1], output=ProcessingError("invalid image", "some detailed message")
+                    ),
+                ]
+            ),
+            ProcessingResult(
+                results=[
+                    PerImageProcessingResult(
+                        input_image=mock_images[2], output=mock_products[1], is_barcode_checked=True
+                    ),
+                ]
+            ),
+        ]
+
+        await self._harvester.aharvest()
+
+        self._mock_processor.aprocess.assert_has_awaits([call(mock_images[:2]), call(mock_images[2:])])
+        self._mock_processor.process.assert_not_called()
+        self._mock_tracker.atrack_errors.assert_awaited_once_with(
+            [HarvestError("invalid image", {"input": "image2", "detailed_info": "some detailed message"})]
+        )
+        self._mock_importer.aimport_product.assert_has_awaits(
+            [
+                call(ImportedProduct.from_product(mock_products[0], mock_images[0], is_barcode_checked=False)),
+                call(ImportedProduct.from_product(mock_products[1], mock_images[2], is_barcode_checked=True)),
+            ],
+            any_order=True,
+        )
+
+    async def test_aharvest_empty_retriever_result(self):
+        self._mock_retriever.aretrieve_images.return_value = _async_iter([])
+
+        await self._harvester.aharvest()
+
+        self._mock_processor.aprocess.assert_not_awaited()
+        self._mock_tracker.atrack_errors.assert_not_awaited()
+        self._mock_importer.aimport_product.assert_not_awaited()
+
+    async def test_aharvest_retriever_error(self):
+        self._mock_retriever.aretrieve_images.side_effect = ValueError("Something went wrong during retrieval")
+
+        await self._harvester.aharvest()
+
+        self._mock_processor.aprocess.assert_not_awaited()
+        self._mock_tracker.atrack_errors.assert_awaited_once_with(
+            [HarvestError("Failed to retrieve images", {"detailed_info": "Something went wrong during retrieval"})]
+        )
+
+    async def test_aharvest_retriever_generator_error(self):
+        valid_input_image = Image(id="image1", data="/image1.jpg")
+        self._mock_retriever.aretrieve_images.return_value = _async_iter([valid_input_image, ValueError("Some error")])
+        self._mock_processor.aprocess.return_value = ProcessingResult(results=[])
+
+        await self._harvester.aharvest()
+
+        self._mock_processor.aprocess.assert_awaited_once_with([valid_input_image])
+        self._mock_tracker.atrack_errors.assert_awaited_once_with(
+            [HarvestError("Failed to retrieve image", {"detailed_info": "Some error"})]
+        )
+
+    async def test_aharvest_processor_error(self):
+        mock_images = [Image(id="image1", data="/image1.png")]
+        self._mock_retriever.aretrieve_images.return_value = _async_iter(mock_images)
+        self._mock_processor.aprocess.side_effect = ValueError("Something went wrong during processing")
+
+        await self._harvester.aharvest()
+
+        self._mock_tracker.atrack_errors.assert_awaited_once_with(
+            [
+                HarvestError(
+                    "Failed to extract data from the images",
+                    {"input": ["image1"], "detailed_info": "Something went wrong during processing"},
+                )
+            ]
+        )
+        self._mock_importer.aimport_product.assert_not_awaited()
+
+    async def test_aharvest_importer_error(self):
+        mock_image = Image(id="image1", data="/image1.jpg")
+        self._mock_retriever.aretrieve_images.return_value = _async_iter([mock_image])
+        mock_product = Product(name="Banana", qty=1.0, qty_unit="kg", price=1.99, barcode="456", category="jedlo")
+        self._mock_processor.aprocess.return_value = ProcessingResult(
+            results=[PerImageProcessingResult(input_image=mock_image, output=mock_product)]
+        )
+        self._mock_importer.aimport_product.side_effect = ValueError("Some importing error")
+
+        await self._harvester.aharvest()
+
+        imported_product = ImportedProduct.from_product(mock_product, mock_image, is_barcode_checked=False)
+        self._mock_tracker.atrack_errors.assert_awaited_once_with(
+            [
+                HarvestError(
+                    "Failed to to import extracted product data",
+                    {
+                        "input": "image1",
+                        "imported_product": imported_product.model_dump(),
+                        "detailed_info": "Some importing error",
+                    },
+                )
+            ]
+        )
+
+    async def test_aharvest_batch_failure_cancels_remaining_batches(self):
+        mock_images = [Image(id=f"image{i}", data=f"/image{i}.jpg") for i in range(100)]
+        self._mock_retriever.aretrieve_images.return_value = _async_iter(mock_images)
+        self._mock_processor.aprocess.side_effect = ValueError("Something went wrong during processing")
+        self._mock_tracker.atrack_errors.side_effect = RuntimeError("Tracker is down")
+        harvester = ProductsHarvester(
+            self._mock_retriever, self._mock_processor, self._mock_importer, self._mock_tracker, batch_size=1
+        )
+
+        with self.assertRaises(RuntimeError):
+            await harvester.aharvest(max_concurrent_batches=2)
+
+        self.assertLessEqual(self._mock_processor.aprocess.await_count, 3)
+
+    async def test_aharvest_with_journal_skips_unreadable_image(self):
+        missing_image = Image(id="missing", data="/nonexistent/file.jpg")
+        readable_image = Image(id="readable", data="data:image/png;base64,aW1hZ2U=")
+        self._mock_retriever.aretrieve_images.return_value = _async_iter([missing_image, readable_image])
+        mock_product = Product(name="Bread", qty=3, qty_unit="pcs", price=3.35, barcode="123", category="jedlo")
+        self._mock_processor.aprocess.return_value = ProcessingResult(
+            results=[PerImageProcessingResult(input_image=readable_image, output=mock_product)]
+        )
+        with tempfile.TemporaryDirectory() as temp_dir:
+            journal = SQLiteHarvestJournal(str(Path(temp_dir) / "journal.sqlite"))
+            harvester = ProductsHarvester(
+                self._mock_retriever, self._mock_processor, self._mock_importer, self._mock_tracker, journal=journal
+            )
+
+            await harvester.aharvest()
+
+            self.assertEqual(journal.get_stage(readable_image), "imported")
+        self._mock_processor.aprocess.assert_awaited_once_with([readable_image])
+        errors = self._mock_tracker.atrack_errors.await_args.args[0]
+        self.assertEqual([error.msg for error in errors], ["Failed to retrieve image"])
+
+    async def test_aharvest_pending_imports_are_bounded_by_batch_size(self):
+        pending_products = [
+            ImportedProduct(
+                name="Milk",
+                qty=1,
+                qty_unit="l",
+                price=1.2,
+                category="voda",
+                source_image=Image(id=f"{i}", data="/i.jpg"),
+            )
+            for i in range(20)
+        ]
+        mock_journal = Mock()
+        mock_journal.pending_imports.return_value = pending_products
+        self._mock_retriever.aretrieve_images.return_value = _async_iter([])
+        in_flight, max_in_flight = 0, 0
+
+        async def import_product(_product: ImportedProduct):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0)
+            in_flight -= 1
+
+        self._mock_importer.aimport_product.side_effect = import_product
+        harvester = ProductsHarvester(
+            self._mock_retriever,
+            self._mock_processor,
+            self._mock_importer,
+            self._mock_tracker,
+            batch_size=3,
+            journal=mock_journal,
+        )
+
+        await harvester.aharvest()
+
+        self.assertEqual(self._mock_importer.aimport_product.await_count, 20)
+        self.assertEqual(max_in_flight, 3)
+
+
+class TestPipelinedProductsHarvester(TestProductsHarvester):
+    def setUp(self):
+        super().setUp()
+        self._harvester = PipelinedProductsHarvester(
+            self._mock_retriever, self._mock_processor, self._mock_importer, self._mock_tracker
+        )
+
+    def test_harvest_overlaps_retrieval_with_processing(self):
+        second_image_retrieved = Event()
+        waited_for_retrieval = []
+        mock_images = [Image(id="image1", data="/image1.jpg"), Image(id="image2", data="/image2.jpg")]
+
+        def retrieve_images():
+            yield mock_images[0]
+            yield mock_images[1]
+            second_image_retrieved.set()
+
+        def process(images: list[Image]) -> ProcessingResult:
+            # Would time out if the next batch was retrieved only after the current one is processed
+            waited_for_retrieval.append(second_image_retrieved.wait(timeout=5))
+            return ProcessingResult(results=[])
+
+        self._mock_retriever.retrieve_images.side_effect = retrieve_images
+        self._mock_processor.process.side_effect = process
+        harvester = PipelinedProductsHarvester(
+            self._mock_retriever, self._mock_processor, self._mock_importer, self._mock_tracker, batch_size=1
+        )
+
+        harvester.harvest()
+
+        self.assertEqual(waited_for_retrieval, [True, True])
+        self._mock_processor.process.assert_has_calls([call([mock_images[0]]), call([mock_images[1]])])
+        self._mock_tracker.track_errors.assert_not_called()
+        self._mock_importer.import_product.assert_not_called()
+
+    def test_harvest_error_tracker_failure_is_raised(self):
+        self._mock_retriever.retrieve_images.side_effect = ValueError("Something went wrong during retrieval")
+        self._mock_tracker.track_errors.side_effect = RuntimeError("Tracker is down")
+
+        with self.assertRaises(RuntimeError):
+            self._harvester.harvest()
+
+        self._mock_processor.process.assert_not_called()
+        self._mock_importer.import_product.assert_not_called()
+
+    def test_harvest_import_stage_failure_stops_other_stages(self):
+        mock_images = [Image(id=f"image{i}", data=f"/image{i}.jpg") for i in range(100)]
+        self._mock_retriever.retrieve_images.return_value = iter(mock_images)
+        mock_product = Product(name="Banana", qty=1.0, qty_unit="kg", price=1.99, barcode="456", category="jedlo")
+        self._mock_processor.process.side_effect = lambda images: ProcessingResult(
+            results=[PerImageProcessingResult(input_image=image, output=mock_product) for image in images]
+        )
+        self._mock_importer.import_product.side_effect = ValueError("Some importing error")
+        self._mock_tracker.track_errors.side_effect = RuntimeError("Tracker is down")
+        harvester = PipelinedProductsHarvester(
+            self._mock_retriever, self._mock_processor, self._mock_importer, self._mock_tracker, batch_size=1
+        )
+
+        with self.assertRaises(RuntimeError):
+            harvester.harvest()
+
+        # At most the batches already in the queues (2 each) and the one being processed are passed to the processor
+        self.assertLessEqual(self._mock_processor.process.call_count, 6)
+        self._mock_importer.import_product.assert_called_once()
+
+
+class _DelegatingProcessor(ImageProcessor):
+    def __init__(self, processor: Mock):
+        self._processor = processor
+
+    def process(self, images: list[Image]) -> ProcessingResult:
+        return self._processor.process(images)
+
+
+class TestStreamingProductsHarvester(TestCase):
+    def setUp(self):
+        self._mock_retriever = Mock()
+        self._mock_processor = Mock()
+        self._mock_importer = Mock()
+        self._mock_tracker = Mock()
+        self._harvester = StreamingProductsHarvester(
+            self._mock_retriever, _DelegatingProcessor(self._mock_processor), self._mock_importer, self._mock_tracker
+        )
+        self._mock_images = [
+            Image(id="image1", data="/image1.jpg"),
+            Image(id="image2", data="/image2.jpg"),
+            Image(id="image3", data="/image3.jpg"),
+        ]
+        self._mock_product = Product(name="Banana", qty=1.0, qty_unit="kg", price=1.99, barcode="456", category="jedlo")
+
+    def _process(self, images: list[Image]) -> ProcessingResult:
+        if images[0].id == "image2":
+            return ProcessingResult(
+                [PerImageProcessingResult(input_image=images[0], output=ProcessingError("invalid"))]
+            )
+        if images[0].id == "image3":
+            raise ValueError("Model is down")
+        return ProcessingResult([PerImageProcessingResult(input_image=images[0], output=self._mock_product)])
+
+    def test_harvest_imports_products_and_tracks_errors(self):
+        self._mock_retriever.retrieve_images.return_value = iter(self._mock_images)
+        self._mock_processor.process.side_effect = self._process
+
+        self._harvester.harvest()
+
+        self._mock_processor.process.assert_has_calls([call([image]) for image in self._mock_images], any_order=True)
+        self._mock_importer.import_product.assert_called_once_with(
+            ImportedProduct.from_product(self._mock_product, self._mock_images[0], is_barcode_checked=False)
+        )
+        self._mock_tracker.track_errors.assert_has_calls(
+            [
+                call([HarvestError("invalid", {"input": "image2", "detailed_info": ""})]),
+                call(
+                    [
+                        HarvestError(
+                            "Failed to extract data from the image",
+                            {"input": "image3", "detailed_info": "Model is down"},
+                        )
+                    ]
+                ),
+            ],
+            any_order=True,
+        )
+
+    def test_harvest_does_not_wait_for_slow_images(self):
+        second_image_imported = Event()
+        waited_for_import = []
+
+        def process(images: list[Image]) -> ProcessingResult:
+            if images[0].id == "image1":
+                # Would time out if the finished image was imported only after the whole batch is processed
+                waited_for_import.append(second_image_imported.wait(timeout=5))
+            return ProcessingResult([PerImageProcessingResult(input_image=images[0], output=self._mock_product)])
+
+        self._mock_retriever.retrieve_images.return_value = iter(self._mock_images[:2])
+        self._mock_processor.process.side_effect = process
+        self._mock_importer.import_product.side_effect = lambda product: second_image_imported.set()
+
+        self._harvester.harvest()
+
+        self.assertEqual(waited_for_import, [True])
+        self.assertEqual(
+            [product.args[0].source_image for product in self._mock_importer.import_product.call_args_list],
+            [self._mock_images[1], self._mock_images[0]],
+        )
+
+    def test_harvest_retriever_generator_error(self):
+        def retrieve_images():
+            yield self._mock_images[0]
+            raise ValueError("Something went wrong during retrieval")
+
+        self._mock_retriever.retrieve_images.side_effect = retrieve_images
+        self._mock_processor.process.side_effect = self._process
+
+        self._harvester.harvest()
+
+        self._mock_processor.process.assert_called_once_with([self._mock_images[0]])
+        self._mock_tracker.track_errors.assert_called_once_with(
+            [HarvestError("Failed to retrieve image", {"detailed_info": "Something went wrong during retrieval"})]
+        )
+        self._mock_importer.import_product.assert_called_once()
+
+    def test_harvest_with_journal(self):
+        mock_journal = Mock()
+        mock_journal.pending_imports.return_value = []
+        mock_journal.is_done.side_effect = lambda image: image.id == "image1"
+        self._mock_retriever.retrieve_images.return_value = iter(self._mock_images[:2])
+        self._mock_processor.process.side_effect = self._process
+        harvester = StreamingProductsHarvester(
+            self._mock_retriever,
+            _DelegatingProcessor(self._mock_processor),
+            self._mock_importer,
+            self._mock_tracker,
+            journal=mock_journal,
+        )
+
+        harvester.harvest()
+
+        self._mock_processor.process.assert_called_once_with([self._mock_images[1]])
+        mock_journal.mark_retrieved.assert_called_once_with(self._mock_images[1])
+        mock_journal.mark_failed.assert_called_once_with(self._mock_images[1])
+        self._mock_importer.import_product.assert_not_called()
+
+    def test_harvest_journals_all_products_of_an_image_before_importing(self):
+        shelf_image = self._mock_images[0]
+        products = [self._mock_product.model_copy(update={"name": name}) for name in ("a", "b")]
+        self._mock_retriever.retrieve_images.return_value = iter([shelf_image])
+        self._mock_processor.process.return_value = ProcessingResult(
+            [PerImageProcessingResult(input_image=shelf_image, output=product) for product in products]
+        )
+        calls = Mock()
+        mock_journal = calls.journal
+        mock_journal.pending_imports.return_value = []
+        mock_journal.is_done.return_value = False
+        harvester = StreamingProductsHarvester(
+            self._mock_retriever,
+            _DelegatingProcessor(self._mock_processor),
+            calls.importer,
+            self._mock_tracker,
+            journal=mock_journal,
+        )
+
+        harvester.harvest()
+
+        imported_products = [
+            ImportedProduct.from_product(product, shelf_image, is_barcode_checked=False) for product in products
+        ]
+        recorded_calls = [
+            recorded_call
+            for recorded_call in calls.mock_calls
+            if recorded_call[0] in ("journal.mark_extracted", "importer.import_product")
+        ]
+        self.assertEqual(
+            recorded_calls,
+            [call.journal.mark_extracted(product) for product in imported_products]
+            + [call.importer.import_product(product) for product in imported_products],
+        )
+
+
+class TestStreamingProductsHarvesterAsync(IsolatedAsyncioTestCase):
+    async def test_aharvest_imports_products_and_tracks_errors(self):
+        mock_retriever = Mock()
+        mock_processor = Mock()
+        mock_importer = Mock()
+        mock_importer.aimport_product = AsyncMock()
+        mock_tracker = Mock()
+        mock_tracker.atrack_errors = AsyncMock()
+        mock_images = [Image(id="image1", data="/image1.jpg"), Image(id="image2", data="/image2.jpg")]
+        mock_product = Product(name="Banana", qty=1.0, qty_unit="kg", price=1.99, barcode="456", category="jedlo")
+        mock_retriever.aretrieve_images.return_value = _async_iter(mock_images)
+        mock_processor.process.side_effect = lambda images: ProcessingResult(
+            [
+                PerImageProcessingResult(
+                    input_image=images[0], output=mock_product if images[0].id == "image1" else ProcessingError("x")
+                )
+            ]
+        )
+        harvester = StreamingProductsHarvester(
+            mock_retriever, _DelegatingProcessor(mock_processor), mock_importer, mock_tracker
+        )
+
+        await harvester.aharvest()
+
+        mock_importer.aimport_product.assert_awaited_once_with(
+            ImportedProduct.from_product(mock_product, mock_images[0], is_barcode_checked=False)
+        )
+        mock_tracker.atrack_errors.assert_awaited_once_with(
+            [HarvestError("x", {"input": "image2", "detailed_info": ""})]
+        )
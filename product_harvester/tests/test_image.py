@@ -0,0 +1,83 @@
+import base64
+import hashlib
+from unittest import TestCase
+from unittest.mock import MagicMock, mock_open, patch
+
+import cv2
+import numpy as np
+
+from product_harvester.image import Image
+
+
+class TestImage(TestCase):
+    def test_load_bytes_from_base64(self):
+        image = Image(id="image", data="data:image/png;base64,aW1hZ2U=")
+        self.assertEqual(image.load_bytes(), b"image")
+
+    @patch("product_harvester.image._http_session.get")
+    def test_load_bytes_from_url(self, mock_get):
+        mock_get.return_value = MagicMock(content=b"image")
+        image = Image(id="image", data="https://example.com/image.png")
+        self.assertEqual(image.load_bytes(), b"image")
+        self.assertEqual(image.load_bytes(), b"image")
+        mock_get.assert_called_once_with("https://example.com/image.png")
+
+    @patch("builtins.open", new_callable=mock_open, read_data=b"image")
+    def test_load_bytes_from_file(self, _mock_open):
+        image = Image(id="image", data="/path/to/image.png")
+        self.assertEqual(image.load_bytes(), b"image")
+        _mock_open.assert_called_once_with("/path/to/image.png", "rb")
+
+    def test_load_bytes_in_memory(self):
+        image = Image.from_bytes("image", b"image", "image/png")
+        self.assertEqual(image.load_bytes(), b"image")
+        self.assertEqual(image.to_url(), "data:image/png;base64,aW1hZ2U=")
+
+    def test_load_bytes_without_content(self):
+        with self.assertRaisesRegex(ValueError, "has no content"):
+            Image(id="image").load_bytes()
+
+    def test_to_url_keeps_data(self):
+        self.assertEqual(Image(id="image", data="/path/to/image.png").to_url(), "/path/to/image.png")
+        self.assertEqual(Image(id="image", data="https://example.com/a.png").to_url(), "https://example.com/a.png")
+
+    def test_content_hash(self):
+        image = Image(id="image", data="data:image/png;base64,aW1hZ2U=")
+        same_content_image = Image(id="other", data="data:image/jpeg;base64,aW1hZ2U=")
+        self.assertEqual(image.content_hash(), hashlib.sha256(b"image").hexdigest())
+        self.assertEqual(image.content_hash(), same_content_image.content_hash())
+
+    @patch("product_harvester.image.cv2.imdecode", wraps=cv2.imdecode)
+    def test_load_array_decodes_once(self, mock_imdecode):
+        _, encoded = cv2.imencode(".png", np.full((4, 6, 3), 200, dtype=np.uint8))
+        image = Image(id="image", data=f"data:image/png;base64,{base64.b64encode(encoded.tobytes()).decode()}")
+        array = image.load_array()
+        grayscale = image.load_array(grayscale=True)
+        self.assertIs(image.load_array(), array)
+        self.assertIs(image.load_array(grayscale=True), grayscale)
+        self.assertEqual(array.shape, (4, 6, 3))
+        self.assertEqual(grayscale.shape, (4, 6))
+        mock_imdecode.assert_called_once()
+
+    def test_load_array_undecodable(self):
+        with self.assertRaisesRegex(ValueError, "could not be decoded"):
+            Image.from_bytes("image", b"image", "image/png").load_array()
+
+    @patch("builtins.open", new_callable=mock_open, read_data=b"image")
+    def test_unload(self, _mock_open):
+        image = Image(id="image", data="/path/to/image.png")
+        image.content_hash()
+        image.unload()
+        image.load_bytes()
+        self.assertEqual(_mock_open.call_count, 2)
+        in_memory_image = Image.from_bytes("image", b"image", "image/png")
+        in_memory_image.unload()
+        self.assertEqual(in_memory_image.load_bytes(), b"image")
+
+    @patch("builtins.open", new_callable=mock_open, read_data=b"image")
+    def test_equality_ignores_loaded_content(self, _mock_open):
+        image = Image(id="image", data="/path/to/image.png")
+        image.load_bytes()
+        self.assertEqual(image, Image(id="image", data="/path/to/image.png"))
+        self.assertEqual(Image.from_bytes("image", b"a", "image/png"), Image.from_bytes("image", b"a", "image/png"))
+        self.assertNotEqual(Image.from_bytes("image", b"a", "image/png"), Image.from_bytes("image", b"b", "image/png"))
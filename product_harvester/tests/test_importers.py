@@ -1,6 +1,6 @@
 import tempfile
 from pathlib import Path
-from unittest import TestCase
+from unittest import IsolatedAsyncioTestCase, TestCase
 from unittest.mock import patch
 
 from product_harvester.clients.usetri_api_client import UsetriAPICategory, UsetriAPIProduct, UsetriAPIProductDetail
@@ -122,6 +122,21 @@ class TestProductsImporter(TestCase):
             ProductsImporter().import_product(product)
 
 
+class TestProductsImporterAsync(IsolatedAsyncioTestCase):
+    @patch("builtins.print")
+    async def test_default_aimport_product(self, print_mock):
+        product = ImportedProduct(
+            name="Milk",
+            qty=1,
+            qty_unit="l",
+            price=1.2,
+            category="drinks",
+            source_image=Image(id="source_image", data="whatever"),
+        )
+        await StdOutProductsImporter().aimport_product(product)
+        print_mock.assert_called_once_with(product)
+
+
 class TestStdOutProductsImporter(TestCase):
     def setUp(self):
         self._product = ImportedProduct(
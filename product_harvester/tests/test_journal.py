@@ -0,0 +1,121 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from product_harvester.image import Image, ImageMeta, NoImageMeta
+from product_harvester.importers import ImportedProduct
+from product_harvester.journal import HarvestJournal, NoHarvestJournal, SQLiteHarvestJournal
+from product_harvester.product import Product
+
+
+class _ShopImageMeta(ImageMeta):
+    def adjust_product(self, product: Product) -> None:
+        product.barcode = "overridden"
+
+
+class TestHarvestJournal(TestCase):
+    def test_not_implemented(self):
+        with self.assertRaises(TypeError):
+            HarvestJournal().is_done(Image(id="image", data="/image.png"))
+
+
+class TestNoHarvestJournal(TestCase):
+    def test_nothing_is_recorded(self):
+        journal = NoHarvestJournal()
+        image = Image(id="image", data="/image.png")
+        journal.mark_retrieved(image)
+        journal.mark_imported(ImportedProduct(name="Milk", qty=1, qty_unit="l", price=1.2, category="drinks"))
+        self.assertFalse(journal.is_done(image))
+        self.assertEqual(journal.pending_imports(), [])
+
+
+class TestSQLiteHarvestJournal(TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._db_path = str(Path(self._temp_dir.name) / "journal.sqlite")
+        self._image_path = Path(self._temp_dir.name) / "image.jpg"
+        self._image_path.write_bytes(b"image content")
+        self._image = Image(id="image1", data=str(self._image_path))
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _make_product(self, image: Image) -> ImportedProduct:
+        return ImportedProduct(
+            name="Milk", qty=1, qty_unit="l", price=1.2, category="drinks", source_image=image, is_barcode_checked=True
+        )
+
+    def test_stages(self):
+        journal = SQLiteHarvestJournal(self._db_path)
+        self.assertIsNone(journal.get_stage(self._image))
+        journal.mark_retrieved(self._image)
+        self.assertEqual(journal.get_stage(self._image), "retrieved")
+        self.assertFalse(journal.is_done(self._image))
+        journal.mark_failed(self._image)
+        self.assertEqual(journal.get_stage(self._image), "failed")
+        self.assertFalse(journal.is_done(self._image))
+        journal.mark_extracted(self._make_product(self._image))
+        self.assertEqual(journal.get_stage(self._image), "extracted")
+        self.assertTrue(journal.is_done(self._image))
+        journal.mark_imported(self._make_product(self._image))
+        self.assertEqual(journal.get_stage(self._image), "imported")
+        self.assertTrue(journal.is_done(self._image))
+        self.assertEqual(journal.pending_imports(), [])
+
+    def test_persisted_across_instances(self):
+        SQLiteHarvestJournal(self._db_path).mark_imported(self._make_product(self._image))
+        self.assertTrue(SQLiteHarvestJournal(self._db_path).is_done(self._image))
+
+    def test_changed_content_is_not_done(self):
+        SQLiteHarvestJournal(self._db_path).mark_imported(self._make_product(self._image))
+        self._image_path.write_bytes(b"another content")
+        retrieved_again = Image(id="image1", data=str(self._image_path))
+        self.assertFalse(SQLiteHarvestJournal(self._db_path).is_done(retrieved_again))
+
+    def test_pending_imports_replay(self):
+        image = Image(id="image1", data=str(self._image_path), meta=_ShopImageMeta({"shop_id": "7"}))
+        product = self._make_product(image)
+        SQLiteHarvestJournal(self._db_path).mark_extracted(product)
+
+        journal = SQLiteHarvestJournal(self._db_path)
+        pending = journal.pending_imports()
+        self.assertEqual(len(pending), 1)
+        self.assertEqual(pending[0].model_dump(), product.model_dump())
+        self.assertEqual(pending[0].source_image.meta["shop_id"], "7")
+        pending[0].source_image.meta.adjust_product(pending[0])
+        self.assertEqual(pending[0].barcode, "")
+
+        journal.mark_imported(pending[0])
+        self.assertEqual(journal.pending_imports(), [])
+        self.assertTrue(journal.is_done(image))
+
+    def test_pending_imports_do_not_store_base64_data(self):
+        image = Image(id="uploaded", data="data:image/png;base64,aW1hZ2U=")
+        journal = SQLiteHarvestJournal(self._db_path)
+        journal.mark_extracted(self._make_product(image))
+        pending = journal.pending_imports()
+        self.assertEqual(pending[0].source_image, Image(id="uploaded", data="", meta=NoImageMeta()))
+        journal.mark_imported(pending[0])
+        self.assertEqual(journal.get_stage(image), "imported")
+
+    def test_multiple_products_of_one_image(self):
+        journal = SQLiteHarvestJournal(self._db_path)
+        products = [self._make_product(self._image), self._make_product(self._image).model_copy(update={"name": "Tea"})]
+        for product in products:
+            journal.mark_extracted(product)
+        self.assertEqual([product.name for product in journal.pending_imports()], ["Milk", "Tea"])
+
+        journal.mark_imported(products[0])
+        self.assertEqual(journal.get_stage(self._image), "extracted")
+        self.assertEqual([product.name for product in SQLiteHarvestJournal(self._db_path).pending_imports()], ["Tea"])
+
+        journal.mark_imported(products[1])
+        self.assertEqual(journal.get_stage(self._image), "imported")
+        self.assertEqual(journal.pending_imports(), [])
+
+    def test_single_product_rows_are_still_replayed(self):
+        product = self._make_product(self._image)
+        journal = SQLiteHarvestJournal(self._db_path)
+        journal.mark_extracted(product)
+        journal._connection.execute("UPDATE images SET product = ?", (product.model_dump_json(),))
+        self.assertEqual(journal.pending_imports(), [product])
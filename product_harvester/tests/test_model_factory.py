@@ -1,9 +1,30 @@
-from unittest import TestCase
-from unittest.mock import MagicMock
+import asyncio
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from unittest import IsolatedAsyncioTestCase, TestCase
+from zoneinfo import ZoneInfo
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
 
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage
 from langchain_core.rate_limiters import InMemoryRateLimiter
+from langchain_core.tools import tool
 
-from product_harvester.model_factory import ModelFactory, ModelWithLimits, RateLimitedModelFactory, SingleModelFactory
+from product_harvester.model_factory import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LatencyAwareModelFactory,
+    ModelFactory,
+    ModelWithLimits,
+    QuotaExhaustedError,
+    QuotaState,
+    RateLimitedModelFactory,
+    SingleModelFactory,
+    SQLiteQuotaStore,
+)
+from product_harvester.rate_limiters import SQLiteRateLimiter
 
 
 class TestModelFactory(TestCase):
@@ -26,21 +47,432 @@ class TestRateLimitedModelFactory(TestCase):
         self.model3 = ModelWithLimits(model=MagicMock(), rpm=30, rpd=2)
 
     def test_initialization_sets_rate_limiters(self):
-        RateLimitedModelFactory([self.model1, self.model2])
-        self.assertIsInstance(self.model1.model.rate_limiter, InMemoryRateLimiter)
-        self.assertIsInstance(self.model2.model.rate_limiter, InMemoryRateLimiter)
-        self.assertEqual(self.model1.model.rate_limiter.requests_per_second, 1)
-        self.assertEqual(self.model2.model.rate_limiter.requests_per_second, 2)
+        factory = RateLimitedModelFactory([self.model1, self.model2])
+        first_limiter, second_limiter = factory._rate_limiters
+        self.assertIsInstance(first_limiter, InMemoryRateLimiter)
+        self.assertIsInstance(second_limiter, InMemoryRateLimiter)
+        self.assertEqual(first_limiter.requests_per_second, 1)
+        self.assertEqual(second_limiter.requests_per_second, 2)
 
-    def test_get_model(self):
+    def test_shared_rate_limiters(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            factory = RateLimitedModelFactory(
+                [self.model1, self.model2], rate_limiter_path=str(Path(temp_dir) / "limits.sqlite")
+            )
+            first_limiter, second_limiter = factory._rate_limiters
+            self.assertIsInstance(first_limiter, SQLiteRateLimiter)
+            self.assertEqual(second_limiter.requests_per_second, 2)
+            self.assertNotEqual(first_limiter._key, second_limiter._key)
+
+    def test_rate_limit_wait_is_not_measured_as_latency(self):
+        model = FakeMessagesListChatModel(responses=[AIMessage(content="a")])
+        factory = LatencyAwareModelFactory([ModelWithLimits(model=model, rpm=600, rpd=10)])
+        rate_limiter = Mock()
+        rate_limiter.acquire.side_effect = lambda blocking: time.sleep(0.2)
+        factory._rate_limiters = [rate_limiter]
+
+        factory.get_model().invoke("a")
+
+        rate_limiter.acquire.assert_called_once_with(blocking=True)
+        self.assertLess(factory.latencies[0].latency_seconds, 0.1)
+        self.assertIsNone(model.rate_limiter)
+
+    def test_acquire_model_until_daily_quota_is_exhausted(self):
         factory = RateLimitedModelFactory([self.model1, self.model2, self.model3])
+        acquired = [factory.acquire_model() for _ in range(10)]
+        self.assertEqual(acquired.count(self.model1.model), 5)
+        self.assertEqual(acquired.count(self.model2.model), 3)
+        self.assertEqual(acquired.count(self.model3.model), 2)
+        with self.assertRaises(QuotaExhaustedError):
+            factory.acquire_model()
+
+    def test_acquire_least_loaded_model(self):
+        factory = RateLimitedModelFactory([self.model1, self.model2, self.model3])
+        acquired = [factory.acquire_model() for _ in range(4)]
+        # All are idle at first, so the daily quota decides, then the share of the free minute requests does
+        self.assertEqual(acquired, [self.model1.model, self.model2.model, self.model3.model, self.model2.model])
+
+    @patch("product_harvester.model_factory.time.time")
+    def test_minute_requests_expire(self, mock_time):
+        factory = RateLimitedModelFactory([ModelWithLimits(model=MagicMock(), rpm=2, rpd=100)])
+        mock_time.return_value = 1000
+        factory.acquire_model()
+        factory.acquire_model()
+        self.assertEqual(factory.quotas[0].requests_last_minute, 2)
+        mock_time.return_value = 1060
+        self.assertEqual(factory.quotas[0].requests_last_minute, 0)
+
+    def test_quotas(self):
+        factory = RateLimitedModelFactory([self.model1, self.model2])
+        factory.acquire_model()
+        quotas = factory.quotas
+        self.assertEqual(
+            [(quota.rpm, quota.requests_last_minute, quota.remaining_rpd, quota.requests) for quota in quotas],
+            [(60, 1, 4, 1), (120, 0, 3, 0)],
+        )
+
+    def test_configured_limits_are_not_changed(self):
+        models = [self.model1, self.model2]
+        factory = RateLimitedModelFactory(models)
+        for _ in range(3):
+            factory.acquire_model()
+        self.assertEqual([model_with_limits.rpd for model_with_limits in models], [5, 3])
+        self.assertEqual([quota.remaining_rpd for quota in RateLimitedModelFactory(models).quotas], [5, 3])
+
+    def test_every_request_of_a_batch_is_dispatched(self):
+        models = [
+            ModelWithLimits(model=FakeMessagesListChatModel(responses=[AIMessage(content="first")]), rpm=600, rpd=2),
+            ModelWithLimits(model=FakeMessagesListChatModel(responses=[AIMessage(content="second")]), rpm=600, rpd=1),
+        ]
+        factory = RateLimitedModelFactory(models)
+        model = factory.get_model()
+
+        responses = model.batch(["a", "b", "c"], config={"max_concurrency": 1})
+
+        self.assertEqual(sorted(response.content for response in responses), ["first", "first", "second"])
+        self.assertEqual([quota.remaining_rpd for quota in factory.quotas], [0, 0])
+        self.assertIs(factory.get_model(), model)
+        self.assertIsInstance(model.batch(["d"], return_exceptions=True)[0], QuotaExhaustedError)
+
+    def test_bound_tools_are_passed_to_dispatched_model(self):
+        @tool
+        def get_price(name: str) -> float:
+            """Get the price of the product."""
+
+        inner_model = MagicMock()
+        inner_model.bind_tools.return_value.invoke.return_value = AIMessage(
+            content="", tool_calls=[{"name": "get_price", "args": {"name": "Milk"}, "id": "1"}]
+        )
+        factory = RateLimitedModelFactory([ModelWithLimits(model=inner_model, rpm=6000, rpd=1)])
+
+        response = factory.get_model().bind_tools([get_price], tool_choice="any").invoke("price of milk")
+
+        inner_model.bind_tools.assert_called_once_with([get_price], tool_choice="any")
+        self.assertEqual(response.tool_calls[0]["args"], {"name": "Milk"})
+
+
+class TestRateLimitedModelFactoryAsync(IsolatedAsyncioTestCase):
+    async def test_abatch(self):
+        factory = RateLimitedModelFactory(
+            [ModelWithLimits(model=FakeMessagesListChatModel(responses=[AIMessage(content="a")]), rpm=600, rpd=2)]
+        )
+        responses = await factory.get_model().abatch(["a", "b"])
+        self.assertEqual([response.content for response in responses], ["a", "a"])
+        self.assertEqual(factory.quotas[0].remaining_rpd, 0)
+
+    @patch("product_harvester.model_factory.time.time")
+    async def test_cancelled_probe_does_not_keep_circuit_open(self, mock_time):
+        mock_time.return_value = 1000.0
+        model = MagicMock()
+
+        async def hang(*_args, **_kwargs):
+            await asyncio.sleep(60)
+
+        model.ainvoke = AsyncMock(side_effect=hang)
+        factory = RateLimitedModelFactory([ModelWithLimits(model=model, rpm=600, rpd=10)], failure_threshold=1)
+        factory._report(model, 1.0, failed=True)
+        mock_time.return_value = 1100.0
+        probe = asyncio.create_task(factory.get_model().ainvoke("a"))
+        while not model.ainvoke.await_count:
+            await asyncio.sleep(0)
+        self.assertEqual(factory.quotas[0].circuit, "open")
+
+        probe.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await probe
+
+        self.assertEqual(factory.quotas[0].circuit, "half_open")
+        self.assertIs(factory.acquire_model(), model)
+
+
+class TestCircuitBreaker(TestCase):
+    def test_opens_after_repeated_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, recovery_seconds=30)
+        breaker.on_failure(1000)
+        self.assertEqual(breaker.state(1000), "closed")
+        breaker.on_failure(1001)
+        self.assertEqual(breaker.state(1001), "open")
+        self.assertFalse(breaker.allows_request(1030))
+
+    def test_success_resets_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2)
+        breaker.on_failure(1000)
+        breaker.on_success()
+        breaker.on_failure(1001)
+        self.assertEqual(breaker.state(1001), "closed")
+
+    def test_half_open_allows_single_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_seconds=30)
+        breaker.on_failure(1000)
+        self.assertEqual(breaker.state(1030), "half_open")
+        breaker.on_request(1030)
+        self.assertFalse(breaker.allows_request(1031))
+        breaker.on_success()
+        self.assertEqual(breaker.state(1031), "closed")
+
+    def test_failed_probe_opens_again(self):
+        breaker = CircuitBreaker(failure_threshold=3, recovery_seconds=30)
+        for _ in range(3):
+            breaker.on_failure(1000)
+        breaker.on_request(1030)
+        breaker.on_failure(1031)
+        self.assertEqual(breaker.state(1060), "open")
+        self.assertEqual(breaker.state(1061), "half_open")
+
+    def test_unanswered_probe_expires(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_seconds=30)
+        breaker.on_failure(1000)
+        breaker.on_request(1030)
+        self.assertEqual(breaker.state(1059), "open")
+        self.assertEqual(breaker.state(1060), "half_open")
+
+    def test_cancelled_probe_is_released(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_seconds=30)
+        breaker.on_failure(1000)
+        breaker.on_request(1030)
+        breaker.on_cancel()
+        self.assertEqual(breaker.state(1031), "half_open")
+
+
+class TestRateLimitedModelFactoryCircuitBreaker(TestCase):
+    def setUp(self):
+        self.failing = ModelWithLimits(model=MagicMock(), rpm=60, rpd=100)
+        self.healthy = ModelWithLimits(model=MagicMock(), rpm=30, rpd=100)
+
+    @patch("product_harvester.model_factory.time.time", return_value=1000.0)
+    def test_traffic_moves_to_remaining_models(self, _mock_time):
+        factory = RateLimitedModelFactory([self.failing, self.healthy], failure_threshold=2)
+        factory._report(self.failing.model, 1.0, failed=True)
+        factory._report(self.failing.model, 1.0, failed=True)
+        self.assertEqual([factory.acquire_model() for _ in range(3)], [self.healthy.model] * 3)
+        self.assertEqual([quota.circuit for quota in factory.quotas], ["open", "closed"])
+
+    @patch("product_harvester.model_factory.time.time")
+    def test_failed_model_is_probed_and_restored(self, mock_time):
+        mock_time.return_value = 1000.0
+        factory = RateLimitedModelFactory([self.failing, self.healthy], failure_threshold=1, recovery_seconds=30)
+        factory._report(self.failing.model, 1.0, failed=True)
+        mock_time.return_value = 1100.0
+        self.assertIs(factory.acquire_model(), self.failing.model)
+        self.assertIs(factory.acquire_model(), self.healthy.model)
+        factory._report(self.failing.model, 1.0, failed=False)
+        self.assertEqual(factory.quotas[0].circuit, "closed")
+
+    def test_all_circuits_open(self):
+        factory = RateLimitedModelFactory([self.failing], failure_threshold=1)
+        factory._report(self.failing.model, 1.0, failed=True)
+        with self.assertRaises(CircuitOpenError):
+            factory.acquire_model()
+
+    def test_dispatched_failures_open_circuit(self):
+        self.failing.model.invoke.side_effect = TimeoutError("Request timed out")
+        failing = ModelWithLimits(model=self.failing.model, rpm=6000, rpd=100)
+        factory = RateLimitedModelFactory([failing], failure_threshold=2)
+        model = factory.get_model()
+        for _ in range(2):
+            with self.assertRaises(TimeoutError):
+                model.invoke("a")
+        with self.assertRaises(CircuitOpenError):
+            model.invoke("a")
+        self.assertEqual(factory.quotas[0].remaining_rpd, 98)
+
+    def test_dispatched_server_errors_open_circuit(self):
+        error = Exception("Service unavailable")
+        error.status_code = 503
+        self.failing.model.invoke.side_effect = error
+        failing = ModelWithLimits(model=self.failing.model, rpm=6000, rpd=100)
+        factory = RateLimitedModelFactory([failing], failure_threshold=1)
+        model = factory.get_model()
+        with self.assertRaisesRegex(Exception, "Service unavailable"):
+            model.invoke("a")
+        with self.assertRaises(CircuitOpenError):
+            model.invoke("a")
+
+    def test_dispatched_request_errors_do_not_open_circuit(self):
+        error = Exception("Bad request")
+        error.status_code = 400
+        self.failing.model.invoke.side_effect = [ValueError("Unreadable image"), error, error]
+        failing = ModelWithLimits(model=self.failing.model, rpm=6000, rpd=100)
+        factory = RateLimitedModelFactory([failing], failure_threshold=1)
+        model = factory.get_model()
+        with self.assertRaises(ValueError):
+            model.invoke("a")
+        for _ in range(2):
+            with self.assertRaisesRegex(Exception, "Bad request"):
+                model.invoke("a")
+        self.assertEqual(self.failing.model.invoke.call_count, 3)
+
+
+class TestLatencyAwareModelFactory(TestCase):
+    def setUp(self):
+        self.fast = ModelWithLimits(model=MagicMock(), rpm=60, rpd=100)
+        self.slow = ModelWithLimits(model=MagicMock(), rpm=60, rpd=100)
+
+    def test_unmeasured_models_are_tried_first(self):
+        factory = LatencyAwareModelFactory([self.fast, self.slow])
+        factory._report(self.fast.model, 1.0, failed=False)
+        self.assertIs(factory.acquire_model(), self.slow.model)
+
+    def test_always_failing_unmeasured_model_is_avoided(self):
+        failing_model = MagicMock()
+        failing_model.invoke.side_effect = ConnectionError("Model is down")
+        working_model = FakeMessagesListChatModel(responses=[AIMessage(content="a")])
+        factory = LatencyAwareModelFactory(
+            [
+                ModelWithLimits(model=failing_model, rpm=6000, rpd=100),
+                ModelWithLimits(model=working_model, rpm=6000, rpd=100),
+            ],
+            failure_threshold=100,
+        )
+
+        responses = factory.get_model().batch(["a"] * 10, config={"max_concurrency": 1}, return_exceptions=True)
+
+        self.assertEqual(failing_model.invoke.call_count, 1)
+        self.assertEqual(sum(isinstance(response, ConnectionError) for response in responses), 1)
+        self.assertIsNone(factory.latencies[0].latency_seconds)
+        self.assertGreater(factory.latencies[0].expected_seconds, factory.latencies[1].expected_seconds)
+
+    def test_acquire_fastest_model(self):
+        factory = LatencyAwareModelFactory([self.slow, self.fast])
+        factory._report(self.slow.model, 4.0, failed=False)
+        factory._report(self.fast.model, 1.0, failed=False)
+        self.assertEqual([factory.acquire_model() for _ in range(3)], [self.fast.model] * 3)
+
+    def test_latency_is_smoothed(self):
+        factory = LatencyAwareModelFactory([self.fast], smoothing=0.5)
+        factory._report(self.fast.model, 1.0, failed=False)
+        factory._report(self.fast.model, 3.0, failed=False)
+        factory._report(self.fast.model, 0.5, failed=True)
+        latency = factory.latencies[0]
+        self.assertEqual((latency.latency_seconds, latency.error_rate, latency.expected_seconds), (2.0, 0.5, 4.0))
+
+    @patch("product_harvester.model_factory.time.time", return_value=1000.0)
+    def test_errors_and_weights_change_expected_time(self, _mock_time):
+        factory = LatencyAwareModelFactory([self.fast, self.slow], weights=[1.0, 4.0])
+        factory._report(self.fast.model, 1.0, failed=False)
+        factory._report(self.slow.model, 2.0, failed=False)
+        self.assertIs(factory.acquire_model(), self.slow.model)
+        for _ in range(4):
+            factory._report(self.slow.model, 2.0, failed=True)
+        # The slow model also waits a second for the next token of its rate limiter
+        self.assertEqual([round(latency.expected_seconds, 2) for latency in factory.latencies], [1.0, 2.22])
+        self.assertIs(factory.acquire_model(), self.fast.model)
+
+    @patch("product_harvester.model_factory.time.time", return_value=1000.0)
+    def test_queued_requests_wait_for_the_bucket(self, _mock_time):
+        factory = LatencyAwareModelFactory([ModelWithLimits(model=MagicMock(), rpm=30, rpd=100)])
+        for _ in range(3):
+            factory.acquire_model()
+        self.assertEqual(factory.latencies[0].expected_seconds, 6.0 + 1.0)
+
+    @patch("product_harvester.model_factory.time.time", return_value=1000.0)
+    def test_model_at_rate_limit_waits_for_its_window(self, _mock_time):
+        fast = ModelWithLimits(model=MagicMock(), rpm=1, rpd=100)
+        factory = LatencyAwareModelFactory([fast, self.slow])
+        factory._report(fast.model, 1.0, failed=False)
+        factory._report(self.slow.model, 10.0, failed=False)
+        self.assertIs(factory.acquire_model(), fast.model)
+        self.assertIs(factory.acquire_model(), self.slow.model)
+        self.assertEqual(factory.latencies[0].expected_seconds, 61.0)
+
+    def test_dispatched_requests_are_measured(self):
+        model = FakeMessagesListChatModel(responses=[AIMessage(content="a")])
+        factory = LatencyAwareModelFactory([ModelWithLimits(model=model, rpm=600, rpd=2)])
+        factory.get_model().invoke("a")
+        self.assertIsNotNone(factory.latencies[0].latency_seconds)
+        self.assertEqual(factory.latencies[0].error_rate, 0.0)
+
+    def test_invalid_weights(self):
+        with self.assertRaises(ValueError):
+            LatencyAwareModelFactory([self.fast, self.slow], weights=[1.0])
+        with self.assertRaises(ValueError):
+            LatencyAwareModelFactory([self.fast], weights=[0.0])
+
+
+class TestSQLiteQuotaStore(TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._db_path = str(Path(self._temp_dir.name) / "quotas.sqlite")
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def test_add_requests_and_load(self):
+        store = SQLiteQuotaStore(self._db_path)
+        self.assertIsNone(store.load("gemini"))
+        store.add_requests("gemini", "2026-10-16", 1, 1000.5)
+        state = store.add_requests("gemini", "2026-10-16", 2, 1001.0)
+        self.assertEqual(state, QuotaState(window="2026-10-16", used_rpd=3, recent_requests=[1000.5, 1001.0]))
+        self.assertEqual(SQLiteQuotaStore(self._db_path).load("gemini"), state)
+
+    def test_requests_of_other_stores_are_added(self):
+        first_store, second_store = SQLiteQuotaStore(self._db_path), SQLiteQuotaStore(self._db_path)
+        first_store.add_requests("gemini", "2026-10-16", 1, 1000.0)
+        second_store.add_requests("gemini", "2026-10-16", 1, 1001.0)
+        state = first_store.add_requests("gemini", "2026-10-16", 1, 1070.0)
+        self.assertEqual(state, QuotaState(window="2026-10-16", used_rpd=3, recent_requests=[1070.0]))
+
+    def test_new_window_starts_from_zero(self):
+        store = SQLiteQuotaStore(self._db_path)
+        store.add_requests("gemini", "2026-10-15", 5, 1000.0)
+        self.assertEqual(store.add_requests("gemini", "2026-10-16", 1, 1001.0).used_rpd, 1)
+
+
+class TestRateLimitedModelFactoryQuotaStore(TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._db_path = str(Path(self._temp_dir.name) / "quotas.sqlite")
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _make_factory(self) -> RateLimitedModelFactory:
+        models = [
+            ModelWithLimits(model=MagicMock(), rpm=60, rpd=5, name="first_key"),
+            ModelWithLimits(model=MagicMock(), rpm=60, rpd=5, name="second_key"),
+        ]
+        return RateLimitedModelFactory(models, quota_store=SQLiteQuotaStore(self._db_path))
+
+    @patch.object(RateLimitedModelFactory, "_current_window", return_value="2026-10-16")
+    def test_restart_continues_with_remaining_quota(self, _mock_current_window):
+        factory = self._make_factory()
+        for _ in range(3):
+            factory.acquire_model()
+
+        restarted_factory = self._make_factory()
+
+        self.assertEqual([quota.remaining_rpd for quota in restarted_factory.quotas], [3, 4])
+        self.assertEqual([quota.requests_last_minute for quota in restarted_factory.quotas], [2, 1])
+
+    @patch.object(RateLimitedModelFactory, "_current_window", return_value="2026-10-16")
+    def test_factories_sharing_store_count_all_requests(self, _mock_current_window):
+        first_factory, second_factory = self._make_factory(), self._make_factory()
+        for _ in range(4):
+            first_factory.acquire_model()
+            second_factory.acquire_model()
+
+        self.assertEqual([quota.remaining_rpd for quota in second_factory.quotas], [1, 1])
+        second_factory.acquire_model()
+        first_factory.acquire_model()
+        with self.assertRaises(QuotaExhaustedError):
+            first_factory.acquire_model()
+
+    def test_quota_of_previous_window_is_not_reloaded(self):
+        with patch.object(RateLimitedModelFactory, "_current_window", return_value="2026-10-15"):
+            self._make_factory().acquire_model()
+        with patch.object(RateLimitedModelFactory, "_current_window", return_value="2026-10-16"):
+            self.assertEqual([quota.remaining_rpd for quota in self._make_factory().quotas], [5, 5])
+
+    def test_quota_is_reset_when_window_passes(self):
+        with patch.object(RateLimitedModelFactory, "_current_window", return_value="2026-10-15"):
+            factory = self._make_factory()
+            factory.acquire_model()
+        with patch.object(RateLimitedModelFactory, "_current_window", return_value="2026-10-16"):
+            self.assertEqual([quota.remaining_rpd for quota in factory.quotas], [5, 5])
 
-        for i in range(10):
-            if i >= 5:
-                self.assertIsNone(factory.get_model())
-            if i < 5:
-                self.assertEqual(self.model1.model, factory.get_model())
-            if i < 3:
-                self.assertEqual(self.model2.model, factory.get_model())
-            if i < 2:
-                self.assertEqual(self.model3.model, factory.get_model())
+    def test_window_follows_reset_timezone(self):
+        factory = RateLimitedModelFactory([], reset_timezone="Pacific/Kiritimati")
+        with patch("product_harvester.model_factory.datetime") as mock_datetime:
+            mock_datetime.now.return_value = datetime(2026, 10, 17, 1, 0)
+            self.assertEqual(factory._current_window(), "2026-10-17")
+            mock_datetime.now.assert_called_once_with(ZoneInfo("Pacific/Kiritimati"))
@@ -0,0 +1,158 @@
+import base64
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+import cv2
+import numpy as np
+
+from product_harvester.barcodes import DecodedBarcode
+from product_harvester.image import Image
+from product_harvester.preprocessors import ImageDownscaler, ImagePreprocessing, ImagePreprocessor, PriceTagCropper
+from product_harvester.tests.helpers import make_image
+
+
+def _decode_data_url(data_url: str) -> np.ndarray:
+    content = base64.b64decode(data_url.split(",", 1)[1])
+    return cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+
+
+class TestImagePreprocessor(TestCase):
+    def test_not_implemented(self):
+        with self.assertRaises(TypeError):
+            ImagePreprocessor().preprocess(np.zeros((1, 1)))
+
+
+class TestImageDownscaler(TestCase):
+    def test_downscale_landscape(self):
+        result = ImageDownscaler(max_long_edge=100).preprocess(np.zeros((300, 400, 3), dtype=np.uint8))
+        self.assertEqual(result.shape, (75, 100, 3))
+
+    def test_downscale_portrait(self):
+        result = ImageDownscaler(max_long_edge=100).preprocess(np.zeros((400, 300, 3), dtype=np.uint8))
+        self.assertEqual(result.shape, (100, 75, 3))
+
+    def test_small_image_is_not_upscaled(self):
+        image = np.zeros((50, 80, 3), dtype=np.uint8)
+        self.assertIs(ImageDownscaler(max_long_edge=100).preprocess(image), image)
+
+
+def _make_shelf(tags: list[tuple[int, int, int, int]]) -> np.ndarray:
+    shelf = np.full((600, 800, 3), 90, dtype=np.uint8)
+    for left, top, width, height in tags:
+        cv2.rectangle(shelf, (left, top), (left + width, top + height), (255, 255, 255), thickness=-1)
+        cv2.rectangle(shelf, (left, top), (left + width, top + height), (0, 0, 0), thickness=3)
+        cv2.putText(shelf, "1.99", (left + 10, top + height // 2), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+    return shelf
+
+
+class TestPriceTagCropper(TestCase):
+    def setUp(self):
+        self._decoder = Mock()
+        self._decoder.decode.return_value = []
+
+    def test_crop_to_price_tag(self):
+        result = PriceTagCropper(margin=0, barcode_decoder=self._decoder).preprocess(
+            _make_shelf([(500, 300, 200, 120)])
+        )
+        self.assertAlmostEqual(result.shape[0], 120, delta=10)
+        self.assertAlmostEqual(result.shape[1], 200, delta=10)
+
+    def test_crop_includes_margin(self):
+        cropper = PriceTagCropper(margin=0.1, barcode_decoder=self._decoder)
+        result = cropper.preprocess(_make_shelf([(500, 300, 200, 120)]))
+        self.assertAlmostEqual(result.shape[0], 144, delta=12)
+        self.assertAlmostEqual(result.shape[1], 240, delta=12)
+
+    def test_several_tags_without_barcode_keep_full_image(self):
+        image = _make_shelf([(50, 50, 120, 80), (400, 300, 240, 160)])
+        self.assertIs(PriceTagCropper(barcode_decoder=self._decoder).preprocess(image), image)
+
+    def test_frame_inside_tag_is_not_another_tag(self):
+        shelf = _make_shelf([(400, 300, 240, 160)])
+        cv2.rectangle(shelf, (420, 320), (620, 440), (0, 0, 0), thickness=2)
+        result = PriceTagCropper(margin=0, barcode_decoder=self._decoder).preprocess(shelf)
+        self.assertAlmostEqual(result.shape[1], 240, delta=10)
+
+    def test_tag_with_barcode_is_chosen(self):
+        self._decoder.decode.return_value = [DecodedBarcode("123", center_x=100 / 800, center_y=100 / 600)]
+        cropper = PriceTagCropper(margin=0, barcode_decoder=self._decoder)
+        result = cropper.preprocess(_make_shelf([(50, 50, 120, 80), (400, 300, 240, 160)]))
+        self.assertAlmostEqual(result.shape[1], 120, delta=10)
+
+    def test_given_barcodes_are_used_instead_of_decoding(self):
+        cropper = PriceTagCropper(margin=0, barcode_decoder=self._decoder)
+        barcodes = [DecodedBarcode("123", center_x=100 / 800, center_y=100 / 600)]
+        result = cropper.preprocess_with_barcodes(_make_shelf([(50, 50, 120, 80), (400, 300, 240, 160)]), barcodes)
+        self.assertAlmostEqual(result.shape[1], 120, delta=10)
+        self._decoder.decode.assert_not_called()
+
+    def test_no_tag_keeps_full_image(self):
+        image = np.full((600, 800, 3), 90, dtype=np.uint8)
+        self.assertIs(PriceTagCropper(barcode_decoder=self._decoder).preprocess(image), image)
+
+    def test_barcode_outside_of_tags_keeps_full_image(self):
+        self._decoder.decode.return_value = [DecodedBarcode("123", center_x=330 / 800, center_y=510 / 600)]
+        image = _make_shelf([(500, 300, 200, 120)])
+        self.assertIs(PriceTagCropper(barcode_decoder=self._decoder).preprocess(image), image)
+
+    def test_grayscale_image(self):
+        shelf = cv2.cvtColor(_make_shelf([(500, 300, 200, 120)]), cv2.COLOR_BGR2GRAY)
+        cropper = PriceTagCropper(margin=0, barcode_decoder=self._decoder)
+        self.assertAlmostEqual(cropper.preprocess(shelf).shape[1], 200, delta=10)
+
+
+class TestImagePreprocessing(TestCase):
+    def setUp(self):
+        gradient = np.tile(np.linspace(0, 255, 400, dtype=np.uint8), (300, 1))
+        self._array = cv2.merge([gradient, gradient, gradient])
+        self._image = make_image("image1", self._array)
+
+    def test_no_preprocessors_passes_original_data(self):
+        images = [self._image, Image(id="image2", data="/image2.jpg")]
+        self.assertEqual(ImagePreprocessing().prepare(images), [self._image.data, "/image2.jpg"])
+
+    def test_resize_and_encode_jpeg(self):
+        urls = ImagePreprocessing([ImageDownscaler(max_long_edge=200)], quality=70).prepare([self._image])
+        self.assertTrue(urls[0].startswith("data:image/jpeg;base64,"))
+        self.assertEqual(_decode_data_url(urls[0]).shape, (150, 200, 3))
+
+    def test_resize_and_encode_webp(self):
+        urls = ImagePreprocessing([ImageDownscaler(max_long_edge=200)], image_format="webp").prepare([self._image])
+        self.assertTrue(urls[0].startswith("data:image/webp;base64,"))
+        self.assertEqual(_decode_data_url(urls[0]).shape, (150, 200, 3))
+
+    def test_quality_affects_size(self):
+        low = ImagePreprocessing([ImageDownscaler()], quality=10).prepare([self._image])[0]
+        high = ImagePreprocessing([ImageDownscaler()], quality=95).prepare([self._image])[0]
+        self.assertLess(len(low), len(high))
+
+    def test_batch_keeps_order_and_falls_back_on_failure(self):
+        images = [
+            make_image("small", self._array[:100, :100]),
+            Image(id="broken", data="/missing.png"),
+            self._image,
+        ]
+        urls = ImagePreprocessing([ImageDownscaler(max_long_edge=50)], max_workers=2).prepare(images)
+        self.assertEqual(_decode_data_url(urls[0]).shape, (50, 50, 3))
+        self.assertEqual(urls[1], "/missing.png")
+        self.assertEqual(_decode_data_url(urls[2]).shape, (38, 50, 3))
+
+    @patch("product_harvester.preprocessors.cv2.imencode", return_value=(False, None))
+    def test_encoding_failure_falls_back_to_original(self, _mock_imencode):
+        urls = ImagePreprocessing([ImageDownscaler()]).prepare([self._image])
+        self.assertEqual(urls, [self._image.data])
+
+    def test_barcodes_are_read_only_for_preprocessors_using_them(self):
+        decoder = Mock()
+        read_barcodes = Mock(return_value=[])
+        ImagePreprocessing([ImageDownscaler()]).prepare([self._image], read_barcodes)
+        read_barcodes.assert_not_called()
+
+        ImagePreprocessing([PriceTagCropper(barcode_decoder=decoder)]).prepare([self._image], read_barcodes)
+        read_barcodes.assert_called_once_with(self._image)
+        decoder.decode.assert_not_called()
+
+    def test_repr_reflects_configuration(self):
+        self.assertNotEqual(
+            repr(ImagePreprocessing([ImageDownscaler(100)])), repr(ImagePreprocessing([ImageDownscaler(200)]))
+        )
@@ -1,13 +1,21 @@
+import json
+import pickle
+import time
+from concurrent.futures import Future
+from threading import Lock
 from typing import List
-from unittest import TestCase
+from unittest import IsolatedAsyncioTestCase, TestCase
 from unittest.mock import Mock, patch, MagicMock, mock_open
 
 import numpy as np
 from langchain_core.language_models import BaseChatModel
 from langchain_core.language_models.fake_chat_models import FakeListChatModelError, FakeMessagesListChatModel
 from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableLambda
 from pydantic import TypeAdapter
 
+from product_harvester.barcodes import DecodedBarcode, PyzbarBarcodeDecoder
+from product_harvester.caches import LRUBarcodeCache, NoBarcodeCache
 from product_harvester.image import Image
 from product_harvester.processors import (
     _PriceTagProcessingResult,
@@ -17,8 +25,27 @@ from product_harvester.processors import (
     _BarcodeReader,
     PerImageProcessingResult,
     ProcessingError,
+    ShelfImageProcessor,
 )
-from product_harvester.product import Product
+from product_harvester.product import Product, ProductRegion, ShelfProduct
+
+
+class _SlowFirstImageProcessor(ImageProcessor):
+    def __init__(self):
+        self.peak_in_flight = 0
+        self._in_flight = 0
+        self._lock = Lock()
+
+    def process(self, images: list[Image]) -> ProcessingResult:
+        with self._lock:
+            self._in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self._in_flight)
+        time.sleep(0.1 if images[0].id == "image1" else 0.01)
+        with self._lock:
+            self._in_flight -= 1
+        if images[0].id == "broken":
+            raise ValueError("Unreadable image")
+        return ProcessingResult([PerImageProcessingResult(input_image=images[0], output=ProcessingError("x"))])
 
 
 class TestImageProcessor(TestCase):
@@ -26,6 +53,62 @@ class TestImageProcessor(TestCase):
         with self.assertRaises(TypeError):
             ImageProcessor().process([Image(id="image", data="/image.png")])
 
+    def test_process_iter_yields_in_completion_order(self):
+        images = [Image(id="image1", data="/image1.png"), Image(id="image2", data="/image2.png")]
+        results = list(_SlowFirstImageProcessor().process_iter(images))
+        self.assertEqual([result.input_image for result in results], [images[1], images[0]])
+
+    def test_process_iter_limits_images_in_flight(self):
+        processor = _SlowFirstImageProcessor()
+        images = (Image(id=f"image{i}", data=f"/image{i}.png") for i in range(1, 7))
+        results = list(processor.process_iter(images, max_in_flight=2))
+        self.assertEqual(len(results), 6)
+        self.assertEqual(processor.peak_in_flight, 2)
+
+    def test_process_iter_failure_becomes_error_result(self):
+        image = Image(id="broken", data="/broken.png")
+        results = list(_SlowFirstImageProcessor().process_iter([image]))
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].input_image, image)
+        self.assertEqual(results[0].output.msg, "Failed to extract data from the image")
+        self.assertEqual(results[0].output.detailed_msg, "Unreadable image")
+
+    def test_process_iter_by_image_keeps_results_of_an_image_together(self):
+        class ShelfProcessor(ImageProcessor):
+            def process(self, images: list[Image]) -> ProcessingResult:
+                return ProcessingResult(
+                    [PerImageProcessingResult(input_image=images[0], output=ProcessingError(name)) for name in "ab"]
+                )
+
+        images = [Image(id="shelf1", data="/shelf1.png"), Image(id="shelf2", data="/shelf2.png")]
+        results = list(ShelfProcessor().process_iter_by_image(images))
+        self.assertEqual(len(results), 2)
+        for result in results:
+            self.assertEqual([image_result.output.msg for image_result in result.results], ["a", "b"])
+            self.assertEqual(len({image_result.input_image.id for image_result in result.results}), 1)
+
+
+class TestImageProcessorAsync(IsolatedAsyncioTestCase):
+    async def test_default_aprocess(self):
+        class SyncProcessor(ImageProcessor):
+            def process(self, images: list[Image]) -> ProcessingResult:
+                return ProcessingResult([PerImageProcessingResult(input_image=images[0], output=ProcessingError("x"))])
+
+        image = Image(id="image", data="/image.png")
+        result = await SyncProcessor().aprocess([image])
+        self.assertEqual(result.error_results[0].input_image, image)
+
+    async def test_aprocess_iter(self):
+        async def generate_images():
+            for image_id in ["image1", "broken", "image2"]:
+                yield Image(id=image_id, data=f"/{image_id}.png")
+
+        processor = _SlowFirstImageProcessor()
+        results = [result async for result in processor.aprocess_iter(generate_images(), max_in_flight=2)]
+        self.assertEqual([result.input_image.id for result in results], ["broken", "image2", "image1"])
+        self.assertEqual(results[0].output.detailed_msg, "Unreadable image")
+        self.assertEqual(processor.peak_in_flight, 2)
+
 
 class TestPriceTagImageProcessor(TestCase):
 
@@ -73,10 +156,10 @@ class TestPriceTagImageProcessor(TestCase):
         mock_product = Product(name="Banana", price=3.45, qty=1, qty_unit="kg", barcode="123", category="fruit")
         fake_model = self._prepare_fake_model_with_responses([mock_product.model_dump_json()])
         processor = self._prepare_processor(fake_model)
-        processor._barcode_reader.read_barcode.return_value = 45678
+        processor._barcode_reader.read_barcodes.return_value = [DecodedBarcode("45678", 0.5, 0.5)]
         input_image = Image(id="image1", data="/image1.jpg")
         result = processor.process(images=[input_image])
-        mock_product.barcode = 45678
+        mock_product.barcode = "45678"
         want_result = ProcessingResult(
             results=[PerImageProcessingResult(input_image=input_image, output=mock_product, is_barcode_checked=True)]
         )
@@ -86,7 +169,7 @@ class TestPriceTagImageProcessor(TestCase):
         mock_product = Product(name="Banana", price=3.45, qty=1, qty_unit="kg", barcode="123", category="fruit")
         fake_model = self._prepare_fake_model_with_responses([mock_product.model_dump_json()])
         processor = self._prepare_processor(fake_model)
-        processor._barcode_reader.read_barcode.side_effect = ValueError("wat")
+        processor._barcode_reader.read_barcodes.side_effect = ValueError("wat")
         input_image = Image(id="image1", data="/image1.jpg")
         result = processor.process(images=[input_image])
         want_result = ProcessingResult(results=[PerImageProcessingResult(input_image=input_image, output=mock_product)])
@@ -212,6 +295,280 @@ class TestPriceTagImageProcessor(TestCase):
         )
         self._assert_result(result, want_result)
 
+    def test_process_cached_product_skips_model(self):
+        cached_product = Product(name="Banana", price=3.45, qty=1, qty_unit="kg", barcode="123", category="fruit")
+        extracted_product = Product(name="Milk", price=4.45, qty=1000, qty_unit="ml", barcode="567", category="milk")
+        fake_model = self._prepare_fake_model_with_responses([extracted_product.model_dump_json()])
+        mock_cache = Mock()
+        mock_cache.get.side_effect = lambda image, context, product_type: (
+            cached_product if image.id == "cached" else None
+        )
+        processor = self._prepare_processor(fake_model, cache=mock_cache)
+        input_images = [Image(id="cached", data="/cached.jpg"), Image(id="new", data="/new.jpg")]
+        result = processor.process(images=input_images)
+        want_result = ProcessingResult(
+            results=[
+                PerImageProcessingResult(input_image=input_images[0], output=cached_product),
+                PerImageProcessingResult(input_image=input_images[1], output=extracted_product),
+            ]
+        )
+        self._assert_result(result, want_result)
+        cache_context = mock_cache.get.call_args.args[1]
+        self.assertIs(mock_cache.get.call_args.args[2], Product)
+        self.assertTrue(cache_context.startswith("FakeMessagesListChatModel:"))
+        mock_cache.put.assert_called_once_with(input_images[1], cache_context, extracted_product)
+
+    def test_process_all_cached_does_not_call_model(self):
+        cached_product = Product(name="Banana", price=3.45, qty=1, qty_unit="kg", barcode="123", category="fruit")
+        fake_model = Mock()
+        mock_cache = Mock()
+        mock_cache.get.return_value = cached_product
+        processor = self._prepare_processor(fake_model, cache=mock_cache)
+        input_image = Image(id="cached", data="/cached.jpg")
+        result = processor.process(images=[input_image])
+        want_result = ProcessingResult(
+            results=[PerImageProcessingResult(input_image=input_image, output=cached_product)]
+        )
+        self._assert_result(result, want_result)
+        fake_model.assert_not_called()
+        mock_cache.put.assert_not_called()
+
+    def test_process_cache_failure_falls_back_to_model(self):
+        extracted_product = Product(name="Milk", price=4.45, qty=1000, qty_unit="ml", barcode="567", category="milk")
+        fake_model = self._prepare_fake_model_with_responses([extracted_product.model_dump_json()])
+        mock_cache = Mock()
+        mock_cache.get.side_effect = OSError("Cache is unavailable")
+        mock_cache.put.side_effect = OSError("Cache is unavailable")
+        processor = self._prepare_processor(fake_model, cache=mock_cache)
+        input_image = Image(id="image1", data="/image1.jpg")
+        result = processor.process(images=[input_image])
+        want_result = ProcessingResult(
+            results=[PerImageProcessingResult(input_image=input_image, output=extracted_product)]
+        )
+        self._assert_result(result, want_result)
+
+    def test_process_sends_preprocessed_images(self):
+        mock_product = Product(name="Banana", price=3.45, qty=1, qty_unit="kg", barcode="123", category="fruit")
+        fake_model = self._prepare_fake_model_with_responses([mock_product.model_dump_json()])
+        mock_preprocessing = Mock()
+        mock_preprocessing.prepare.return_value = ["data:image/jpeg;base64,c21hbGw="]
+        processor = self._prepare_processor(fake_model, preprocessing=mock_preprocessing)
+        input_image = Image(id="image1", data="/image1.jpg")
+        with patch.object(processor, "_make_input_data", wraps=processor._make_input_data) as mock_make_input_data:
+            result = processor.process(images=[input_image])
+        mock_preprocessing.prepare.assert_called_once()
+        images, read_barcodes = mock_preprocessing.prepare.call_args.args
+        self.assertEqual(images, [input_image])
+        self.assertEqual(read_barcodes(input_image), [])
+        mock_make_input_data.assert_called_once_with(input_image, "data:image/jpeg;base64,c21hbGw=")
+        processor._barcode_reader.read_barcodes.assert_called_once_with(input_image)
+        want_result = ProcessingResult(results=[PerImageProcessingResult(input_image=input_image, output=mock_product)])
+        self._assert_result(result, want_result)
+
+    def test_process_error_keeps_original_input_image(self):
+        fake_model = Mock()
+        fake_model.side_effect = FakeListChatModelError()
+        mock_preprocessing = Mock()
+        mock_preprocessing.prepare.return_value = ["data:image/jpeg;base64,c21hbGw="]
+        processor = self._prepare_processor(fake_model, preprocessing=mock_preprocessing)
+        input_image = Image(id="image1", data="/image1.jpg")
+        result = processor.process(images=[input_image])
+        self.assertEqual(len(result.error_results), 1)
+        self.assertEqual(result.error_results[0].input_image, input_image)
+
+    @staticmethod
+    def _make_packed_response(products: dict[int, Product]) -> str:
+        packed_products = [product.model_dump() | {"image_index": index} for index, product in products.items()]
+        return json.dumps({"products": packed_products})
+
+    def test_process_packed_images(self):
+        mock_products = [
+            Product(name="Banana", price=3.45, qty=1, qty_unit="kg", category="fruit"),
+            Product(name="Milk", price=4.45, qty=1000, qty_unit="ml", category="milk"),
+            Product(name="Bread", price=1.25, qty=1, qty_unit="pcs", category="bakery"),
+        ]
+        fake_model = self._prepare_fake_model_with_responses(
+            [
+                self._make_packed_response({2: mock_products[1], 1: mock_products[0]}),
+                "{wat",
+                mock_products[2].model_dump_json(),
+            ]
+        )
+        processor = self._prepare_processor(fake_model, images_per_request=2)
+        input_images = [Image(id=f"image{index}", data=f"/image{index}.jpg") for index in range(1, 4)]
+        result = processor.process(images=input_images)
+        want_result = ProcessingResult(
+            results=[
+                PerImageProcessingResult(input_image=input_image, output=mock_product)
+                for input_image, mock_product in zip(input_images, mock_products)
+            ]
+        )
+        self._assert_result(result, want_result)
+        self.assertEqual(fake_model.i, 0)
+
+    def test_process_packed_images_retries_only_missing_images(self):
+        mock_product = Product(name="Banana", price=3.45, qty=1, qty_unit="kg", category="fruit")
+        fake_model = self._prepare_fake_model_with_responses(
+            [self._make_packed_response({1: mock_product, 3: mock_product}), "{wat"]
+        )
+        processor = self._prepare_processor(fake_model, images_per_request=2)
+        input_images = [Image(id="image1", data="/image1.jpg"), Image(id="image2", data="/image2.jpg")]
+        result = processor.process(images=input_images)
+        want_result = ProcessingResult(
+            results=[
+                PerImageProcessingResult(
+                    input_image=input_images[1],
+                    output=ProcessingError(
+                        "Failed during parsing of extracted data from image", "OutputParserException"
+                    ),
+                ),
+                PerImageProcessingResult(input_image=input_images[0], output=mock_product),
+            ]
+        )
+        self._assert_result(result, want_result)
+
+    def test_packed_prompt_contains_numbered_images(self):
+        model = self._prepare_fake_model_with_responses([])
+        processor = self._prepare_processor(model, images_per_request=2)
+        input_data = processor._make_packed_input_data(
+            [{"image": "data:image/jpeg;base64,MQ=="}, {"image": "data:image/jpeg;base64,Mg=="}]
+        )
+        messages = processor._make_packed_chain(model).first.invoke(input_data).to_messages()
+        self.assertEqual(len(messages), 2)
+        self.assertIn("'food', 'drinks', 'other'", messages[0].content)
+        self.assertEqual(
+            messages[1].content,
+            [
+                {"type": "text", "text": "Image 1:"},
+                {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64,MQ=="}},
+                {"type": "text", "text": "Image 2:"},
+                {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64,Mg=="}},
+            ],
+        )
+
+    def test_chain_is_compiled_once_per_model(self):
+        model = self._prepare_fake_model_with_responses([])
+        other_model = self._prepare_fake_model_with_responses([])
+        processor = self._prepare_processor(model)
+        with patch.object(processor, "_compile_chain", wraps=processor._compile_chain) as mock_compile_chain:
+            processor._make_chain(model, _PriceTagProcessingResult([]))
+            processor._make_chain(model, _PriceTagProcessingResult([]))
+            processor._make_chain(other_model, _PriceTagProcessingResult([]))
+        self.assertEqual(mock_compile_chain.call_count, 2)
+
+    def test_compiled_prompt_needs_only_image(self):
+        model = self._prepare_fake_model_with_responses([])
+        processor = self._prepare_processor(model, categories=["fruit"])
+        input_data = processor._make_input_data(Image(id="image1", data="/image1.jpg"), "data:image/jpeg;base64,MQ==")
+        self.assertEqual(input_data, {"image": "data:image/jpeg;base64,MQ==", "image_id": "image1"})
+        messages = processor._compile_chain(model).first.invoke(input_data).to_messages()
+        self.assertIn("'fruit'", messages[0].content)
+        self.assertIn(processor._parser_format_instructions, messages[0].content)
+
+    def test_process_structured_output(self):
+        mock_product = Product(name="Banana", price=3.45, qty=1, qty_unit="kg", barcode="123", category="fruit")
+        prompts = []
+        model = Mock()
+        model.with_structured_output.return_value = RunnableLambda(
+            lambda prompt: prompts.append(prompt) or mock_product
+        )
+        processor = self._prepare_processor(model, structured_output=True)
+        input_image = Image(id="image1", data="/image1.jpg")
+
+        result = processor.process(images=[input_image])
+
+        want_result = ProcessingResult(results=[PerImageProcessingResult(input_image=input_image, output=mock_product)])
+        self._assert_result(result, want_result)
+        model.with_structured_output.assert_called_once_with(Product)
+        system_message = prompts[0].to_messages()[0].content
+        self.assertIn("'food', 'drinks', 'other'", system_message)
+        self.assertNotIn("JSON schema", system_message)
+
+    def test_process_known_barcode_reads_only_price(self):
+        known_product = Product(name="Milk", price=1.2, qty=1, qty_unit="l", barcode="45678", category="drinks")
+        new_product = Product(name="Banana", price=3.45, qty=1, qty_unit="kg", barcode="", category="fruit")
+        fake_model = self._prepare_fake_model_with_responses(['{"price": 1.5}', new_product.model_dump_json()])
+        catalog = Mock()
+        catalog.get.side_effect = lambda barcode: known_product if barcode == "45678" else None
+        processor = self._prepare_processor(fake_model, catalog=catalog)
+        processor._barcode_reader.read_barcodes.side_effect = lambda image: (
+            [DecodedBarcode("45678", 0.5, 0.5)] if image.data == "/image1.jpg" else []
+        )
+        input_images = [Image(id="image1", data="/image1.jpg"), Image(id="image2", data="/image2.jpg")]
+
+        with patch.object(processor, "_compile_chain", wraps=processor._compile_chain) as mock_compile_chain:
+            result = processor.process(images=input_images)
+
+        want_result = ProcessingResult(
+            results=[
+                PerImageProcessingResult(
+                    input_image=input_images[0],
+                    output=known_product.model_copy(update={"price": 1.5}),
+                    is_barcode_checked=True,
+                ),
+                PerImageProcessingResult(input_image=input_images[1], output=new_product),
+            ]
+        )
+        self._assert_result(result, want_result)
+        mock_compile_chain.assert_called_once()
+        catalog.put.assert_called_once_with(known_product.model_copy(update={"price": 1.5}))
+
+    def test_process_invalid_price_response(self):
+        known_product = Product(name="Milk", price=1.2, qty=1, qty_unit="l", barcode="45678", category="drinks")
+        catalog = Mock()
+        catalog.get.return_value = known_product
+        processor = self._prepare_processor(self._prepare_fake_model_with_responses(['{"price": 0}']), catalog=catalog)
+        processor._barcode_reader.read_barcodes.return_value = [DecodedBarcode("45678", 0.5, 0.5)]
+        input_image = Image(id="image1", data="/image1.jpg")
+
+        result = processor.process(images=[input_image])
+
+        self.assertEqual(result.product_results, [])
+        self.assertEqual(result.error_results[0].input_image, input_image)
+        self.assertEqual(result.error_results[0].output.msg, "Failed during parsing of extracted data from image")
+
+    def test_price_prompt_contains_product_name(self):
+        model = self._prepare_fake_model_with_responses([])
+        processor = self._prepare_processor(model)
+        input_data = {"image": "data:image/jpeg;base64,MQ==", "image_id": "image1", "product_name": "Milk"}
+        messages = processor._compile_price_chain(model).first.invoke(input_data).to_messages()
+        self.assertEqual(messages[1].content[0], {"type": "text", "text": "Milk"})
+        self.assertIn("price", messages[0].content)
+
+    def test_process_reads_barcodes_before_model_call(self):
+        mock_product = Product(name="Banana", price=3.45, qty=1, qty_unit="kg", barcode="123", category="fruit")
+        fake_model = self._prepare_fake_model_with_responses([mock_product.model_dump_json()])
+        mock_executor = Mock()
+        barcode = Future()
+        barcode.set_result([DecodedBarcode("45678", 0.5, 0.5)])
+        mock_executor.submit.return_value = barcode
+        processor = self._prepare_processor(fake_model, barcode_executor=mock_executor)
+        input_image = Image(id="image1", data="/image1.jpg")
+        make_chain = processor._make_chain
+
+        def make_chain_after_barcodes_started(*args):
+            mock_executor.submit.assert_called_once_with(processor._barcode_reader.read_barcodes, input_image)
+            return make_chain(*args)
+
+        with patch.object(processor, "_make_chain", side_effect=make_chain_after_barcodes_started):
+            result = processor.process(images=[input_image])
+        want_product = mock_product.model_copy(update={"barcode": "45678"})
+        want_result = ProcessingResult(
+            results=[PerImageProcessingResult(input_image=input_image, output=want_product, is_barcode_checked=True)]
+        )
+        self._assert_result(result, want_result)
+
+    def test_process_error_cancels_barcode_reading(self):
+        fake_model = Mock()
+        fake_model.side_effect = FakeListChatModelError()
+        mock_executor = Mock()
+        barcode = Future()
+        mock_executor.submit.return_value = barcode
+        processor = self._prepare_processor(fake_model, barcode_executor=mock_executor)
+        result = processor.process(images=[Image(id="image1", data="/image1.jpg")])
+        self.assertEqual(len(result.error_results), 1)
+        self.assertTrue(barcode.cancelled())
+
     @staticmethod
     def _prepare_fake_model_with_responses(responses: list[str]):
         return FakeMessagesListChatModel(
@@ -219,70 +576,213 @@ class TestPriceTagImageProcessor(TestCase):
         )
 
     @staticmethod
-    def _prepare_processor(model: BaseChatModel) -> PriceTagImageProcessor:
+    def _prepare_processor(model: BaseChatModel, **kwargs) -> PriceTagImageProcessor:
         model_factory = MagicMock()
         model_factory.get_model.return_value = model
-        processor = PriceTagImageProcessor(model_factory, max_concurrency=1)
+        processor = PriceTagImageProcessor(model_factory, max_concurrency=1, **kwargs)
         processor._barcode_reader = Mock()
-        processor._barcode_reader.read_barcode.return_value = None
+        processor._barcode_reader.read_barcodes.return_value = []
+        return processor
+
+
+class TestPriceTagImageProcessorAsync(IsolatedAsyncioTestCase):
+    _assert_result = TestPriceTagImageProcessor._assert_result
+    _prepare_fake_model_with_responses = staticmethod(TestPriceTagImageProcessor._prepare_fake_model_with_responses)
+    _prepare_processor = staticmethod(TestPriceTagImageProcessor._prepare_processor)
+    _make_packed_response = staticmethod(TestPriceTagImageProcessor._make_packed_response)
+
+    async def test_aprocess_packed_images(self):
+        mock_products = [
+            Product(name="Banana", price=3.45, qty=1, qty_unit="kg", category="fruit"),
+            Product(name="Milk", price=4.45, qty=1000, qty_unit="ml", category="milk"),
+        ]
+        fake_model = self._prepare_fake_model_with_responses(
+            [self._make_packed_response({1: mock_products[0]}), mock_products[1].model_dump_json()]
+        )
+        processor = self._prepare_processor(fake_model, images_per_request=2)
+        input_images = [Image(id="image1", data="/image1.jpg"), Image(id="image2", data="/image2.jpg")]
+        result = await processor.aprocess(images=input_images)
+        want_result = ProcessingResult(
+            results=[
+                PerImageProcessingResult(input_image=input_image, output=mock_product)
+                for input_image, mock_product in zip(input_images, mock_products)
+            ]
+        )
+        self._assert_result(result, want_result)
+
+    async def test_aprocess_success_adjust_barcode(self):
+        mock_products = [
+            Product(name="Banana", price=3.45, qty=1, qty_unit="kg", barcode="123", category="fruit"),
+            Product(name="Milk", price=4.45, qty=1000, qty_unit="ml", barcode="567", category="milk"),
+        ]
+        fake_model = self._prepare_fake_model_with_responses([product.model_dump_json() for product in mock_products])
+        processor = self._prepare_processor(fake_model)
+        processor._barcode_reader.read_barcodes.side_effect = lambda image: (
+            [DecodedBarcode("45678", 0.5, 0.5)] if image.data == "/image1.jpg" else []
+        )
+        input_images = [Image(id="image1", data="/image1.jpg"), Image(id="image2", data="/image2.jpg")]
+        result = await processor.aprocess(images=input_images)
+        want_products = [mock_products[0].model_copy(update={"barcode": "45678"}), mock_products[1]]
+        want_result = ProcessingResult(
+            results=[
+                PerImageProcessingResult(input_image=input_images[0], output=want_products[0], is_barcode_checked=True),
+                PerImageProcessingResult(input_image=input_images[1], output=want_products[1]),
+            ]
+        )
+        self._assert_result(result, want_result)
+
+    async def test_aprocess_known_barcode_reads_only_price(self):
+        known_product = Product(name="Milk", price=1.2, qty=1, qty_unit="l", barcode="45678", category="drinks")
+        catalog = Mock()
+        catalog.get.return_value = known_product
+        processor = self._prepare_processor(
+            self._prepare_fake_model_with_responses(['{"price": 1.5}']), catalog=catalog
+        )
+        processor._barcode_reader.read_barcodes.return_value = [DecodedBarcode("45678", 0.5, 0.5)]
+        input_image = Image(id="image1", data="/image1.jpg")
+
+        result = await processor.aprocess(images=[input_image])
+
+        want_product = known_product.model_copy(update={"price": 1.5})
+        want_result = ProcessingResult(
+            results=[PerImageProcessingResult(input_image=input_image, output=want_product, is_barcode_checked=True)]
+        )
+        self._assert_result(result, want_result)
+        catalog.get.assert_called_once_with("45678")
+
+    async def test_aprocess_invalid_response_json_from_model(self):
+        fake_model = self._prepare_fake_model_with_responses(["{wat"])
+        processor = self._prepare_processor(fake_model)
+        input_image = Image(id="image1", data="/image1.jpg")
+        result = await processor.aprocess(images=[input_image])
+        want_result = ProcessingResult(
+            results=[
+                PerImageProcessingResult(
+                    input_image=input_image,
+                    output=ProcessingError(
+                        "Failed during parsing of extracted data from image", "OutputParserException"
+                    ),
+                ),
+            ]
+        )
+        self._assert_result(result, want_result)
+
+
+class TestShelfImageProcessor(TestCase):
+    def setUp(self):
+        self._left = ShelfProduct(
+            name="Milk",
+            qty=1,
+            qty_unit="l",
+            price=1.2,
+            category="drinks",
+            region=ProductRegion(x_min=0, y_min=0.5, x_max=0.5, y_max=1),
+        )
+        self._right = ShelfProduct(
+            name="Tea",
+            qty=20,
+            qty_unit="pcs",
+            price=2.5,
+            barcode="111",
+            category="drinks",
+            region=ProductRegion(x_min=0.5, y_min=0.5, x_max=1, y_max=1),
+        )
+
+    def test_process_all_products_with_barcodes_by_region(self):
+        response = json.dumps({"products": [self._left.model_dump(), self._right.model_dump()]})
+        processor = self._prepare_processor(
+            response, [DecodedBarcode("222", 0.8, 0.7), DecodedBarcode("333", 0.2, 0.1)]
+        )
+        input_image = Image(id="shelf", data="/shelf.jpg")
+
+        result = processor.process([input_image])
+
+        want_result = ProcessingResult(
+            results=[
+                PerImageProcessingResult(input_image=input_image, output=self._left),
+                PerImageProcessingResult(
+                    input_image=input_image,
+                    output=self._right.model_copy(update={"barcode": "222"}),
+                    is_barcode_checked=True,
+                ),
+            ]
+        )
+        TestPriceTagImageProcessor._assert_result(self, result, want_result)
+        processor._barcode_reader.read_barcodes.assert_called_once_with(input_image)
+
+    def test_process_no_products_found(self):
+        processor = self._prepare_processor(json.dumps({"products": []}), [])
+        result = processor.process([Image(id="shelf", data="/shelf.jpg")])
+        self.assertEqual(result.product_results, [])
+        self.assertEqual(result.error_results[0].output.msg, "No price tags found in the image")
+
+    @staticmethod
+    def _prepare_processor(response: str, barcodes: list[DecodedBarcode]) -> ShelfImageProcessor:
+        model_factory = MagicMock()
+        model_factory.get_model.return_value = FakeMessagesListChatModel(
+            responses=[BaseMessage(content=response, type="str")]
+        )
+        processor = ShelfImageProcessor(model_factory, max_concurrency=1)
+        processor._barcode_reader = Mock()
+        processor._barcode_reader.read_barcodes.return_value = barcodes
         return processor
 
 
 class TestBarcodeReader(TestCase):
+    def setUp(self):
+        self._image = Image(id="image", data="/path/to/image.png")
+        self._grayscale = np.zeros((100, 100), dtype=np.uint8)
 
-    @patch("product_harvester.processors.decode")
-    @patch("product_harvester.processors.cv2.imdecode")
-    @patch("product_harvester.processors.base64.b64decode", return_value=b"test_data")
-    def test_read_barcode_from_base64(self, mock_bas64_decode, mock_imdecode, mock_decode):
-        mock_imdecode.return_value = np.zeros((100, 100, 3), dtype=np.uint8)
-        mock_barcode = MagicMock()
-        mock_barcode.data.decode.return_value = "123456"
-        mock_decode.return_value = [mock_barcode]
-        barcode = _BarcodeReader().read_barcode("data:image/png;base64,test_base64_image")
-        self.assertEqual(barcode, "123456")
-        mock_bas64_decode.assert_called_once_with("test_base64_image")
-        mock_imdecode.assert_called_once()
-        mock_decode.assert_called_once()
-
-    @patch("product_harvester.processors.decode")
-    @patch("product_harvester.processors.cv2.imdecode")
-    @patch("product_harvester.processors.requests.get")
-    def test_read_barcode_from_url(self, mock_requests_get, mock_imdecode, mock_decode):
-        mock_response = MagicMock()
-        mock_response.content = b"test_data"
-        mock_requests_get.return_value = mock_response
-        mock_imdecode.return_value = np.zeros((100, 100, 3), dtype=np.uint8)
-        mock_barcode = MagicMock()
-        mock_barcode.data.decode.return_value = "789012"
-        mock_decode.return_value = [mock_barcode]
-        barcode = _BarcodeReader().read_barcode("https://example.com/image.png")
-        self.assertEqual(barcode, "789012")
-        mock_requests_get.assert_called_once_with("https://example.com/image.png")
-        mock_imdecode.assert_called_once()
-        mock_decode.assert_called_once()
+    @patch("product_harvester.barcodes.decode")
+    def test_read_barcode(self, mock_decode):
+        mock_barcodes = [MagicMock(), MagicMock()]
+        for mock_barcode, value in zip(mock_barcodes, ["654321", "asddf123"]):
+            mock_barcode.data.decode.return_value = value
+            mock_barcode.rect = MagicMock(left=0, top=0, width=10, height=10)
+        mock_decode.return_value = mock_barcodes
+        with patch.object(Image, "load_array", return_value=self._grayscale) as mock_load_array:
+            barcode = _BarcodeReader().read_barcode(self._image)
+        self.assertEqual(barcode, "654321")
+        mock_load_array.assert_called_once_with(grayscale=True)
+        mock_decode.assert_called_once_with(self._grayscale)
+
+    @patch("product_harvester.barcodes.decode", return_value=[])
+    def test_read_barcode_empty(self, mock_decode):
+        with patch.object(Image, "load_array", return_value=self._grayscale):
+            barcode = _BarcodeReader().read_barcode(self._image)
+        self.assertIsNone(barcode)
+        mock_decode.assert_called_once_with(self._grayscale)
+
+    def test_read_barcodes_with_decoder(self):
+        decoder = Mock()
+        decoder.decode.return_value = [DecodedBarcode("654321", 0.1, 0.55), DecodedBarcode("123", 0.5, 0.5)]
+        with patch.object(Image, "load_array", return_value=self._grayscale):
+            reader = _BarcodeReader(decoder)
+            self.assertEqual(reader.read_barcodes(self._image), decoder.decode.return_value)
+            self.assertEqual(reader.read_barcode(self._image), "654321")
+        decoder.decode.assert_called_with(self._grayscale)
+
+    def test_read_barcodes_uses_cache(self):
+        decoder = Mock()
+        decoder.decode.return_value = []
+        reader = _BarcodeReader(decoder, LRUBarcodeCache())
+        with patch.object(Image, "load_array", return_value=self._grayscale) as mock_load_array:
+            self.assertEqual(reader.read_barcodes(Image(id="image1", data="data:image/png;base64,MQ==")), [])
+            self.assertIsNone(reader.read_barcode(Image(id="image2", data="data:image/png;base64,MQ==")))
+        decoder.decode.assert_called_once()
+        mock_load_array.assert_called_once()
 
-    @patch("product_harvester.processors.decode")
-    @patch("product_harvester.processors.cv2.imdecode")
+    def test_pickled_reader_has_no_cache(self):
+        reader = pickle.loads(pickle.dumps(_BarcodeReader(PyzbarBarcodeDecoder(), LRUBarcodeCache())))
+        self.assertIsInstance(reader._cache, NoBarcodeCache)
+
+    @patch("product_harvester.barcodes.decode", return_value=[])
+    @patch("product_harvester.image.cv2.imdecode")
     @patch("builtins.open", new_callable=mock_open, read_data=b"fake_image_bytes")
-    def test_read_barcode_from_file(self, _mock_open, mock_imdecode, mock_decode):
+    def test_read_barcode_reuses_decoded_image(self, _mock_open, mock_imdecode, _mock_decode):
         mock_imdecode.return_value = np.zeros((100, 100, 3), dtype=np.uint8)
-        mock_barcode = MagicMock()
-        mock_barcode.data.decode.return_value = "654321"
-        mock_decode.return_value = [mock_barcode, "asddf123"]
-        barcode = _BarcodeReader().read_barcode("/path/to/image.png")
-        self.assertEqual(barcode, "654321")
+        self._image.load_array()
+        _BarcodeReader().read_barcode(self._image)
+        _BarcodeReader().read_barcode(self._image)
         _mock_open.assert_called_once_with("/path/to/image.png", "rb")
         mock_imdecode.assert_called_once()
-        mock_decode.assert_called_once()
-
-    @patch("product_harvester.processors.decode")
-    @patch("product_harvester.processors.cv2.imdecode")
-    @patch("product_harvester.processors.base64.b64decode", return_value=b"test_data")
-    def test_read_barcode_empty(self, mock_bas64_decode, mock_imdecode, mock_decode):
-        mock_imdecode.return_value = np.zeros((100, 100, 3), dtype=np.uint8)
-        mock_decode.return_value = []
-        barcode = _BarcodeReader().read_barcode("data:image/png;base64,test_base64_image")
-        self.assertIsNone(barcode)
-        mock_bas64_decode.assert_called_once_with("test_base64_image")
-        mock_imdecode.assert_called_once()
-        mock_decode.assert_called_once()
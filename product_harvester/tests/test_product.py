@@ -2,7 +2,7 @@ from unittest import TestCase
 
 from pydantic import ValidationError
 
-from product_harvester.product import Product
+from product_harvester.product import Product, ProductRegion
 
 
 class TestProduct(TestCase):
@@ -81,3 +81,16 @@ class TestProduct(TestCase):
             Product.model_validate_json(
                 '{"name":"Banana", "qty":10, "qty_unit":"kg", "price":10, "barcode":"123", "category":""}'
             )
+
+
+class TestProductRegion(TestCase):
+    def test_contains(self):
+        region = ProductRegion(x_min=0.1, y_min=0.2, x_max=0.5, y_max=0.6)
+        self.assertTrue(region.contains(0.3, 0.4))
+        self.assertTrue(region.contains(0.1, 0.6))
+        self.assertFalse(region.contains(0.6, 0.4))
+        self.assertFalse(region.contains(0.3, 0.1))
+
+    def test_out_of_image(self):
+        with self.assertRaises(ValidationError):
+            ProductRegion(x_min=-0.1, y_min=0, x_max=0.5, y_max=1.2)
@@ -0,0 +1,86 @@
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import AsyncMock, Mock
+
+import cv2
+import numpy as np
+
+from product_harvester.image import Image
+from product_harvester.processors import PerImageProcessingResult, ProcessingResult
+from product_harvester.product import Product
+from product_harvester.quality import BlurCheck, ExposureCheck, QualityFilteringImageProcessor, ResolutionCheck
+from product_harvester.tests.helpers import make_image
+
+
+def _make_sharp_pattern(height: int = 300, width: int = 400) -> np.ndarray:
+    pattern = np.full((height, width), 230, dtype=np.uint8)
+    for x in range(10, width - 10, 20):
+        cv2.rectangle(pattern, (x, 30), (x + 8, height - 30), 20, -1)
+    return pattern
+
+
+class TestQualityChecks(TestCase):
+    def test_resolution(self):
+        self.assertIsNone(ResolutionCheck(min_short_edge=200).check(_make_sharp_pattern()))
+        error = ResolutionCheck(min_short_edge=200).check(_make_sharp_pattern(height=100))
+        self.assertEqual(error.msg, "Image resolution is too low")
+        self.assertEqual(error.detailed_msg, "400x100 is below 200 px on the short edge")
+
+    def test_exposure(self):
+        self.assertIsNone(ExposureCheck().check(_make_sharp_pattern()))
+        self.assertEqual(ExposureCheck().check(np.zeros((300, 400), dtype=np.uint8)).msg, "Image is too dark")
+        self.assertEqual(ExposureCheck().check(np.full((300, 400), 250, dtype=np.uint8)).msg, "Image is too bright")
+        self.assertEqual(ExposureCheck().check(np.full((300, 400), 128, dtype=np.uint8)).msg, "Image is blank")
+
+    def test_blur(self):
+        pattern = _make_sharp_pattern()
+        self.assertIsNone(BlurCheck().check(pattern))
+        self.assertEqual(BlurCheck().check(cv2.GaussianBlur(pattern, (31, 31), 0)).msg, "Image is too blurry")
+
+    def test_blur_does_not_depend_on_resolution(self):
+        pattern = cv2.GaussianBlur(_make_sharp_pattern(), (31, 31), 0)
+        upscaled = cv2.resize(pattern, (1600, 1200), interpolation=cv2.INTER_CUBIC)
+        self.assertIsNotNone(BlurCheck().check(upscaled))
+
+
+class TestQualityFilteringImageProcessor(TestCase):
+    def setUp(self):
+        self._mock_processor = Mock()
+        self._product = Product(name="Milk", qty=1, qty_unit="l", price=1.2, category="drinks")
+        self._good_image = make_image("good", _make_sharp_pattern())
+        self._dark_image = make_image("dark", np.zeros((300, 400), dtype=np.uint8))
+
+    def test_rejected_images_are_not_processed(self):
+        self._mock_processor.process.return_value = ProcessingResult(
+            [PerImageProcessingResult(input_image=self._good_image, output=self._product)]
+        )
+
+        result = QualityFilteringImageProcessor(self._mock_processor).process([self._dark_image, self._good_image])
+
+        self._mock_processor.process.assert_called_once_with([self._good_image])
+        self.assertEqual(result.product_results[0].input_image, self._good_image)
+        self.assertEqual(result.error_results[0].input_image, self._dark_image)
+        self.assertEqual(result.error_results[0].output.msg, "Image is too dark")
+
+    def test_all_rejected(self):
+        result = QualityFilteringImageProcessor(self._mock_processor).process([self._dark_image])
+        self._mock_processor.process.assert_not_called()
+        self.assertEqual(len(result.error_results), 1)
+
+    def test_undecodable_images_are_passed_on(self):
+        broken_image = Image(id="broken", data="data:image/png;base64,d2F0")
+        self._mock_processor.process.return_value = ProcessingResult([])
+        QualityFilteringImageProcessor(self._mock_processor).process([broken_image])
+        self._mock_processor.process.assert_called_once_with([broken_image])
+
+
+class TestQualityFilteringImageProcessorAsync(IsolatedAsyncioTestCase):
+    async def test_aprocess(self):
+        mock_processor = Mock()
+        mock_processor.aprocess = AsyncMock(return_value=ProcessingResult([]))
+        good_image = make_image("good", _make_sharp_pattern())
+        small_image = make_image("small", _make_sharp_pattern(height=100))
+
+        result = await QualityFilteringImageProcessor(mock_processor).aprocess([good_image, small_image])
+
+        mock_processor.aprocess.assert_awaited_once_with([good_image])
+        self.assertEqual(result.error_results[0].output.msg, "Image resolution is too low")
@@ -0,0 +1,56 @@
+import tempfile
+from pathlib import Path
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch
+
+from product_harvester.rate_limiters import SQLiteRateLimiter
+
+
+class TestSQLiteRateLimiter(TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._db_path = str(Path(self._temp_dir.name) / "rate_limits.sqlite")
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    @patch("product_harvester.rate_limiters.time.time", return_value=1000.0)
+    def test_bucket_starts_full(self, _mock_time):
+        limiter = SQLiteRateLimiter(self._db_path, "gemini", requests_per_second=1, max_bucket_size=2)
+        self.assertEqual([limiter.acquire(blocking=False) for _ in range(3)], [True, True, False])
+
+    @patch("product_harvester.rate_limiters.time.time")
+    def test_bucket_refills_over_time(self, mock_time):
+        limiter = SQLiteRateLimiter(self._db_path, "gemini", requests_per_second=0.5)
+        mock_time.return_value = 1000.0
+        self.assertTrue(limiter.acquire(blocking=False))
+        mock_time.return_value = 1001.0
+        self.assertFalse(limiter.acquire(blocking=False))
+        mock_time.return_value = 1003.0
+        self.assertTrue(limiter.acquire(blocking=False))
+
+    @patch("product_harvester.rate_limiters.time.time", return_value=1000.0)
+    def test_limiters_with_same_key_share_bucket(self, _mock_time):
+        first = SQLiteRateLimiter(self._db_path, "gemini", requests_per_second=1)
+        second = SQLiteRateLimiter(self._db_path, "gemini", requests_per_second=1)
+        other = SQLiteRateLimiter(self._db_path, "gemma", requests_per_second=1)
+        self.assertTrue(first.acquire(blocking=False))
+        self.assertFalse(second.acquire(blocking=False))
+        self.assertTrue(other.acquire(blocking=False))
+
+    @patch("product_harvester.rate_limiters.time.sleep")
+    @patch("product_harvester.rate_limiters.time.time", side_effect=[1000.0, 1000.5, 1001.0])
+    def test_blocking_acquire_waits_for_token(self, _mock_time, mock_sleep):
+        limiter = SQLiteRateLimiter(self._db_path, "gemini", requests_per_second=1, check_every_n_seconds=0.5)
+        self.assertTrue(limiter.acquire())
+        self.assertTrue(limiter.acquire())
+        mock_sleep.assert_called_once_with(0.5)
+
+
+class TestSQLiteRateLimiterAsync(IsolatedAsyncioTestCase):
+    async def test_aacquire(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            limiter = SQLiteRateLimiter(str(Path(temp_dir) / "rate_limits.sqlite"), "gemini", requests_per_second=1)
+            with patch("product_harvester.rate_limiters.time.time", return_value=1000.0):
+                self.assertTrue(await limiter.aacquire(blocking=False))
+                self.assertFalse(await limiter.aacquire(blocking=False))
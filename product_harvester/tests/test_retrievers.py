@@ -1,10 +1,11 @@
-from unittest import TestCase
+from unittest import IsolatedAsyncioTestCase, TestCase
 from unittest.mock import patch, call
 
 from product_harvester.clients.google_drive_client import GoogleDriveFileInfo
 from product_harvester.image import Image
 from product_harvester.retrievers import (
     ImagesRetriever,
+    _iterate_in_thread,
     LocalImagesRetriever,
     GoogleDriveImagesRetriever,
 )
@@ -96,12 +97,15 @@ class TestGoogleDriveImagesRetriever(TestCase):
             GoogleDriveFileInfo(id="file_id_2", name="two", mime_type="image/jpeg"),
         ]
         mock_client.get_image_files_info.return_value = iter(test_files)
-        mock_client.download_file_content.side_effect = ["/some/binary", "/another/binary"]
+        mock_client.download_file_content.side_effect = [b"some_binary", b"another_binary"]
         retriever = GoogleDriveImagesRetriever.from_client_config(self._test_client_config, self._test_folder_id)
         mocked_client.assert_called_once_with(self._test_client_config)
         self.assertEqual(
             list(retriever.retrieve_images()),
-            [Image(id="file_id_1", data="/some/binary"), Image(id="file_id_2", data="/another/binary")],
+            [
+                Image.from_bytes("file_id_1", b"some_binary", "image/png"),
+                Image.from_bytes("file_id_2", b"another_binary", "image/jpeg"),
+            ],
         )
         mock_client.get_image_files_info.assert_called_once_with(self._test_folder_id)
         mock_client.download_file_content.assert_has_calls([call(test_file) for test_file in test_files])
@@ -111,11 +115,13 @@ class TestGoogleDriveImagesRetriever(TestCase):
         mock_client = mocked_client.return_value
         test_file = GoogleDriveFileInfo(id="file_id_1", name="one", mime_type="image/png")
         mock_client.get_image_files_info.return_value = iter([test_file])
-        mock_client.download_file_content.side_effect = ["/some/binary"]
+        mock_client.download_file_content.side_effect = [b"some_binary"]
         retriever = GoogleDriveImagesRetriever.from_client_config(self._test_client_config, self._test_folder_id)
         mocked_client.assert_called_once_with(self._test_client_config)
         retriever.set_folder("other_folder")
-        self.assertEqual(list(retriever.retrieve_images()), [Image(id="file_id_1", data="/some/binary")])
+        self.assertEqual(
+            list(retriever.retrieve_images()), [Image.from_bytes("file_id_1", b"some_binary", "image/png")]
+        )
         mock_client.get_image_files_info.assert_called_once_with("other_folder")
         mock_client.download_file_content.assert_called_once_with(test_file)
 
@@ -131,3 +137,27 @@ class TestGoogleDriveImagesRetriever(TestCase):
             list(retriever.retrieve_images())
         mock_client.get_image_files_info.assert_called_once_with(self._test_folder_id)
         mock_client.download_file_content.assert_called_once_with(test_file)
+
+
+class TestIterateInThread(IsolatedAsyncioTestCase):
+    async def test_iterates_all_items(self):
+        items = [item async for item in _iterate_in_thread(iter([1, None, 3]))]
+        self.assertEqual(items, [1, None, 3])
+
+    async def test_propagates_error(self):
+        def failing_generator():
+            yield 1
+            raise ValueError("Some error")
+
+        items = []
+        with self.assertRaisesRegex(ValueError, "Some error"):
+            async for item in _iterate_in_thread(failing_generator()):
+                items.append(item)
+        self.assertEqual(items, [1])
+
+    @patch("product_harvester.retrievers.glob", return_value=["folder/img1.jpg", "folder/note.txt"])
+    async def test_default_aretrieve_images(self, mock_glob):
+        retriever = LocalImagesRetriever("folder")
+        images = [image async for image in retriever.aretrieve_images()]
+        mock_glob.assert_called_once_with("folder/*")
+        self.assertEqual(images, [Image(id="folder/img1.jpg", data="folder/img1.jpg")])
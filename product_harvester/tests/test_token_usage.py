@@ -0,0 +1,74 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage
+
+from product_harvester.image import Image
+from product_harvester.product import Product
+from product_harvester.token_usage import TokenUsage, TokenUsageTracker, compare_extraction_modes, format_token_report
+
+
+def _make_response(content: str, input_tokens: int) -> AIMessage:
+    usage_metadata = {"input_tokens": input_tokens, "output_tokens": 20, "total_tokens": input_tokens + 20}
+    return AIMessage(content=content, usage_metadata=usage_metadata)
+
+
+class TestTokenUsageTracker(TestCase):
+    def test_sums_usage_of_model_calls(self):
+        tracker = TokenUsageTracker()
+        model = FakeMessagesListChatModel(responses=[_make_response("a", 100), _make_response("b", 50)])
+        model.batch(["first", "second"], config={"callbacks": [tracker]})
+        self.assertEqual(tracker.usage, TokenUsage(requests=2, input_tokens=150, output_tokens=40))
+        self.assertEqual(tracker.usage.input_tokens_per_request, 75)
+
+    def test_cached_input_tokens(self):
+        tracker = TokenUsageTracker()
+        response = _make_response("a", 1000)
+        response.usage_metadata["input_token_details"] = {"cache_read": 750}
+        FakeMessagesListChatModel(responses=[response]).invoke("first", config={"callbacks": [tracker]})
+        self.assertEqual(tracker.usage.cached_input_tokens, 750)
+        self.assertEqual(tracker.usage.cache_hit_rate, 0.75)
+
+    def test_missing_usage(self):
+        tracker = TokenUsageTracker()
+        FakeMessagesListChatModel(responses=[AIMessage(content="a")]).invoke("first", config={"callbacks": [tracker]})
+        self.assertEqual(tracker.usage, TokenUsage(requests=1))
+        self.assertEqual(tracker.usage.cache_hit_rate, 0)
+
+
+class TestCompareExtractionModes(TestCase):
+    def test_compare(self):
+        product = Product(name="Milk", qty=1, qty_unit="l", price=1.2, category="drinks")
+        packed_response = '{"products": [' + product.model_dump_json()[:-1] + ', "image_index": 1}]}'
+        model_factory = MagicMock()
+        model_factory.get_model.side_effect = [
+            FakeMessagesListChatModel(responses=[_make_response(product.model_dump_json(), 900)]),
+            FakeMessagesListChatModel(responses=[_make_response(packed_response, 1000)]),
+        ]
+
+        report = compare_extraction_modes(
+            model_factory,
+            [Image(id="image1", data="data:image/png;base64,MQ==")],
+            modes={"single": {}, "packed": {"images_per_request": 2}},
+        )
+
+        self.assertEqual(
+            report,
+            {
+                "single": TokenUsage(requests=1, input_tokens=900, output_tokens=20),
+                "packed": TokenUsage(requests=1, input_tokens=1000, output_tokens=20),
+            },
+        )
+
+    def test_format_token_report(self):
+        report = format_token_report(
+            {"structured_output": TokenUsage(requests=2, input_tokens=300, output_tokens=40, cached_input_tokens=150)}
+        )
+        self.assertEqual(
+            report.splitlines(),
+            [
+                "mode               requests  input_tokens  output_tokens  input_tokens/request  cache_hit_rate",
+                "structured_output         2           300             40                 150.0           50.0%",
+            ],
+        )
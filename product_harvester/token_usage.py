@@ -0,0 +1,86 @@
+from threading import Lock
+from typing import Any
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from pydantic import BaseModel
+
+from product_harvester.image import Image
+from product_harvester.model_factory import ModelFactory
+from product_harvester.processors import PriceTagImageProcessor
+
+EXTRACTION_MODES: dict[str, dict[str, Any]] = {
+    "format_instructions": {},
+    "structured_output": {"structured_output": True},
+}
+
+
+class TokenUsage(BaseModel):
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_input_tokens: int = 0
+
+    @property
+    def input_tokens_per_request(self) -> float:
+        return self.input_tokens / self.requests if self.requests else 0.0
+
+    @property
+    def cache_hit_rate(self) -> float:
+        return self.cached_input_tokens / self.input_tokens if self.input_tokens else 0.0
+
+
+class TokenUsageTracker(BaseCallbackHandler):
+    def __init__(self):
+        self._usage = TokenUsage()
+        self._lock = Lock()
+
+    @property
+    def usage(self) -> TokenUsage:
+        with self._lock:
+            return self._usage.model_copy()
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for generations in response.generations:
+            usage_metadata = self._get_usage_metadata(generations)
+            input_token_details = usage_metadata.get("input_token_details") or {}
+            with self._lock:
+                self._usage.requests += 1
+                self._usage.input_tokens += usage_metadata.get("input_tokens", 0)
+                self._usage.output_tokens += usage_metadata.get("output_tokens", 0)
+                self._usage.cached_input_tokens += input_token_details.get("cache_read", 0)
+
+    @staticmethod
+    def _get_usage_metadata(generations: list) -> dict[str, Any]:
+        for generation in generations:
+            usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage_metadata:
+                return usage_metadata
+        return {}
+
+
+def compare_extraction_modes(
+    model_factory: ModelFactory,
+    images: list[Image],
+    categories: list[str] | None = None,
+    modes: dict[str, dict[str, Any]] | None = None,
+) -> dict[str, TokenUsage]:
+    modes = modes if modes is not None else EXTRACTION_MODES
+    report: dict[str, TokenUsage] = {}
+    for mode, processor_kwargs in modes.items():
+        tracker = TokenUsageTracker()
+        processor = PriceTagImageProcessor(model_factory, categories, callbacks=[tracker], **processor_kwargs)
+        processor.process(images)
+        report[mode] = tracker.usage
+    return report
+
+
+def format_token_report(report: dict[str, TokenUsage]) -> str:
+    mode_width = max([len("mode")] + [len(mode) for mode in report])
+    lines = [f"{'mode':<{mode_width}}  requests  input_tokens  output_tokens  input_tokens/request  cache_hit_rate"]
+    for mode, usage in report.items():
+        lines.append(
+            f"{mode:<{mode_width}}  {usage.requests:>8}  {usage.input_tokens:>12}  {usage.output_tokens:>13}"
+            f"  {usage.input_tokens_per_request:>20.1f}  {usage.cache_hit_rate:>14.1%}"
+        )
+    return "\n".join(lines)
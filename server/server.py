@@ -33,7 +33,7 @@ async def process_pricetag(process_request: ProcessRequest) -> ImportedProduct |
     error_collector = ErrorCollector()
     products_collector = ProductsCollector()
     harvester = _prepare_harvester(process_request, products_collector, error_collector)
-    harvester.harvest()
+    await harvester.aharvest()
     _raise_error_if_any(error_collector)
     if not products_collector.products:
         return None